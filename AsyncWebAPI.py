@@ -0,0 +1,36 @@
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from app.configs import load_config
+from app.Logger.log_main import get_logger
+from app.providers.SearchProvider.es_client import close_async_es
+from app.utils.route_loader import load_async_routes
+from WebAPI import create_app
+
+logger = get_logger()
+
+# ASGI app factory: async serving mode
+def create_asgi_app() -> Starlette:
+    """
+    The LLM-bound endpoints (/v1/rag/*, /v1/retrieve) are served natively async
+    (AsyncElasticsearch, AsyncGroq, embedding on a thread pool) so one worker can keep
+    hundreds of requests in flight. Every other route falls through to the regular
+    Flask app, so paths and response shapes are identical in both modes.
+    """
+    cfg = load_config()
+    flask_app = create_app()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await close_async_es()
+
+    routes = load_async_routes("app.async_routes")
+    routes.append(Mount("/", app=WSGIMiddleware(flask_app, workers=cfg.asgi_wsgi_threads)))
+
+    app = Starlette(routes=routes, lifespan=lifespan)
+    app.state.cfg = cfg
+    return app
@@ -1,20 +1,29 @@
+import math
 import time
 import uuid
 from flask import Flask, request, g
+from opentelemetry import context as otel_context, trace
 from flask_restx import Api
 
 from werkzeug.exceptions import NotFound, HTTPException
 
 from app.configs import load_config
-from app.Logger.log_main import get_logger
+from app.Logger.log_main import get_logger, request_body_extra
+from app.providers.SearchProvider import index_versions
 from app.utils.errors import AppError
-from app.providers.SearchProvider.es_client import ESClient
-from app.providers.SearchProvider.index_manager import IndexManager
+from app.utils import metrics, slowlog
+from app.utils.profiling import install_profiling
+from app.utils.tracing import configure_tracing, current_trace_id, tracer
 from app.utils.route_loader import load_routes
+from app.utils.warmup import start_warmup
 
 # configure logger once per process, duplicate handlers
 logger = get_logger()
 
+def _endpoint_label() -> str:
+    # route rule, not the raw path, so ids in URLs don't explode label cardinality
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
 # app factory
 def create_app() -> Flask:
     app = Flask(__name__)
@@ -23,11 +32,11 @@ def create_app() -> Flask:
     # HARD Request Payload Size Limit
     app.config["MAX_CONTENT_LENGTH"] = cfg.max_request_bytes
 
-    #ensure ES index exist at startup
-    es_client = ESClient(cfg.es_url)
-    index_manager = IndexManager(es_client.client, cfg.index_chunks, cfg.embedding_dim, cfg.index_docs)
-    index_manager.ensure_chunks_index()
-    index_manager.ensure_doc_index(cfg.index_docs)
+    metrics.configure(cfg)
+    configure_tracing(cfg)
+
+    # model load, dummy embed and ES index checks (see WARMUP_MODE); /v1/health/ready reports progress
+    start_warmup(cfg)
 
     api = Api(app, version="1.0", title="RAG Orchestration API", doc="/docs", errors={})
 
@@ -41,20 +50,54 @@ def create_app() -> Flask:
     
         # Tenant ( required for tenant-scoped endpoints)
         g.tenant = request.headers.get("X-Tenant-Id", "").strip()
+        metrics.bind_request(_endpoint_label(), g.tenant)
+        index_versions.bind_request()
+
+        # root span for the request; provider calls below become its children
+        g.span = tracer.start_span(f"{request.method} {_endpoint_label()}", attributes={
+            "request_id": g.request_id,
+            "tenant": g.tenant,
+            "http.method": request.method,
+            "http.route": _endpoint_label(),
+        })
+        g.span_token = otel_context.attach(trace.set_span_in_context(g.span))
 
     @app.after_request
     def after_request(resp):
         latency_ms = int((time.time() - g.start_time) * 1000)
+        metrics.observe_request(_endpoint_label(), request.method, resp.status_code, time.time() - g.start_time)
         resp.headers["X-Request-ID"] = g.request_id
+        g.span.set_attribute("http.status_code", resp.status_code)
+        payload = request.get_json(silent=True)
+        slowlog.record_if_slow(
+            cfg, request_id=g.request_id, trace_id=current_trace_id(), endpoint=_endpoint_label(),
+            method=request.method, path=request.path, status_code=resp.status_code, duration_ms=latency_ms,
+            tenant=g.tenant, payload=payload,
+        )
         logger.info("request_complete", extra={
             "request_id": g.request_id,
+            "trace_id": current_trace_id(),
             "method": request.method,
             "path": request.path,
             "status_code": resp.status_code,
             "latency_ms": latency_ms,
+            **request_body_extra(cfg, payload),
         })
         
         return resp
+
+    @app.teardown_request
+    def teardown_request(exc):
+        span = g.pop("span", None)
+        if span is None:
+            return
+        if exc is not None:
+            span.record_exception(exc)
+        span.end()
+        otel_context.detach(g.pop("span_token"))
+
+    # registered after the hooks above so profiles are keyed by g.request_id (PROFILE_MODE=off: no hooks)
+    install_profiling(app, cfg)
     
     @api.errorhandler(NotFound)
     def handle_not_found(err: NotFound):
@@ -73,10 +116,15 @@ def create_app() -> Flask:
     def handle_all_errors(err):
         # If it's your AppError (ValidationError also subclasses AppError)
         if isinstance(err, AppError):
-            return {
+            body = {
                 "request_id": getattr(g, "request_id", None),
                 "error": {"code": err.code, "message": err.message},
-            }, err.http_status
+            }
+            # rate limited: tell the client when to come back
+            retry_after = getattr(err, "retry_after", None)
+            if retry_after is not None:
+                return body, err.http_status, {"Retry-After": str(math.ceil(retry_after))}
+            return body, err.http_status
 
         # If it's a standard HTTPException (like 404, 405)
         if isinstance(err, HTTPException):
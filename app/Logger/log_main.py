@@ -1,34 +1,150 @@
+import atexit
 import json
 import logging
 import logging.handlers
+import os
+import queue
+import random
 import sys
+import threading
 from datetime import datetime,timezone
 
+from app.configs import load_config, parse_kv
+from app.utils.metrics import log_dropped
+
+try:
+    import orjson
+except ImportError:  # optional: json.dumps is ~5x slower per line but produces the same output
+    orjson = None
+
+LOGGER_NAME = "rag_orchestration_api"
+
+# the only `extra` keys a log line may carry: anything else passed as extra (a request body, a
+# payload dump) is dropped here rather than relying on each call site to be careful
+EXTRA_KEYS = ("request_id", "path", "method", "status_code", "latency_ms", "error_code", "provider", "policy",
+              "hedged", "model", "trace_id")
+# request_complete carries the (truncated) request body only with LOG_REQUEST_BODIES=true
+BODY_KEY = "body"
+BODY_MAX_CHARS = 2048
+
+
+def _dumps(payload: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(payload, default=str).decode("utf-8")
+    return json.dumps(payload, ensure_ascii=False, default=str)
+
+
 class JsonFormatter(logging.Formatter):
+    def __init__(self, log_bodies: bool = False):
+        super().__init__()
+        self.keys = EXTRA_KEYS + ((BODY_KEY,) if log_bodies else ())
+
     def format(self, record: logging.LogRecord) -> str:
         payload = {
-            "ts": datetime.now(timezone.utc).isoformat(),
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
             "level": record.levelname,
             "logger": record.name,
             "msg": record.getMessage()
         }
         #attach structure extra if present
-        for key in ("request_id", "path", "method", "status_code", "latency_ms", "error_code"):
+        for key in self.keys:
             if hasattr(record, key):
                 payload[key] = getattr(record, key)
         if record.exc_info:
             payload["exc_info"] = self.formatException(record.exc_info)
-        return json.dumps(payload, ensure_ascii=False)
-    
+        return _dumps(payload)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of records per event name (the log message) or level, from LOG_SAMPLE_RATES
+    ("request_complete=0.1,DEBUG=0.01"): an event rate wins over its level's. Unlisted: all kept.
+    """
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.msg, self.rates.get(record.levelname, 1.0))
+        return rate >= 1.0 or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread as they are: formatting (JSON encoding, tracebacks) and
+    the stdout write both happen there. A full queue drops the record instead of blocking the
+    request thread on a slow stdout (counted in rag_log_dropped_total).
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_dropped(record.levelname)
+
+
+_STATE = {"handler": None, "listener": None, "sink": None}
+_LOCK = threading.Lock()
+
+
+def _start_listener() -> None:
+    q = queue.Queue(maxsize=_STATE["queue_size"])
+    _STATE["handler"].queue = q
+    _STATE["listener"] = logging.handlers.QueueListener(q, _STATE["sink"], respect_handler_level=True)
+    _STATE["listener"].start()
+
+
+def _stop_listener() -> None:
+    # flushes what is still queued; registered with atexit
+    listener = _STATE["listener"]
+    if listener is not None and listener._thread is not None:
+        listener.stop()
+
+
+def _after_fork_in_child() -> None:
+    # the listener thread does not survive fork (gunicorn preload): each worker starts its own on a fresh queue
+    if _STATE["handler"] is not None:
+        _start_listener()
+
+
+def configure_logging(cfg) -> None:
+    """One-time setup of the app logger: level, sampling, queue handler and the stdout listener."""
+    with _LOCK:
+        if _STATE["handler"] is not None:
+            return
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.setLevel(getattr(logging, cfg.log_level.upper(), logging.INFO))
+
+        sink = logging.StreamHandler(sys.stdout)
+        sink.setFormatter(JsonFormatter(cfg.log_request_bodies))
+        handler = DroppingQueueHandler(queue.Queue())
+        # level names in any case ("debug=0.01"); anything else is an event name, matched as written
+        rates = {(k.upper() if isinstance(logging.getLevelName(k.upper()), int) else k): float(v)
+                 for k, v in parse_kv(cfg.log_sample_rates).items()}
+        if rates:
+            handler.addFilter(SamplingFilter(rates))
+
+        logger.handlers.clear()
+        logger.addHandler(handler)
+        logger.propagate = False
+        _STATE.update(handler=handler, sink=sink, queue_size=cfg.log_queue_size)
+        _start_listener()
+        atexit.register(_stop_listener)
+        os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def request_body_extra(cfg, body) -> dict:
+    """`extra` for request_complete: the request body only when LOG_REQUEST_BODIES is on, truncated."""
+    if not cfg.log_request_bodies or body is None:
+        return {}
+    text = body if isinstance(body, str) else _dumps(body)
+    return {BODY_KEY: text[:BODY_MAX_CHARS]}
+
+
 def get_logger() -> logging.Logger:
-    logger = logging.getLogger("rag_orchestration_api")
-    logger.setLevel(logging.INFO)
-    
-    logger.handlers.clear()
-    
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(JsonFormatter())
-    logger.addHandler(handler)
-
-    logger.propagate = False
-    return logger
\ No newline at end of file
+    # modules call this at import: configuration happens on the first call only
+    if _STATE["handler"] is None:
+        configure_logging(load_config())
+    return logging.getLogger(LOGGER_NAME)
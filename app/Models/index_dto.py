@@ -1,7 +1,9 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
+import numpy as np
+
 @dataclass
 class ChunkIndexDTO:
     tenant : str
@@ -11,7 +13,10 @@ class ChunkIndexDTO:
     source : str
     created_at: str
     chunk_text: str
-    embedding: List[float]
+    # float32 array from the embedder, passed through to the ES serialiser as is
+    embedding: np.ndarray
+    # document metadata denormalised per chunk ({meta_<type>: {key: value}}, see metadata_filters)
+    meta: Dict[str, Dict[str, Any]] = field(default_factory=dict)
 
     @staticmethod
     def now_iso() -> str:
@@ -27,4 +32,5 @@ class ChunkIndexDTO:
             "created_at": self.created_at,
             "chunk_text": self.chunk_text,
             "embedding": self.embedding,
+            **self.meta,
         }
\ No newline at end of file
@@ -0,0 +1,160 @@
+import asyncio
+import time
+from starlette.requests import Request
+from starlette.routing import Route
+
+from app.providers.EmbeddingsProvider.embedding_provider import aembed_text, embed_model_of
+from app.providers.SearchProvider.es_client import get_async_es
+from app.providers.SearchProvider.index_layout import IndexLayout
+from app.providers.SearchProvider.similarity_index import AsyncChunkIndex
+from app.providers.SearchProvider.doc_index import AsyncDocIndex
+from app.providers.LLMProvider.llm_router import build_llm_router
+from app.providers.StorageProvider.storage_factory import get_storage
+
+from app.utils.asgi_endpoint import endpoint, read_json
+from app.utils.hybrid_merge import merge_results
+from app.utils.metadata_filters import chunk_clauses, doc_clauses
+from app.utils.prompt import build_doc_summary_prompt, build_combine_summaries_prompt
+from app.utils.rag_handlers import (RagRequest, answer_body, answer_prompt, check_partials, document_record,
+                                    full_summary_body, guided_summary_body, guided_summary_prompt,
+                                    no_context_body, parse_query, parse_query_doc, parse_summary, shared_response,
+                                    summary_batch_prompts, summary_text)
+from app.utils.text_artifacts import load_document_text
+from app.utils.single_flight import AsyncSingleFlight, acoalesce
+
+QUERY_FLIGHT = AsyncSingleFlight("rag_query")
+QUERY_DOC_FLIGHT = AsyncSingleFlight("rag_query_doc")
+SUMMARY_FLIGHT = AsyncSingleFlight("rag_summary")
+
+
+async def _hybrid_retrieve(cfg, req: RagRequest):
+    t1 = time.time()
+    qvec = await aembed_text(cfg, req.query, req.tenant)
+    t_embed = int((time.time() - t1) * 1000)
+
+    # BM25 and kNN go out concurrently on the shared async client
+    t2 = time.time()
+    client = get_async_es(cfg.es_url)
+    index = AsyncChunkIndex(client, cfg.index_chunks, IndexLayout.from_cfg(cfg), cfg.es_knn_num_candidates)
+    doc_ids = None
+    if req.mode == "two_stage" and not req.doc_id:
+        # two-stage: closest documents first, then only their chunks
+        docs = AsyncDocIndex(client, cfg.index_docs, cfg.retrieval_doc_top_m, cfg.retrieval_doc_num_candidates)
+        doc_ids = await docs.top_docs(req.tenant, qvec, embed_model_of(cfg, req.tenant), doc_clauses(req.conditions))
+    # metadata filters run inside both searches, before top_k
+    meta_filters = chunk_clauses(req.conditions)
+    bm25, vec = await asyncio.gather(
+        index.bm25_search(tenant=req.tenant, query=req.query, top_k=req.top_k, doc_id=req.doc_id or None,
+                          doc_ids=doc_ids, meta_filters=meta_filters),
+        index.vector_search(tenant=req.tenant, query_vec=qvec, top_k=req.top_k, doc_id=req.doc_id or None,
+                            doc_ids=doc_ids, meta_filters=meta_filters),
+    )
+    merged = merge_results(bm25, vec, w_bm25=0.5, w_vec=0.5, top_k=req.top_k)
+    t_retrieve = int((time.time() - t2) * 1000)
+    return merged, t_embed, t_retrieve
+
+
+async def _map_summaries(cfg, llm, prompts: list) -> list:
+    """
+    Map step of a long-document summary: at most SUMMARY_MAP_CONCURRENCY batches in flight (the
+    scheduler still meters them as batch priority). The first failure cancels the batches still
+    queued or running and is raised as itself, not as an ExceptionGroup.
+    """
+    limit = asyncio.Semaphore(cfg.summary_map_concurrency)
+
+    async def one(prompt: str) -> str:
+        async with limit:
+            resp = await llm.agenerate(prompt, priority="batch", max_tokens=600, temperature=0.2)
+            return resp["text"]
+
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(one(prompt)) for prompt in prompts]
+    except ExceptionGroup as eg:
+        raise eg.exceptions[0]
+    return [task.result() for task in tasks]
+
+
+@endpoint
+async def rag_query(request: Request):
+    cfg = request.state.cfg
+    started = time.time()
+    req = parse_query(cfg, await read_json(request), request.state.tenant)
+
+    # identical questions in flight together share one embed, search and LLM call
+    async def answer():
+        t0 = time.time()
+        merged, t_embed, t_retrieve = await _hybrid_retrieve(cfg, req)
+        context, prompt = answer_prompt(cfg, req, merged)
+
+        llm = build_llm_router(cfg, "rag_query")
+        llm_resp = await llm.agenerate(prompt, max_tokens=500, temperature=0.2)
+        return answer_body(req, context, llm_resp, t_embed, t_retrieve, t0)
+
+    return await acoalesce(cfg, QUERY_FLIGHT, req.key, answer,
+                           share=lambda r: shared_response(r, req.query, started))
+
+
+@endpoint
+async def rag_query_doc(request: Request):
+    cfg = request.state.cfg
+    started = time.time()
+    req = parse_query_doc(await read_json(request), request.state.tenant)
+
+    async def answer():
+        t0 = time.time()
+        merged, t_embed, t_retrieve = await _hybrid_retrieve(cfg, req)
+        if not merged:
+            return no_context_body(req, t_embed, t_retrieve, t0), 200
+
+        context, prompt = answer_prompt(cfg, req, merged)
+        llm = build_llm_router(cfg, "rag_query_doc")
+        llm_resp = await llm.agenerate(prompt, max_tokens=500, temperature=0.2)
+        return answer_body(req, context, llm_resp, t_embed, t_retrieve, t0), 200
+
+    return await acoalesce(cfg, QUERY_DOC_FLIGHT, req.key, answer,
+                           share=lambda r: shared_response(r, req.query, started))
+
+
+@endpoint
+async def rag_summary(request: Request):
+    cfg = request.state.cfg
+    t0 = time.time()
+    req = parse_summary(await read_json(request), request.state.tenant)
+    record = document_record(cfg, req)
+
+    # concurrent requests for the same document (and query) share one summary generation
+    async def summarize():
+        # artifact / boto3 reads are blocking and pypdf is CPU-bound: all of it runs off the event loop
+        doc = await asyncio.to_thread(load_document_text, cfg, record, get_storage(cfg))
+        text = summary_text(doc, req)
+        llm = build_llm_router(cfg, "rag_summary")
+
+        if not req.query:
+            prompts = summary_batch_prompts(cfg, doc, req)
+            if prompts is None:
+                llm_resp = await llm.agenerate(build_doc_summary_prompt(text), max_tokens=800, temperature=0.2)
+                return full_summary_body(req, llm_resp, t0, "default full document"), 200
+
+            partials = await _map_summaries(cfg, llm, prompts)
+            final_prompt = build_combine_summaries_prompt(check_partials(partials, req))
+            final_resp = await llm.agenerate(final_prompt, max_tokens=800, temperature=0.2)
+            return full_summary_body(req, final_resp, t0, "default_full_document"), 200
+
+        merged, t_embed, t_retrieve = await _hybrid_retrieve(cfg, req)
+        if not merged:
+            return no_context_body(req, t_embed, t_retrieve, t0), 200
+
+        context, prompt = guided_summary_prompt(cfg, req, merged)
+        llm_resp = await llm.agenerate(prompt, max_tokens=700, temperature=0.2)
+        return guided_summary_body(req, context, llm_resp, t_embed, t_retrieve, t0), 200
+
+    return await acoalesce(cfg, SUMMARY_FLIGHT, req.key, summarize,
+                           share=lambda r: shared_response(r, req.query, t0))
+
+
+routes = [
+    Route("/v1/rag/query", rag_query, methods=["POST"]),
+    Route("/v1/rag/query_doc", rag_query_doc, methods=["POST"]),
+    Route("/v1/rag/summary", rag_summary, methods=["POST"]),
+]
@@ -0,0 +1,62 @@
+import asyncio
+import time
+from starlette.requests import Request
+from starlette.routing import Route
+
+from app.providers.EmbeddingsProvider.embedding_provider import aembed_text, embed_model_of
+from app.providers.SearchProvider.es_client import get_async_es
+from app.providers.SearchProvider.index_layout import IndexLayout
+from app.providers.SearchProvider.similarity_index import AsyncChunkIndex
+from app.providers.SearchProvider.doc_index import AsyncDocIndex
+from app.utils.asgi_endpoint import endpoint, read_json
+from app.utils.hybrid_merge import merge_results
+from app.utils.metadata_filters import chunk_clauses, doc_clauses
+from app.utils.rag_handlers import parse_retrieve, retrieve_body, shared_response
+from app.utils.single_flight import AsyncSingleFlight, acoalesce
+
+RETRIEVE_FLIGHT = AsyncSingleFlight("retrieve")
+
+
+@endpoint
+async def retrieve(request: Request):
+    cfg = request.state.cfg
+    started = time.time()
+    req = parse_retrieve(cfg, await read_json(request))
+
+    async def search():
+        t0 = time.time()
+        qvec = await aembed_text(cfg, req.query, req.tenant)
+        t_embed = int((time.time() - t0) * 1000)
+
+        t1 = time.time()
+        client = get_async_es(cfg.es_url)
+        index = AsyncChunkIndex(client, cfg.index_chunks, IndexLayout.from_cfg(cfg), cfg.es_knn_num_candidates)
+        doc_ids = None
+        if req.mode == "two_stage":
+            docs = AsyncDocIndex(client, cfg.index_docs, cfg.retrieval_doc_top_m, cfg.retrieval_doc_num_candidates)
+            doc_ids = await docs.top_docs(req.tenant, qvec, embed_model_of(cfg, req.tenant), doc_clauses(req.conditions))
+        meta_filters = chunk_clauses(req.conditions)
+        bm25, vec = await asyncio.gather(
+            index.bm25_search(tenant=req.tenant, query=req.query, top_k=req.top_k, profile=req.profile,
+                              explain=req.explain, doc_ids=doc_ids, meta_filters=meta_filters),
+            index.vector_search(tenant=req.tenant, query_vec=qvec, top_k=req.top_k, profile=req.profile,
+                                explain=req.explain, doc_ids=doc_ids, meta_filters=meta_filters),
+        )
+
+        t_search = time.time()
+        merged = merge_results(bm25, vec, w_bm25=0.5, w_vec=0.5, top_k=req.top_k)
+        t_merge = int((time.time() - t_search) * 1000)
+        t_retrieve = int((time.time() - t1) * 1000)
+        return retrieve_body(req, doc_ids, merged, t_embed, t_retrieve, t_merge, t0, index.diagnostics)
+
+    # profile / explain diagnostics belong to the request that asked for them: never shared
+    if req.profile or req.explain:
+        return await search()
+    return await acoalesce(cfg, RETRIEVE_FLIGHT, req.key, search,
+                           share=lambda r: shared_response(r, req.query, started))
+
+
+routes = [
+    Route("/v1/retrieve/", retrieve, methods=["POST"]),
+    Route("/v1/retrieve", retrieve, methods=["POST"]),
+]
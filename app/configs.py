@@ -4,6 +4,39 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def parse_kv(spec: str) -> dict:
+    """'a=1,b=2' -> {"a": "1", "b": "2"} for per-endpoint / per-provider settings."""
+    out = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            k, v = item.split("=", 1)
+            out[k.strip()] = v.strip()
+    return out
+
+# LLM model id fragment -> Hugging Face tokenizer with the same vocabulary, so the prompt context
+# budget is counted the way the provider counts it. Checked in order (mixtral before mistral).
+LLM_TOKENIZERS = (
+    ("llama-3", "NousResearch/Meta-Llama-3-8B"),
+    ("llama3", "NousResearch/Meta-Llama-3-8B"),
+    ("mixtral", "mistralai/Mixtral-8x7B-v0.1"),
+    ("mistral", "mistralai/Mistral-7B-v0.1"),
+)
+
+
+def llm_tokenizer(llm_providers: str, groq_model: str, bedrock_model_id: str) -> str:
+    """
+    Tokenizer for the first configured LLM provider whose model is in LLM_TOKENIZERS; "" when
+    there is none (fake, or a model family without a public tokenizer): token counts then use
+    the ~4 chars/token estimate, never the embedding model's vocabulary.
+    """
+    models = {"groq": groq_model, "bedrock": bedrock_model_id}
+    for spec in (llm_providers or "").split(","):
+        model = models.get(spec.strip().split(":", 1)[0].lower(), "").lower()
+        if model:
+            return next((name for fragment, name in LLM_TOKENIZERS if fragment in model), "")
+    return ""
+
+
 @dataclass(frozen=True)
 class AppConfig:
     env: str
@@ -27,6 +60,78 @@ class AppConfig:
     summary_max_chars: int
     summary_batch_size: int
     metadata_registry_path : str
+    llm_providers: str
+    llm_default_policy: str
+    llm_route_policies: str
+    llm_hedge_default_ms: int
+    llm_hedge_min_ms: int
+    fake_llm_latency_ms: int
+    fake_llm_jitter_ms: int
+    fake_llm_error_rate: float
+    llm_rpm_limits: str
+    llm_tpm_limits: str
+    llm_queue_timeout_s: float
+    llm_max_retries: int
+    llm_retry_after_default_s: float
+    llm_breaker_failures: int
+    llm_breaker_cooldown_s: float
+    prompt_context_max_tokens: int
+    prompt_tokenizer: str
+    embed_executor_workers: int
+    asgi_wsgi_threads: int
+    embed_batching: bool
+    embed_batch_max_size: int
+    embed_batch_max_wait_ms: float
+    embed_backend: str
+    embed_onnx_quantize: bool
+    embed_onnx_threads: int
+    embed_model_budget_mb: float
+    embed_tenant_models: str
+    warmup_mode: str
+    torch_num_threads: int
+    metrics_tenant_label: bool
+    trace_exporter: str
+    trace_sample_rate: float
+    trace_file: str
+    otlp_endpoint: str
+    admin_token: str
+    profile_mode: str
+    profile_sample_rate: float
+    profile_interval_ms: float
+    profile_keep: int
+    slow_request_ms: int
+    slow_request_route_ms: str
+    slowlog_redact_tenants: str
+    slowlog_max_bytes: int
+    slowlog_backups: int
+    storage_backend: str
+    storage_fs_dir: str
+    fake_llm_latency_dist: str
+    artifact_store: str
+    artifact_dir: str
+    storage_cache_dir: str
+    storage_cache_max_bytes: int
+    storage_cache_validate: bool
+    es_chunk_shards: int
+    es_chunk_replicas: int
+    es_tenant_routing: bool
+    es_dedicated_tenants: str
+    index_chunks_write: str
+    es_hnsw_m: int
+    es_hnsw_ef_construction: int
+    es_chunk_storage: str
+    es_vector_index_type: str
+    es_knn_num_candidates: int
+    retrieval_mode: str
+    retrieval_doc_top_m: int
+    retrieval_doc_num_candidates: int
+    log_level: str
+    log_sample_rates: str
+    log_queue_size: int
+    log_request_bodies: bool
+    single_flight: bool
+    single_flight_wait_s: float
+    summary_map_concurrency: int
 
 def load_config() -> AppConfig:
     return AppConfig(
@@ -51,4 +156,78 @@ def load_config() -> AppConfig:
         summary_max_chars=int(os.getenv("SUMMARY_MAX_CHARS", 12000)),
         summary_batch_size=int(os.getenv("SUMMARY_BATCH_SIZE", 5)),
         metadata_registry_path=os.getenv("METADATA_REGISTRY_PATH", f"{os.getenv('LOCAL_STORAGE_DIR', '/data')}/metadata_registry.json"),
+        llm_providers=os.getenv("LLM_PROVIDERS", "groq,bedrock"),
+        llm_default_policy=os.getenv("LLM_DEFAULT_POLICY", "fallback"),
+        llm_route_policies=os.getenv("LLM_ROUTE_POLICIES", ""),
+        llm_hedge_default_ms=int(os.getenv("LLM_HEDGE_DEFAULT_MS", 2000)),
+        llm_hedge_min_ms=int(os.getenv("LLM_HEDGE_MIN_MS", 300)),
+        fake_llm_latency_ms=int(os.getenv("FAKE_LLM_LATENCY_MS", 200)),
+        fake_llm_jitter_ms=int(os.getenv("FAKE_LLM_JITTER_MS", 0)),
+        fake_llm_error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", 0.0)),
+        llm_rpm_limits=os.getenv("LLM_RPM_LIMITS", ""),
+        llm_tpm_limits=os.getenv("LLM_TPM_LIMITS", ""),
+        llm_queue_timeout_s=float(os.getenv("LLM_QUEUE_TIMEOUT_S", 30)),
+        llm_max_retries=int(os.getenv("LLM_MAX_RETRIES", 2)),
+        llm_retry_after_default_s=float(os.getenv("LLM_RETRY_AFTER_DEFAULT_S", 2)),
+        llm_breaker_failures=int(os.getenv("LLM_BREAKER_FAILURES", 5)),
+        llm_breaker_cooldown_s=float(os.getenv("LLM_BREAKER_COOLDOWN_S", 30)),
+        prompt_context_max_tokens=int(os.getenv("PROMPT_CONTEXT_MAX_TOKENS", 3000)),
+        # tokenizer used to budget prompt context; the embedding model's is cached in the image
+        prompt_tokenizer=os.getenv("PROMPT_TOKENIZER") or llm_tokenizer(
+            os.getenv("LLM_PROVIDERS", "groq,bedrock"), os.getenv("GROQ_MODEL", ""), os.getenv("BEDROCK_MODEL_ID", "")),
+        embed_executor_workers=int(os.getenv("EMBED_EXECUTOR_WORKERS", 2)),
+        asgi_wsgi_threads=int(os.getenv("ASGI_WSGI_THREADS", 16)),
+        embed_batching=os.getenv("EMBED_BATCHING", "true").lower() == "true",
+        embed_batch_max_size=int(os.getenv("EMBED_BATCH_MAX_SIZE", 32)),
+        embed_batch_max_wait_ms=float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", 3)),
+        embed_backend=os.getenv("EMBED_BACKEND", "torch").lower(),
+        embed_onnx_quantize=os.getenv("EMBED_ONNX_QUANTIZE", "false").lower() == "true",
+        embed_onnx_threads=int(os.getenv("EMBED_ONNX_THREADS", 0)),
+        embed_model_budget_mb=float(os.getenv("EMBED_MODEL_BUDGET_MB", 2048)),
+        embed_tenant_models=os.getenv("EMBED_TENANT_MODELS", ""),
+        warmup_mode=os.getenv("WARMUP_MODE", "background").lower(),
+        torch_num_threads=int(os.getenv("TORCH_NUM_THREADS", 0)),
+        metrics_tenant_label=os.getenv("METRICS_TENANT_LABEL", "false").lower() == "true",
+        trace_exporter=os.getenv("TRACE_EXPORTER", "none").lower(),
+        trace_sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", 1.0)),
+        trace_file=os.getenv("TRACE_FILE", ""),
+        otlp_endpoint=os.getenv("OTLP_ENDPOINT", "http://localhost:4318/v1/traces"),
+        admin_token=os.getenv("ADMIN_TOKEN", ""),
+        profile_mode=os.getenv("PROFILE_MODE", "off").lower(),
+        profile_sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 0.0)),
+        profile_interval_ms=float(os.getenv("PROFILE_INTERVAL_MS", 5)),
+        profile_keep=int(os.getenv("PROFILE_KEEP", 200)),
+        slow_request_ms=int(os.getenv("SLOW_REQUEST_MS", 2000)),
+        slow_request_route_ms=os.getenv("SLOW_REQUEST_ROUTE_MS", ""),
+        slowlog_redact_tenants=os.getenv("SLOWLOG_REDACT_TENANTS", ""),
+        slowlog_max_bytes=int(os.getenv("SLOWLOG_MAX_BYTES", 10485760)),
+        slowlog_backups=int(os.getenv("SLOWLOG_BACKUPS", 3)),
+        storage_backend=os.getenv("STORAGE_BACKEND", "s3").lower(),
+        storage_fs_dir=os.getenv("STORAGE_FS_DIR", f"{os.getenv('LOCAL_STORAGE_DIR', '/data')}/objects"),
+        fake_llm_latency_dist=os.getenv("FAKE_LLM_LATENCY_DIST", "uniform").lower(),
+        artifact_store=os.getenv("ARTIFACT_STORE", "local").lower(),
+        artifact_dir=os.getenv("ARTIFACT_DIR", f"{os.getenv('LOCAL_STORAGE_DIR', '/data')}/artifacts"),
+        storage_cache_dir=os.getenv("STORAGE_CACHE_DIR", f"{os.getenv('LOCAL_STORAGE_DIR', '/data')}/storage_cache"),
+        storage_cache_max_bytes=int(os.getenv("STORAGE_CACHE_MAX_BYTES", 1073741824)),
+        storage_cache_validate=os.getenv("STORAGE_CACHE_VALIDATE", "true").lower() == "true",
+        es_chunk_shards=int(os.getenv("ES_CHUNK_SHARDS", 1)),
+        es_chunk_replicas=int(os.getenv("ES_CHUNK_REPLICAS", 0)),
+        es_tenant_routing=os.getenv("ES_TENANT_ROUTING", "false").lower() == "true",
+        es_dedicated_tenants=os.getenv("ES_DEDICATED_TENANTS", ""),
+        index_chunks_write=os.getenv("ES_INDEX_CHUNKS_WRITE", f"{os.getenv('ES_INDEX_CHUNKS', 'rag_chunks')}-write"),
+        es_hnsw_m=int(os.getenv("ES_HNSW_M", 16)),
+        es_hnsw_ef_construction=int(os.getenv("ES_HNSW_EF_CONSTRUCTION", 100)),
+        es_chunk_storage=os.getenv("ES_CHUNK_STORAGE", "default"),
+        es_vector_index_type=os.getenv("ES_VECTOR_INDEX_TYPE", ""),
+        es_knn_num_candidates=int(os.getenv("ES_KNN_NUM_CANDIDATES", 0)),
+        retrieval_mode=os.getenv("RETRIEVAL_MODE", "chunks").lower(),
+        retrieval_doc_top_m=int(os.getenv("RETRIEVAL_DOC_TOP_M", 20)),
+        retrieval_doc_num_candidates=int(os.getenv("RETRIEVAL_DOC_NUM_CANDIDATES", 100)),
+        log_level=os.getenv("LOG_LEVEL", "INFO"),
+        log_sample_rates=os.getenv("LOG_SAMPLE_RATES", ""),
+        log_queue_size=int(os.getenv("LOG_QUEUE_SIZE", 10000)),
+        log_request_bodies=os.getenv("LOG_REQUEST_BODIES", "false").lower() == "true",
+        single_flight=os.getenv("SINGLE_FLIGHT", "true").lower() == "true",
+        single_flight_wait_s=float(os.getenv("SINGLE_FLIGHT_WAIT_S", 30)),
+        summary_map_concurrency=max(1, int(os.getenv("SUMMARY_MAP_CONCURRENCY", 4))),
     )
\ No newline at end of file
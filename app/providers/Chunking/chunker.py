@@ -1,5 +1,29 @@
-from typing import List
+from typing import List, Tuple
 
+from app.utils.tracing import traced
+
+def chunk_spans(text: str, chunk_size: int =900, overlap: int =100) -> List[Tuple[int, int]]:
+    """
+    Character spans of the chunks chunk_text would produce, as (start, end) offsets into `text`.
+    Stored in text artifacts so chunks can be rebuilt without re-chunking.
+    """
+    stripped = text.strip()
+    if not stripped:
+        return []
+    base = len(text) - len(text.lstrip())
+
+    spans = []
+    start = 0
+    while start < len(stripped):
+        end = min(start + chunk_size, len(stripped))
+        spans.append((base + start, base + end))
+        if end == len(stripped):
+            break
+        start = max(0, end - overlap)
+
+    return spans
+
+@traced("chunk_text", lambda chunks: {"chunks": len(chunks)})
 def chunk_text(text: str, chunk_size: int =900, overlap: int =100) -> List[str]:
     """
     Splits the input text into chunks of specified size with a given overlap.
@@ -12,18 +36,4 @@ def chunk_text(text: str, chunk_size: int =900, overlap: int =100) -> List[str]:
     Returns:
         A list of text chunks.
     """
-    text = text.strip()
-    if not text:
-        return []
-    
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = min(start + chunk_size, len(text))
-        chunk = text[start:end]
-        chunks.append(chunk)
-        if end == len(text):
-            break
-        start = max(0, end - overlap)
-
-    return chunks
\ No newline at end of file
+    return [text[start:end] for start, end in chunk_spans(text, chunk_size, overlap)]
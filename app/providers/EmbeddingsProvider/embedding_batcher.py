@@ -0,0 +1,137 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, List
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """
+    Cross-request micro-batching for query embeddings.
+
+    Concurrent callers submit single texts; one worker thread collects them for up to
+    `max_wait_ms` or `max_batch_size` items, runs a single batched encode and resolves
+    each caller's future. When traffic is idle (the previous batch held one item and
+    nothing else is queued) it encodes immediately, so a lone request never pays the wait.
+    """
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch_size: int = 32, max_wait_ms: float = 3.0):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: threading.Thread | None = None
+        self._pid: int | None = None
+        self._last_batch_size = 1
+
+        # metrics
+        self._batches = 0
+        self._items = 0
+        self._fill = [0] * (max_batch_size + 1)
+        self._queue_delays_ms: deque = deque(maxlen=1000)
+
+    def _ensure_worker(self) -> None:
+        # threads do not survive fork: start one per process on first use
+        if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+                return
+            # a new queue only in a new process: items already queued here are for this worker
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+            self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        self._ensure_worker()
+        fut: Future = Future()
+        self._queue.put((text, fut, time.perf_counter()))
+        return fut
+
+    def embed(self, text: str, timeout: float | None = None) -> np.ndarray:
+        return self.submit(text).result(timeout=timeout)
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait_s
+
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            # idle traffic: do not hold a single request back
+            if len(batch) == 1 and self._last_batch_size == 1:
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            # callers that gave up (cancelled asyncio.wrap_future on client disconnect) are dropped
+            # here; the rest are marked running so a late cancel cannot race the result
+            live = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if live:
+                try:
+                    vecs = self.encode([text for text, _, _ in live])
+                except Exception as e:
+                    for _, fut, _ in live:
+                        _resolve(fut, exception=e)
+                else:
+                    for (_, fut, _), vec in zip(live, vecs):
+                        _resolve(fut, result=vec)
+
+            with self._lock:
+                self._last_batch_size = len(batch)
+                self._batches += 1
+                self._items += len(batch)
+                self._fill[len(batch)] += 1
+                self._queue_delays_ms.extend((started - enq) * 1000 for _, _, enq in batch)
+
+    def stats(self) -> dict:
+        with self._lock:
+            delays = sorted(self._queue_delays_ms)
+            batches, items = self._batches, self._items
+            fill = {str(size): n for size, n in enumerate(self._fill) if n}
+
+        def pct(q):
+            return round(delays[min(len(delays) - 1, int(q / 100.0 * len(delays)))], 3) if delays else 0.0
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_s * 1000,
+            "batches": batches,
+            "items": items,
+            "avg_batch_size": round(items / batches, 2) if batches else 0.0,
+            "avg_batch_fill": round(items / (batches * self.max_batch_size), 3) if batches else 0.0,
+            "batch_size_histogram": fill,
+            "queue_delay_ms": {"p50": pct(50), "p95": pct(95), "max": round(delays[-1], 3) if delays else 0.0},
+            "queued": self._queue.qsize(),
+        }
+
+
+def _resolve(fut: Future, result=None, exception: BaseException | None = None) -> None:
+    # one bad future must not take down the worker (and every caller queued behind it)
+    try:
+        if exception is not None:
+            fut.set_exception(exception)
+        else:
+            fut.set_result(result)
+    except Exception:
+        pass
@@ -1,17 +1,164 @@
-from sentence_transformers  import SentenceTransformer
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.configs import parse_kv
+from app.providers.EmbeddingsProvider.embedding_batcher import EmbeddingBatcher
+from app.providers.EmbeddingsProvider.model_manager import ModelManager
+from app.providers.SearchProvider.index_versions import live_embedding
+from app.utils.errors import UpstreamError
+from app.utils.metrics import stage, timed
+from app.utils.tracing import annotate, traced, tracer
+
+_MODELS = ModelManager()
+_EXECUTOR: ThreadPoolExecutor | None = None
+_BATCHERS: dict = {}
+_BATCHERS_LOCK = threading.Lock()
+
+BACKENDS = ("torch", "onnx")
+
+
+def _load_model(model_name: str, backend: str, quantize: bool, threads: int, export_dir: str):
+    # heavy runtimes are imported only for the backend in use (onnx nodes never load torch)
+    if backend == "onnx":
+        from app.providers.EmbeddingsProvider.onnx_encoder import OnnxSentenceEncoder
+        return OnnxSentenceEncoder(model_name, quantize=quantize, threads=threads, export_dir=export_dir)
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    raise UpstreamError("EMBED_BACKEND_INVALID", f"EMBED_BACKEND must be one of {', '.join(BACKENDS)}, got '{backend}'", 500)
+
+
+def model_key(model_name: str, backend: str = "torch", quantize: bool = False) -> str:
+    return f"{model_name}:{backend}{'-int8' if quantize else ''}"
 
-_MODEL = None
-_MODEL_NAME = None
 
 class LocalEmbeddingProvider:
-    def __init__(self, model_name: str):
-        global _MODEL, _MODEL_NAME
-        if _MODEL is None or _MODEL_NAME != model_name:
-            _MODEL = SentenceTransformer(model_name)
-            _MODEL_NAME = model_name
-        self.model = _MODEL
+    def __init__(self, model_name: str, max_batch_size: int = 0, max_wait_ms: float = 0.0,
+                 backend: str = "torch", quantize: bool = False, threads: int = 0, export_dir: str = ""):
+        key = model_key(model_name, backend, quantize)
+        loader = lambda: _load_model(model_name, backend, quantize, threads, export_dir)
+        self.model = _MODELS.get(key, loader)
+        self.model_name = model_name
+        self.backend = backend
+        self.embedding_dim = self.model.get_sentence_embedding_dimension()
+
+        # single-text calls from concurrent requests are coalesced into one encode
+        self.batcher = None
+        if max_batch_size > 1:
+            self.batcher = _get_batcher(key, loader, max_batch_size, max_wait_ms)
+
+
+    @traced("embed.text")
+    @timed("embed")
+    def embed_text(self, text: str) -> np.ndarray:
+        annotate(**{"embed.model": self.model_name, "embed.backend": self.backend, "embed.batched": self.batcher is not None})
+        return self._embed_one(text)
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        if self.batcher is not None:
+            vec = self.batcher.embed(text)
+        else:
+            vec = self.model.encode([text], normalize_embeddings=True)[0]
+        return as_vector(vec)
+
+    @traced("embed.texts", lambda vecs: {"embed.texts": len(vecs)})
+    @timed("embed")
+    def embed_texts(self, texts: list[str], batch_size: int = 32) -> np.ndarray:
+        """Batched encode for callers that already hold many texts (ingest); one row per text."""
+        if not texts:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        vecs = self.model.encode(texts, normalize_embeddings=True, batch_size=batch_size)
+        return as_vector(vecs)
+
+
+def as_vector(vec) -> np.ndarray:
+    """
+    Vectors stay float32 NumPy end to end: the ES client serialises them with orjson straight
+    from the buffer (es_client), instead of boxing every dim as a Python float first.
+    """
+    return np.ascontiguousarray(vec, dtype=np.float32)
+
+
+def _get_batcher(key: str, loader, max_batch_size: int, max_wait_ms: float) -> EmbeddingBatcher:
+    with _BATCHERS_LOCK:
+        batcher = _BATCHERS.get(key)
+        if batcher is None or batcher.max_batch_size != max_batch_size:
+            # resolve the model per batch so an evicted model is reloaded rather than pinned by the batcher
+            encode = lambda texts: _MODELS.get(key, loader).encode(texts, normalize_embeddings=True, batch_size=max_batch_size)
+            batcher = EmbeddingBatcher(encode, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+            _BATCHERS[key] = batcher
+        return batcher
+
+
+def batcher_stats() -> dict:
+    with _BATCHERS_LOCK:
+        return {name: b.stats() for name, b in _BATCHERS.items()}
+
+
+def model_stats() -> dict:
+    return _MODELS.stats()
+
+
+def reset_models() -> None:
+    """Drop every resident model (post-fork for runtimes that must not be shared with the parent)."""
+    global _MODELS
+    _MODELS = ModelManager(_MODELS.budget_mb)
+
+
+def tenant_model(cfg, tenant: str = "") -> str:
+    """Embedding model for a tenant: EMBED_TENANT_MODELS override, else EMBED_MODEL_NAME."""
+    return parse_kv(cfg.embed_tenant_models).get(tenant or "", cfg.embed_model_name)
+
+
+def embed_model_of(cfg, tenant: str = "") -> str:
+    """Model get_embedder resolves for the tenant right now, without loading it."""
+    live = live_embedding(cfg, tenant)
+    return live[0] if live else tenant_model(cfg, tenant)
+
+
+def get_embedder(cfg, tenant: str = "") -> LocalEmbeddingProvider:
+    _MODELS.budget_mb = cfg.embed_model_budget_mb
+    # the live index records the model that built it; config only applies to the next (re)index
+    live = live_embedding(cfg, tenant)
+    model_name, expected_dim = live or (tenant_model(cfg, tenant), cfg.embedding_dim)
+    embedder = LocalEmbeddingProvider(
+        model_name,
+        max_batch_size=cfg.embed_batch_max_size if cfg.embed_batching else 0,
+        max_wait_ms=cfg.embed_batch_max_wait_ms,
+        backend=cfg.embed_backend,
+        quantize=cfg.embed_onnx_quantize,
+        threads=cfg.embed_onnx_threads,
+        export_dir=f"{cfg.local_storage_dir}/onnx",
+    )
+    # index mappings fix the vector dims; a backend or tenant model must not silently change them
+    if embedder.embedding_dim != expected_dim:
+        raise UpstreamError(
+            "EMBEDDING_DIM_MISMATCH",
+            f"Embedding model '{model_name}' ({cfg.embed_backend}) produces {embedder.embedding_dim} dims, index expects {expected_dim}",
+            500,
+        )
+    return embedder
+
 
+async def aembed_text(cfg, text: str, tenant: str = "") -> np.ndarray:
+    """
+    Embed from async code. Model load is CPU-bound so it runs on a small dedicated pool;
+    with micro-batching on, the encode itself is awaited on the batcher's future.
+    """
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=cfg.embed_executor_workers, thread_name_prefix="embed")
+    loop = asyncio.get_running_loop()
 
-    def embed_text(self, text: str) -> list[float]:
-        vec = self.model.encode([text], normalize_embeddings=True)[0]
-        return vec.astype(float).tolist()
+    with stage("embed"), tracer.start_as_current_span("embed.text"):
+        # in the request's context: the live-index lookup pins its entry for this request's searches
+        embedder = await loop.run_in_executor(_EXECUTOR, contextvars.copy_context().run, get_embedder, cfg, tenant)
+        annotate(**{"embed.model": embedder.model_name, "embed.backend": embedder.backend, "embed.batched": embedder.batcher is not None})
+        if embedder.batcher is not None:
+            vec = await asyncio.wrap_future(embedder.batcher.submit(text))
+            return as_vector(vec)
+        return await loop.run_in_executor(_EXECUTOR, embedder._embed_one, text)
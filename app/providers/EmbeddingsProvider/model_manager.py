@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from app.Logger.log_main import get_logger
+from app.utils.metrics import cache_event
+from app.utils.single_flight import SingleFlight
+
+logger = get_logger()
+
+
+def model_size_mb(model) -> float:
+    """Approximate resident size: ONNX file size, or torch parameter + buffer bytes."""
+    path = getattr(model, "model_path", None)
+    if path and os.path.exists(path):
+        return os.path.getsize(path) / (1024 * 1024)
+    try:
+        size = sum(p.numel() * p.element_size() for p in model.parameters())
+        size += sum(b.numel() * b.element_size() for b in model.buffers())
+        return size / (1024 * 1024)
+    except Exception:
+        return 0.0
+
+
+class ModelManager:
+    """
+    Keeps several loaded embedding models resident under a memory budget.
+
+    `get(key, loader)` returns the cached model or loads it. Loads are single-flight: concurrent
+    callers for the same key wait on the first caller's load (or get its exception) instead of
+    loading again.
+    When the resident total exceeds `budget_mb`, least recently used models are dropped
+    (the one just loaded always stays, even if it alone is over budget).
+    """
+    def __init__(self, budget_mb: float = 2048):
+        self.budget_mb = budget_mb
+        self._models: "OrderedDict[str, dict]" = OrderedDict()
+        self._flight = SingleFlight("embed_model")
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._loads = 0
+        self._evictions = 0
+        self._load_failures = 0
+
+    def get(self, key: str, loader: Callable[[], Any]):
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                entry["hits"] += 1
+                entry["last_used"] = time.time()
+                self._hits += 1
+                cache_event("embed_model", True)
+                return entry["model"]
+            cache_event("embed_model", False)
+
+        # no wait bound: a first load may include the model download
+        return self._flight.do(key, lambda: self._load(key, loader))
+
+    def _load(self, key: str, loader: Callable[[], Any]):
+        with self._lock:
+            # a load for this key may have completed between the miss above and this flight
+            entry = self._models.get(key)
+            if entry is not None:
+                return entry["model"]
+
+        start = time.perf_counter()
+        try:
+            model = loader()
+        except Exception:
+            with self._lock:
+                self._load_failures += 1
+            raise
+
+        load_s = time.perf_counter() - start
+        size = model_size_mb(model)
+        with self._lock:
+            self._models[key] = {
+                "model": model,
+                "size_mb": size,
+                "load_s": load_s,
+                "loaded_at": time.time(),
+                "last_used": time.time(),
+                "hits": 0,
+            }
+            self._loads += 1
+            evicted = self._evict(keep=key)
+
+        logger.info("embed_model_loaded", extra={"model": key, "latency_ms": int(load_s * 1000)})
+        for name in evicted:
+            logger.info("embed_model_evicted", extra={"model": name})
+        return model
+
+    def _evict(self, keep: str) -> list:
+        # caller holds the lock; in-flight users keep their reference until they finish
+        evicted = []
+        while self._used_mb() > self.budget_mb:
+            victim = next((k for k in self._models if k != keep), None)
+            if victim is None:
+                break
+            self._models.pop(victim)
+            self._evictions += 1
+            evicted.append(victim)
+        return evicted
+
+    def _used_mb(self) -> float:
+        return sum(e["size_mb"] for e in self._models.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "budget_mb": self.budget_mb,
+                "used_mb": round(self._used_mb(), 1),
+                "hits": self._hits,
+                "loads": self._loads,
+                "coalesced_loads": self._flight.stats()["followers"],
+                "load_failures": self._load_failures,
+                "evictions": self._evictions,
+                "loading": sorted(self._flight.in_flight()),
+                "resident": [
+                    {
+                        "model": key,
+                        "size_mb": round(e["size_mb"], 1),
+                        "load_s": round(e["load_s"], 3),
+                        "hits": e["hits"],
+                        "idle_s": round(time.time() - e["last_used"], 1),
+                    }
+                    # most recently used first
+                    for key, e in reversed(self._models.items())
+                ],
+            }
@@ -0,0 +1,169 @@
+import json
+import os
+import shutil
+from typing import List
+
+import numpy as np
+
+from app.Logger.log_main import get_logger
+from app.utils.errors import UpstreamError
+
+logger = get_logger()
+
+
+def _resolve(model_name: str, filename: str, required: bool = True) -> str | None:
+    # local export directory first, then the Hugging Face hub cache
+    if os.path.isdir(model_name):
+        path = os.path.join(model_name, filename)
+        if os.path.exists(path):
+            return path
+        if required:
+            raise FileNotFoundError(path)
+        return None
+    from huggingface_hub import hf_hub_download
+    try:
+        return hf_hub_download(model_name, filename)
+    except Exception:
+        if required:
+            raise
+        return None
+
+
+def _read_json(path: str | None) -> dict:
+    if not path:
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def export_onnx(model_name: str, out_dir: str) -> str:
+    """
+    Export a hub model without an `onnx/` folder to `out_dir` (torch + transformers needed,
+    once). The directory can then be used as the model name for the onnx backend.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(os.path.join(out_dir, "onnx"), exist_ok=True)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tok = AutoTokenizer.from_pretrained(model_name)
+    tok.save_pretrained(out_dir)
+    for extra in ("sentence_bert_config.json", "1_Pooling/config.json"):
+        src = _resolve(model_name, extra, required=False)
+        if src:
+            os.makedirs(os.path.dirname(os.path.join(out_dir, extra)), exist_ok=True)
+            shutil.copy(src, os.path.join(out_dir, extra))
+
+    dummy = tok(["export"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+    axes = {n: {0: "batch", 1: "seq"} for n in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+    path = os.path.join(out_dir, "onnx", "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(dummy[n] for n in names), path, input_names=names,
+                          output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=17)
+    logger.info("onnx_exported", extra={"path": path})
+    return out_dir
+
+
+def _quantized_path(model_path: str) -> str:
+    qpath = model_path[:-len(".onnx")] + "_qint8_dynamic.onnx"
+    if not os.path.exists(qpath):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        tmp = f"{qpath}.{os.getpid()}.tmp"
+        quantize_dynamic(model_path, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, qpath)
+        logger.info("onnx_quantized", extra={"path": qpath})
+    return qpath
+
+
+class OnnxSentenceEncoder:
+    """
+    ONNX Runtime stand-in for SentenceTransformer on CPU.
+
+    Loads `onnx/model.onnx` + `tokenizer.json` from the hub repo (or a local export dir,
+    exporting into `export_dir` when the repo has no ONNX weights),
+    applies the model's own pooling (1_Pooling/config.json) and L2 normalisation, so vectors
+    stay comparable with the torch backend. `quantize=True` runs onnxruntime dynamic int8
+    quantisation once and caches the result next to the fp32 model.
+    Exposes the subset of the SentenceTransformer API the providers use.
+    """
+    def __init__(self, model_name: str, quantize: bool = False, threads: int = 0, export_dir: str = ""):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        if export_dir and not os.path.isdir(model_name) and _resolve(model_name, "onnx/model.onnx", required=False) is None:
+            # hub repo ships no ONNX weights: export once to a local dir and load from there
+            local_dir = os.path.join(export_dir, model_name.replace("/", "__"))
+            if not os.path.exists(os.path.join(local_dir, "onnx", "model.onnx")):
+                export_onnx(model_name, local_dir)
+            model_name = local_dir
+
+        try:
+            model_path = _resolve(model_name, "onnx/model.onnx")
+            tokenizer_path = _resolve(model_name, "tokenizer.json")
+        except Exception as e:
+            raise UpstreamError("ONNX_MODEL_NOT_FOUND", f"No ONNX export found for '{model_name}': {str(e)}", 500)
+
+        st_cfg = _read_json(_resolve(model_name, "sentence_bert_config.json", required=False))
+        pool_cfg = _read_json(_resolve(model_name, "1_Pooling/config.json", required=False))
+
+        if quantize:
+            model_path = _quantized_path(model_path)
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=int(st_cfg.get("max_seq_length", 256)))
+        self.tokenizer.enable_padding()
+
+        if pool_cfg.get("pooling_mode_cls_token"):
+            self.pooling = "cls"
+        elif pool_cfg.get("pooling_mode_max_tokens"):
+            self.pooling = "max"
+        else:
+            self.pooling = "mean"
+
+        self.model_path = model_path
+        dim = self.session.get_outputs()[0].shape[-1]
+        self._dim = dim if isinstance(dim, int) else 0
+        if not self._dim:
+            self._dim = int(self.encode(["dim"]).shape[-1])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dim
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        if hidden.ndim == 2:
+            # graph already pools (sentence_embedding output)
+            return hidden
+        m = mask[..., None].astype(np.float32)
+        if self.pooling == "cls":
+            return hidden[:, 0]
+        if self.pooling == "max":
+            return np.where(m > 0, hidden, -1e9).max(axis=1)
+        return (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, batch_size: int = 32, **kwargs) -> np.ndarray:
+        out = []
+        for i in range(0, len(texts), batch_size):
+            enc = self.tokenizer.encode_batch(list(texts[i:i + batch_size]))
+            ids = np.asarray([e.ids for e in enc], dtype=np.int64)
+            mask = np.asarray([e.attention_mask for e in enc], dtype=np.int64)
+            feeds = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self._input_names:
+                feeds["token_type_ids"] = np.asarray([e.type_ids for e in enc], dtype=np.int64)
+            feeds = {k: v for k, v in feeds.items() if k in self._input_names}
+
+            hidden = self.session.run(None, feeds)[0]
+            out.append(self._pool(hidden, mask).astype(np.float32))
+
+        vecs = np.concatenate(out) if out else np.zeros((0, self._dim), dtype=np.float32)
+        if normalize_embeddings:
+            vecs = vecs / np.clip(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12, None)
+        return vecs
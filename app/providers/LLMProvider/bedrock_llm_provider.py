@@ -1,19 +1,22 @@
+import asyncio
 import json
 import time
-import boto3
-from botocore.config import Config
-from app.utils.errors import UpstreamError
+from app.utils.errors import UpstreamError, RateLimitError
 
 
 class BedrockLLMProvider:
     def __init__(self, region: str, model_id: str):
         if not model_id:
             raise UpstreamError("BEDROCK_MODEL_NOT_SET", "BEDROCK_Model_ID is not configured", 500)
+        import boto3
+        from botocore.config import Config
+
         self.model_id = model_id
         self.client = boto3.client(
             "bedrock-runtime",
              region_name=region,
-             config=Config(read_timeout=3600)
+             # one attempt: the scheduler owns retries (LLM_MAX_RETRIES) and the provider budget
+             config=Config(read_timeout=3600, retries={"total_max_attempts": 1, "mode": "standard"})
             )
 
     def generate(self, prompt: str, max_tokens: int = 500, temperature: float = 0.2, top_p: float = 0.9) -> dict:
@@ -50,7 +53,7 @@ class BedrockLLMProvider:
             )
 
             #extract text response (same as AWS example)
-            content_list = resp["output"]["messages"]["content"]
+            content_list = resp["output"]["message"]["content"]
             text_parts = []
             for content in content_list:
                 if "text" in content:
@@ -58,9 +61,15 @@ class BedrockLLMProvider:
             text = "\n".join(text_parts).strip()
             return {"text": text, "latency_ms": int((time.time() - start) * 1000)}
 
+        except self.client.exceptions.ThrottlingException as e:
+            raise RateLimitError("BEDROCK_THROTTLED", f"Bedrock throttled the request: {e}", 429)
         except Exception as e:
             raise UpstreamError("BEDROCK_CONVERSE_FAILED", f"Bedrock converse failed: {e}", 502)
 
+    async def agenerate(self, prompt: str, max_tokens: int = 500, temperature: float = 0.2, top_p: float = 0.9) -> dict:
+        # boto3 has no async client: run the blocking call off the event loop
+        return await asyncio.to_thread(self.generate, prompt, max_tokens, temperature, top_p)
+
         # body = {
         #     "anthropic_version": "bedrock-2023-05-31",
         #     "max_tokens": max_tokens,
@@ -0,0 +1,58 @@
+import asyncio
+import random
+import time
+
+from app.utils.errors import UpstreamError
+
+
+class FakeLLMProvider:
+    """
+    Local stand-in for an LLM provider. Sleeps for a configurable latency
+    and optionally fails, so routing / hedging can be exercised without Groq or Bedrock.
+    """
+    DISTRIBUTIONS = ("uniform", "normal", "lognormal")
+
+    def __init__(self, latency_ms: int = 200, jitter_ms: int = 0, error_rate: float = 0.0, seed: int | None = None,
+                 distribution: str = "uniform"):
+        if distribution not in self.DISTRIBUTIONS:
+            raise UpstreamError("FAKE_LLM_DIST_INVALID", f"FAKE_LLM_LATENCY_DIST must be one of: {self.DISTRIBUTIONS}", 500)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.distribution = distribution
+        self._rng = random.Random(seed)
+
+    def _delay_s(self) -> float:
+        # uniform: latency +/- jitter; normal: stddev = jitter;
+        # lognormal: median = latency with a long right tail (sigma = jitter / latency), like real LLM APIs
+        if not self.jitter_ms:
+            delay = self.latency_ms
+        elif self.distribution == "normal":
+            delay = self._rng.gauss(self.latency_ms, self.jitter_ms)
+        elif self.distribution == "lognormal":
+            delay = self.latency_ms * self._rng.lognormvariate(0.0, self.jitter_ms / max(1, self.latency_ms))
+        else:
+            delay = self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, delay) / 1000.0
+
+    def _result(self, prompt: str, start: float) -> dict:
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise UpstreamError("FAKE_LLM_ERROR", "Injected fake LLM failure", 502)
+
+        text = f"Fake answer based on the provided context [1]. (prompt_chars={len(prompt)})"
+        return {"text": text, "latency_ms": int((time.time() - start) * 1000)}
+
+    def generate(self, prompt: str, max_tokens: int = 400, temperature: float = 0.2, top_p: float = 1.0) -> dict:
+        """
+        Returns: {"text": "fake answer", "latency_ms": int}
+        """
+        start = time.time()
+        time.sleep(self._delay_s())
+
+        return self._result(prompt, start)
+
+    async def agenerate(self, prompt: str, max_tokens: int = 400, temperature: float = 0.2, top_p: float = 1.0) -> dict:
+        start = time.time()
+        await asyncio.sleep(self._delay_s())
+
+        return self._result(prompt, start)
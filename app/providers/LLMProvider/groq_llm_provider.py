@@ -1,7 +1,7 @@
 import time
-from groq import Groq
+from groq import Groq, AsyncGroq, RateLimitError as GroqRateLimitError
 
-from app.utils.errors import UpstreamError
+from app.utils.errors import UpstreamError, RateLimitError
 
 class GroqLLMProvider:
     def __init__(self, api_key: str, model: str):
@@ -10,7 +10,9 @@ class GroqLLMProvider:
         if not model:
             raise UpstreamError("GROQ_MODEL_NOT_SET", "GROQ_MODEL is not configured", 500)
         
-        self.client = Groq(api_key=api_key)
+        # no SDK retries: the scheduler retries 429s against its own budget (LLM_MAX_RETRIES)
+        self.client = Groq(api_key=api_key, max_retries=0)
+        self.api_key = api_key
         self.model = model
 
     def generate(self, prompt: str, max_tokens: int = 400, temperature: float = 0.2, top_p: float = 1.0) -> dict:
@@ -34,5 +36,45 @@ class GroqLLMProvider:
             text = completion.choices[0].message.content or ""
             latency_ms = int((time.time() - start) * 1000)
             return {"text": text, "latency_ms": latency_ms}
+        except GroqRateLimitError as e:
+            raise RateLimitError("GROQ_RATE_LIMITED", f"Groq rate limit reached: {str(e)}", 429, retry_after=_retry_after(e))
         except Exception as e:
-            raise UpstreamError("GROQ_API_ERROR", f"Error communicating with Groq API: {str(e)}", 500)
\ No newline at end of file
+            raise UpstreamError("GROQ_API_ERROR", f"Error communicating with Groq API: {str(e)}", 500)
+
+    async def agenerate(self, prompt: str, max_tokens: int = 400, temperature: float = 0.2, top_p: float = 1.0) -> dict:
+        """Non-blocking generate for the ASGI serving mode. Same return shape as generate."""
+        start = time.time()
+
+        try:
+            completion = await _async_client(self.api_key).chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                max_completion_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                stream=False
+            )
+            text = completion.choices[0].message.content or ""
+            return {"text": text, "latency_ms": int((time.time() - start) * 1000)}
+        except GroqRateLimitError as e:
+            raise RateLimitError("GROQ_RATE_LIMITED", f"Groq rate limit reached: {str(e)}", 429, retry_after=_retry_after(e))
+        except Exception as e:
+            raise UpstreamError("GROQ_API_ERROR", f"Error communicating with Groq API: {str(e)}", 500)
+
+
+_ASYNC_CLIENTS: dict = {}
+
+def _async_client(api_key: str) -> AsyncGroq:
+    # one httpx connection pool per process instead of one per request
+    if api_key not in _ASYNC_CLIENTS:
+        _ASYNC_CLIENTS[api_key] = AsyncGroq(api_key=api_key, max_retries=0)
+    return _ASYNC_CLIENTS[api_key]
+
+
+def _retry_after(err: GroqRateLimitError) -> float | None:
+    # groq sends seconds in `retry-after`
+    headers = getattr(getattr(err, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
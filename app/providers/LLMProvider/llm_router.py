@@ -0,0 +1,344 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.configs import parse_kv
+from app.Logger.log_main import get_logger
+from app.providers.LLMProvider.llm_scheduler import LLMScheduler, get_scheduler
+from app.utils.errors import AppError, UpstreamError
+from app.utils.metrics import llm_call, timed
+from app.utils.tracing import annotate, traced, tracer
+from app.utils.tokens import estimate_tokens
+
+logger = get_logger()
+
+POLICIES = {"single", "fallback", "hedge"}
+
+# shared per process: routes create a router per request, hedged calls outlive it
+_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per provider, used to learn the hedge threshold."""
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, provider: str, latency_ms: int) -> None:
+        with self._lock:
+            self._samples.setdefault(provider, deque(maxlen=self.window)).append(latency_ms)
+
+    def percentile(self, provider: str, q: float) -> int | None:
+        with self._lock:
+            samples = sorted(self._samples.get(provider, ()))
+        if len(samples) < self.min_samples:
+            return None
+        idx = min(len(samples) - 1, int(round(q / 100.0 * (len(samples) - 1))))
+        return samples[idx]
+
+
+_TRACKER = LatencyTracker()
+
+
+class LLMRouter:
+    """
+    Routes a generate call over an ordered list of providers.
+
+    Policies:
+      - single   : first provider only
+      - fallback : try providers in order, move on when one errors
+      - hedge    : start the first provider; if it has not answered after the learned
+                   p95 latency, fire the next one too and take whichever succeeds first.
+                   Errors fail over immediately. The losing call is cancelled if it has
+                   not started, otherwise its result is ignored.
+    """
+    def __init__(
+        self,
+        providers: List[Tuple[str, Any]],
+        policy: str = "fallback",
+        hedge_default_ms: int = 2000,
+        hedge_min_ms: int = 300,
+        tracker: LatencyTracker | None = None,
+        schedulers: Dict[str, LLMScheduler] | None = None,
+    ):
+        if not providers:
+            raise UpstreamError("LLM_NOT_CONFIGURED", "No LLM provider is configured", 500)
+        if policy not in POLICIES:
+            raise UpstreamError("LLM_POLICY_INVALID", f"LLM routing policy must be one of: {POLICIES}", 500)
+        self.providers = providers
+        self.policy = policy
+        self.hedge_default_ms = hedge_default_ms
+        self.hedge_min_ms = hedge_min_ms
+        self.tracker = tracker or _TRACKER
+        self.schedulers = schedulers or {}
+
+    def hedge_after_ms(self, provider: str) -> int:
+        learned = self.tracker.percentile(provider, 95)
+        threshold = learned if learned is not None else self.hedge_default_ms
+        return max(self.hedge_min_ms, threshold)
+
+    @traced("llm.provider_call")
+    def _call(self, name: str, provider: Any, prompt: str, kwargs: Dict[str, Any], priority: str) -> dict:
+        annotate(**{"llm.provider": name})
+        scheduler = self.schedulers.get(name)
+        if scheduler is None:
+            resp = provider.generate(prompt, **kwargs)
+        else:
+            # completion tokens count against TPM as well
+            tokens = estimate_tokens(prompt) + int(kwargs.get("max_tokens", 0))
+            resp = scheduler.run(lambda: provider.generate(prompt, **kwargs), tokens, priority)
+        self.tracker.observe(name, resp["latency_ms"])
+        return resp
+
+    @traced("llm.generate", lambda r: {"llm.provider": r["provider"], "llm.hedged": r["hedged"], "llm.completion_tokens": estimate_tokens(r["text"])})
+    @timed("llm")
+    def generate(self, prompt: str, priority: str = "interactive", **kwargs) -> dict:
+        """
+        Same contract as the providers, plus routing info.
+        priority: "interactive" or "batch" (only used when providers are scheduled)
+        Returns: {"text": str, "latency_ms": int, "provider": str, "hedged": bool}
+        """
+        start = time.time()
+        annotate(**{"llm.policy": self.policy, "llm.prompt_tokens": estimate_tokens(prompt), "llm.max_tokens": kwargs.get("max_tokens"), "llm.priority": priority})
+        if self.policy == "hedge" and len(self.providers) > 1:
+            name, resp, hedged = self._generate_hedged(prompt, kwargs, priority)
+        else:
+            name, resp, hedged = self._generate_sequential(prompt, kwargs, priority)
+
+        logger.info("llm_routed", extra={"provider": name, "policy": self.policy, "hedged": hedged, "latency_ms": resp["latency_ms"]})
+        llm_call(name, estimate_tokens(prompt), estimate_tokens(resp["text"]), resp["latency_ms"], hedged)
+        return {**resp, "latency_ms": int((time.time() - start) * 1000), "provider": name, "hedged": hedged}
+
+    def _generate_sequential(self, prompt: str, kwargs: Dict[str, Any], priority: str):
+        candidates = self.providers[:1] if self.policy == "single" else self.providers
+        last_err: Exception | None = None
+        for name, provider in candidates:
+            try:
+                return name, self._call(name, provider, prompt, kwargs, priority), False
+            except Exception as e:
+                last_err = e
+                logger.warning("llm_provider_failed", extra={"provider": name, "error_code": getattr(e, "code", None)})
+        raise _as_upstream(last_err)
+
+    def _generate_hedged(self, prompt: str, kwargs: Dict[str, Any], priority: str):
+        pending: Dict[Any, str] = {}
+        queue = list(self.providers)
+        last_err: Exception | None = None
+        hedged = False
+
+        def launch():
+            name, provider = queue.pop(0)
+            # copy the context so the provider span is parented to this request's trace
+            ctx = contextvars.copy_context()
+            pending[_EXECUTOR.submit(ctx.run, self._call, name, provider, prompt, kwargs, priority)] = name
+
+        launch()
+        first_name = self.providers[0][0]
+        timeout_s = self.hedge_after_ms(first_name) / 1000.0
+
+        while pending:
+            done, _ = wait(list(pending), timeout=timeout_s, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # primary is slower than its p95: hedge with the next provider, then wait for either
+                if queue:
+                    launch()
+                    hedged = True
+                timeout_s = None
+                continue
+
+            for fut in done:
+                name = pending.pop(fut)
+                try:
+                    resp = fut.result()
+                except Exception as e:
+                    last_err = e
+                    logger.warning("llm_provider_failed", extra={"provider": name, "error_code": getattr(e, "code", None)})
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                return name, resp, hedged
+
+            # everything that finished failed: fail over right away
+            if queue and not pending:
+                launch()
+                timeout_s = None
+
+        raise _as_upstream(last_err)
+
+
+    # ---- async (ASGI serving mode) ----
+    @traced("llm.provider_call")
+    async def _acall(self, name: str, provider: Any, prompt: str, kwargs: Dict[str, Any], priority: str) -> dict:
+        annotate(**{"llm.provider": name})
+        agenerate = getattr(provider, "agenerate", None)
+        if agenerate is None:
+            acall = lambda: asyncio.to_thread(provider.generate, prompt, **kwargs)
+        else:
+            acall = lambda: agenerate(prompt, **kwargs)
+
+        scheduler = self.schedulers.get(name)
+        if scheduler is None:
+            resp = await acall()
+        else:
+            tokens = estimate_tokens(prompt) + int(kwargs.get("max_tokens", 0))
+            resp = await scheduler.arun(acall, tokens, priority)
+        self.tracker.observe(name, resp["latency_ms"])
+        return resp
+
+    @traced("llm.generate", lambda r: {"llm.provider": r["provider"], "llm.hedged": r["hedged"], "llm.completion_tokens": estimate_tokens(r["text"])})
+    @timed("llm")
+    async def agenerate(self, prompt: str, priority: str = "interactive", **kwargs) -> dict:
+        """Async twin of generate(). Hedged losers are really cancelled here, not just ignored."""
+        start = time.time()
+        annotate(**{"llm.policy": self.policy, "llm.prompt_tokens": estimate_tokens(prompt), "llm.max_tokens": kwargs.get("max_tokens"), "llm.priority": priority})
+        if self.policy == "hedge" and len(self.providers) > 1:
+            name, resp, hedged = await self._agenerate_hedged(prompt, kwargs, priority)
+        else:
+            name, resp, hedged = await self._agenerate_sequential(prompt, kwargs, priority)
+
+        logger.info("llm_routed", extra={"provider": name, "policy": self.policy, "hedged": hedged, "latency_ms": resp["latency_ms"]})
+        llm_call(name, estimate_tokens(prompt), estimate_tokens(resp["text"]), resp["latency_ms"], hedged)
+        return {**resp, "latency_ms": int((time.time() - start) * 1000), "provider": name, "hedged": hedged}
+
+    async def _agenerate_sequential(self, prompt: str, kwargs: Dict[str, Any], priority: str):
+        candidates = self.providers[:1] if self.policy == "single" else self.providers
+        last_err: Exception | None = None
+        for name, provider in candidates:
+            try:
+                return name, await self._acall(name, provider, prompt, kwargs, priority), False
+            except Exception as e:
+                last_err = e
+                logger.warning("llm_provider_failed", extra={"provider": name, "error_code": getattr(e, "code", None)})
+        raise _as_upstream(last_err)
+
+    async def _agenerate_hedged(self, prompt: str, kwargs: Dict[str, Any], priority: str):
+        pending: Dict[asyncio.Task, str] = {}
+        queue = list(self.providers)
+        last_err: Exception | None = None
+        hedged = False
+
+        def launch():
+            name, provider = queue.pop(0)
+            pending[asyncio.create_task(self._acall(name, provider, prompt, kwargs, priority))] = name
+
+        launch()
+        timeout_s = self.hedge_after_ms(self.providers[0][0]) / 1000.0
+
+        try:
+            while pending:
+                done, _ = await asyncio.wait(list(pending), timeout=timeout_s, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    if queue:
+                        launch()
+                        hedged = True
+                    timeout_s = None
+                    continue
+
+                for task in done:
+                    name = pending.pop(task)
+                    try:
+                        resp = task.result()
+                    except Exception as e:
+                        last_err = e
+                        logger.warning("llm_provider_failed", extra={"provider": name, "error_code": getattr(e, "code", None)})
+                        continue
+                    return name, resp, hedged
+
+                if queue and not pending:
+                    launch()
+                    timeout_s = None
+        finally:
+            # cancel whichever call lost the race (or everything, if we were cancelled)
+            for task in pending:
+                task.cancel()
+
+        raise _as_upstream(last_err)
+
+
+def _as_upstream(err: Exception | None) -> AppError:
+    if isinstance(err, AppError):
+        return err
+    return UpstreamError("LLM_ALL_PROVIDERS_FAILED", f"All LLM providers failed: {err}", 502)
+
+
+def _provider_factories(cfg) -> Dict[str, Callable[[str], Any]]:
+    def groq(_spec):
+        from app.providers.LLMProvider.groq_llm_provider import GroqLLMProvider
+        return GroqLLMProvider(cfg.groq_api_key, cfg.groq_model)
+
+    def bedrock(_spec):
+        from app.providers.LLMProvider.bedrock_llm_provider import BedrockLLMProvider
+        return BedrockLLMProvider(cfg.aws_region, cfg.bedrock_model_id)
+
+    def fake(spec):
+        # "fake" or "fake:<latency_ms>" so two fakes with different delays can be routed
+        from app.providers.LLMProvider.fake_llm_provider import FakeLLMProvider
+        _, _, latency = spec.partition(":")
+        return FakeLLMProvider(
+            latency_ms=int(latency or cfg.fake_llm_latency_ms),
+            jitter_ms=cfg.fake_llm_jitter_ms,
+            error_rate=cfg.fake_llm_error_rate,
+            distribution=cfg.fake_llm_latency_dist,
+        )
+
+    return {"groq": groq, "bedrock": bedrock, "fake": fake}
+
+
+_PROVIDERS: Dict[str, Any] = {}
+_PROVIDERS_LOCK = threading.Lock()
+
+
+def get_provider(cfg, spec: str) -> Any:
+    """
+    One provider instance per spec per process, like get_scheduler: the Groq / boto3 clients and
+    their connection pools are built once, not on every request. A provider that is not
+    configured is remembered as its AppError (config does not change within a process).
+    """
+    with _PROVIDERS_LOCK:
+        if spec not in _PROVIDERS:
+            factories = _provider_factories(cfg)
+            kind = spec.split(":", 1)[0].lower()
+            if kind not in factories:
+                raise UpstreamError("LLM_PROVIDER_UNKNOWN", f"Unknown LLM provider '{spec}'", 500)
+            try:
+                _PROVIDERS[spec] = factories[kind](spec)
+            except AppError as e:
+                _PROVIDERS[spec] = e
+        return _PROVIDERS[spec]
+
+
+def build_llm_router(cfg, endpoint: str) -> LLMRouter:
+    """
+    Build the router for an endpoint from config.
+    Providers that are not configured (e.g. no BEDROCK_MODEL_ID) are skipped;
+    if none can be built the first configuration error is raised.
+    """
+    providers: List[Tuple[str, Any]] = []
+    first_err: AppError | None = None
+
+    for spec in [s.strip() for s in cfg.llm_providers.split(",") if s.strip()]:
+        provider = get_provider(cfg, spec)
+        if isinstance(provider, AppError):
+            first_err = first_err or provider
+        else:
+            providers.append((spec, provider))
+
+    if not providers and first_err:
+        raise first_err
+
+    policy = parse_kv(cfg.llm_route_policies).get(endpoint, cfg.llm_default_policy)
+    return LLMRouter(
+        providers,
+        policy=policy,
+        hedge_default_ms=cfg.llm_hedge_default_ms,
+        hedge_min_ms=cfg.llm_hedge_min_ms,
+        schedulers={name: get_scheduler(cfg, name) for name, _ in providers},
+    )
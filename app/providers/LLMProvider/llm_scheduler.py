@@ -0,0 +1,291 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict
+
+from app.configs import parse_kv
+from app.Logger.log_main import get_logger
+from app.utils.errors import RateLimitError, UpstreamError
+
+logger = get_logger()
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+WINDOW_S = 60.0
+
+
+class LLMScheduler:
+    """
+    Admission control in front of one LLM provider.
+
+    - meters calls against requests-per-minute and tokens-per-minute budgets (0 = unlimited)
+    - callers queue by priority (interactive before batch), FIFO within a priority
+    - a 429 blocks the provider for `retry-after` seconds and the call is retried
+    - repeated failures open a circuit breaker; after the cooldown one probe call is let through
+    """
+    def __init__(
+        self,
+        name: str,
+        rpm: int = 0,
+        tpm: int = 0,
+        queue_timeout_s: float = 30.0,
+        max_retries: int = 2,
+        retry_after_default_s: float = 2.0,
+        breaker_failures: int = 5,
+        breaker_cooldown_s: float = 30.0,
+    ):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.queue_timeout_s = queue_timeout_s
+        self.max_retries = max_retries
+        self.retry_after_default_s = retry_after_default_s
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown_s = breaker_cooldown_s
+
+        self._cond = threading.Condition()
+        self._queue: list = []
+        self._seq = itertools.count()
+        self._calls: deque = deque()  # (admitted_at, tokens) within the last minute
+        self._blocked_until = 0.0
+        self._failures = 0
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self._async_waiters: set = set()
+
+    # ---- budget ----
+    def _budget_wait(self, now: float, tokens: int) -> float:
+        while self._calls and self._calls[0][0] <= now - WINDOW_S:
+            self._calls.popleft()
+
+        wait = max(0.0, self._blocked_until - now)
+        if self.rpm and len(self._calls) >= self.rpm:
+            wait = max(wait, self._calls[0][0] + WINDOW_S - now)
+
+        if self.tpm and self._calls:
+            used = sum(t for _, t in self._calls)
+            # wait until enough old calls fall out of the window to fit this one
+            for admitted_at, t in self._calls:
+                if used + tokens <= self.tpm:
+                    break
+                used -= t
+                wait = max(wait, admitted_at + WINDOW_S - now)
+        return wait
+
+    # ---- circuit breaker ----
+    def _check_circuit(self, now: float) -> bool:
+        """Returns True when this call is the half-open probe."""
+        if self._failures < self.breaker_failures:
+            return False
+        if now < self._open_until or self._probe_in_flight:
+            raise UpstreamError("LLM_CIRCUIT_OPEN", f"LLM provider '{self.name}' is temporarily disabled after repeated failures", 503)
+        self._probe_in_flight = True
+        return True
+
+    def _record(self, ok: bool) -> None:
+        with self._cond:
+            self._probe_in_flight = False
+            if ok:
+                self._failures = 0
+                return
+            self._failures += 1
+            if self._failures >= self.breaker_failures:
+                self._open_until = time.time() + self.breaker_cooldown_s
+                logger.warning("llm_circuit_open", extra={"provider": self.name})
+
+    # ---- queueing ----
+    def _notify(self) -> None:
+        # caller holds _cond: wakes thread waiters and the event-loop waiters of arun()
+        self._cond.notify_all()
+        for loop, event in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # loop already closed
+                pass
+
+    def _enqueue(self, priority: int) -> tuple:
+        # caller holds _cond
+        probe = self._check_circuit(time.time())
+        ticket = (priority, next(self._seq))
+        heapq.heappush(self._queue, ticket)
+        return probe, ticket
+
+    def _try_admit(self, ticket: tuple, tokens: int, deadline: float) -> float:
+        """Caller holds _cond. 0 when the call is admitted, else how long to wait before checking again."""
+        now = time.time()
+        remaining = deadline - now
+        wait = remaining
+        if self._queue[0] == ticket:
+            wait = self._budget_wait(now, tokens)
+            if wait <= 0:
+                heapq.heappop(self._queue)
+                self._calls.append((now, tokens))
+                return 0.0
+        if remaining <= 0:
+            raise RateLimitError(
+                "LLM_RATE_LIMITED",
+                f"LLM provider '{self.name}' is at its rate limit, try again later",
+                429,
+                retry_after=max(wait, 1.0),
+            )
+        return min(wait, remaining)
+
+    def _abandon(self, probe: bool, ticket: tuple) -> None:
+        # caller holds _cond: a waiter that timed out, failed or was cancelled before admission
+        if probe:
+            self._probe_in_flight = False
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+
+    def _acquire(self, tokens: int, priority: int) -> bool:
+        """Blocks until the call may proceed. Returns True when it is the circuit breaker probe."""
+        deadline = time.time() + self.queue_timeout_s
+        with self._cond:
+            probe, ticket = self._enqueue(priority)
+            try:
+                while True:
+                    wait = self._try_admit(ticket, tokens, deadline)
+                    if not wait:
+                        return probe
+                    self._cond.wait(wait)
+            except BaseException:
+                self._abandon(probe, ticket)
+                raise
+            finally:
+                self._notify()
+
+    async def _aacquire(self, tokens: int, priority: int) -> bool:
+        """
+        _acquire() on the event loop: no executor thread is parked for the wait, and a waiter
+        cancelled before admission (hedged loser, client gone) leaves the queue, takes no budget
+        slot and releases the half-open probe.
+        """
+        deadline = time.time() + self.queue_timeout_s
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            probe, ticket = self._enqueue(priority)
+            self._async_waiters.add(waiter)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_admit(ticket, tokens, deadline)
+                    if not wait:
+                        return probe
+                    # cleared under the lock: a notify after this point is not lost
+                    waiter[1].clear()
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._cond:
+                self._abandon(probe, ticket)
+            raise
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+                self._notify()
+
+    def _block_for(self, retry_after: float | None) -> None:
+        with self._cond:
+            delay = retry_after if retry_after is not None else self.retry_after_default_s
+            self._blocked_until = max(self._blocked_until, time.time() + delay)
+            self._notify()
+
+    def run(self, call: Callable[[], dict], tokens: int, priority: str = "interactive") -> dict:
+        prio = PRIORITIES.get(priority, PRIORITIES["interactive"])
+        attempts = 0
+        while True:
+            probe = self._acquire(tokens, prio)
+            try:
+                resp = call()
+            except RateLimitError as e:
+                self._block_for(e.retry_after)
+                attempts += 1
+                logger.warning("llm_rate_limited", extra={"provider": self.name, "error_code": e.code})
+                if attempts > self.max_retries or probe:
+                    self._record(False)
+                    raise
+                continue
+            except Exception:
+                self._record(False)
+                raise
+            self._record(True)
+            return resp
+
+    async def arun(self, acall: Callable[[], Awaitable[dict]], tokens: int, priority: str = "interactive") -> dict:
+        """Async twin of run(): admission waits and the call itself both happen on the loop."""
+        prio = PRIORITIES.get(priority, PRIORITIES["interactive"])
+        attempts = 0
+        while True:
+            probe = await self._aacquire(tokens, prio)
+            try:
+                resp = await acall()
+            except RateLimitError as e:
+                self._block_for(e.retry_after)
+                attempts += 1
+                logger.warning("llm_rate_limited", extra={"provider": self.name, "error_code": e.code})
+                if attempts > self.max_retries or probe:
+                    self._record(False)
+                    raise
+                continue
+            except asyncio.CancelledError:
+                # hedged loser cancelled by the router: not a provider failure
+                self._record_cancelled(probe)
+                raise
+            except Exception:
+                self._record(False)
+                raise
+            self._record(True)
+            return resp
+
+    def _record_cancelled(self, probe: bool) -> None:
+        if probe:
+            with self._cond:
+                self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = time.time()
+            self._budget_wait(now, 0)
+            return {
+                "provider": self.name,
+                "queued": len(self._queue),
+                "calls_last_minute": len(self._calls),
+                "tokens_last_minute": sum(t for _, t in self._calls),
+                "blocked_for_s": round(max(0.0, self._blocked_until - now), 2),
+                "circuit_open": self._failures >= self.breaker_failures and now < self._open_until,
+            }
+
+
+_SCHEDULERS: Dict[str, LLMScheduler] = {}
+_LOCK = threading.Lock()
+
+
+def get_scheduler(cfg, name: str) -> LLMScheduler:
+    """One scheduler per provider per process, so budgets are shared by every request in the worker."""
+    with _LOCK:
+        if name not in _SCHEDULERS:
+            kind = name.split(":", 1)[0]
+            rpm = parse_kv(cfg.llm_rpm_limits)
+            tpm = parse_kv(cfg.llm_tpm_limits)
+            _SCHEDULERS[name] = LLMScheduler(
+                name,
+                rpm=int(rpm.get(name, rpm.get(kind, 0))),
+                tpm=int(tpm.get(name, tpm.get(kind, 0))),
+                queue_timeout_s=cfg.llm_queue_timeout_s,
+                max_retries=cfg.llm_max_retries,
+                retry_after_default_s=cfg.llm_retry_after_default_s,
+                breaker_failures=cfg.llm_breaker_failures,
+                breaker_cooldown_s=cfg.llm_breaker_cooldown_s,
+            )
+        return _SCHEDULERS[name]
+
+
+def scheduler_stats() -> list[dict]:
+    with _LOCK:
+        schedulers = list(_SCHEDULERS.values())
+    return [s.stats() for s in schedulers]
@@ -0,0 +1,148 @@
+"""
+Document-level vectors in the docs index (ES_INDEX_DOCS, `rag_documents`) and the first stage of
+two-stage retrieval.
+
+Ingest writes one entry per document whose `doc_embedding` is the mean of its chunk vectors,
+re-normalised. With RETRIEVAL_MODE=two_stage (or `"mode": "two_stage"` in a request) a query first
+picks the tenant's top RETRIEVAL_DOC_TOP_M documents by kNN on that field; BM25 and vector chunk
+search then only score chunks of those documents (`terms` filter on doc_id).
+
+The first stage fails open: no doc entries for the tenant yet (corpus ingested before this
+existed), a vector from another model, or an ES error all mean "search every chunk", never an
+empty answer.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from elasticsearch import Elasticsearch, AsyncElasticsearch
+from app.Logger.log_main import get_logger
+from app.utils.errors import ValidationError
+from app.utils.metrics import es_call, es_error, timed
+from app.utils.tracing import annotate, traced
+
+logger = get_logger()
+
+RETRIEVAL_MODES = ("chunks", "two_stage")
+PREVIEW_CHARS = 1000
+
+
+def doc_embedding(chunk_vecs: np.ndarray) -> np.ndarray:
+    """Mean of the (unit) chunk vectors, scaled back to unit length for cosine kNN."""
+    mean = np.asarray(chunk_vecs, dtype=np.float32).mean(axis=0)
+    norm = float(np.linalg.norm(mean))
+    return mean / norm if norm else mean
+
+
+def doc_entry_id(tenant: str, doc_id: str) -> str:
+    return f"{tenant}:{doc_id}"
+
+
+def retrieval_mode(cfg, requested: str | None = None) -> str:
+    """Request `mode` over RETRIEVAL_MODE."""
+    mode = (requested or cfg.retrieval_mode or "chunks").strip().lower()
+    if mode not in RETRIEVAL_MODES:
+        raise ValidationError("INVALID_RETRIEVAL_MODE", f"'mode' must be one of {', '.join(RETRIEVAL_MODES)}, got '{mode}'", 400)
+    return mode
+
+
+def doc_knn_body(tenant: str, query_vec: np.ndarray, top_m: int, num_candidates: int, embed_model: str,
+                 filters: List[Dict[str, Any]] | None = None) -> Dict[str, Any]:
+    # entries carry the model that built them: after a model change (reindex) until re-ingest,
+    # old entries are skipped rather than compared with a vector from another space.
+    # `filters`: metadata conditions on meta_kv (metadata_filters.doc_clauses), so the top-M
+    # documents are picked among the ones the chunk filters will let through
+    return {
+        "size": top_m,
+        "knn": {
+            "field": "doc_embedding",
+            "query_vector": query_vec,
+            "k": top_m,
+            "num_candidates": max(num_candidates, top_m),
+            "filter": [{"term": {"tenant": tenant}}, {"term": {"embed_model": embed_model}}, *(filters or [])],
+        },
+        "_source": ["doc_id"],
+    }
+
+
+def _doc_ids(res: Dict[str, Any]) -> List[str]:
+    return [h["_source"]["doc_id"] for h in res.get("hits", {}).get("hits", [])]
+
+
+class DocIndex:
+    def __init__(self, client: Elasticsearch, index_name: str, top_m: int = 20, num_candidates: int = 100):
+        self.client = client
+        self.index_name = index_name
+        self.top_m = top_m
+        self.num_candidates = num_candidates
+
+    @traced("es.index_doc")
+    @timed("index")
+    def upsert_doc(self, tenant: str, doc_id: str, record: Dict[str, Any], chunk_vecs: np.ndarray,
+                   embed_model: str, text: str = "", meta_kv: List[Dict[str, Any]] | None = None) -> Optional[str]:
+        """
+        Write the doc-level entry after the chunks are in. A failure is logged, not raised: the
+        chunks are searchable either way and two-stage queries fall back to all chunks.
+        """
+        entry_id = doc_entry_id(tenant, doc_id)
+        document = {
+            "tenant": tenant,
+            "doc_id": doc_id,
+            "filename": record.get("filename"),
+            "s3_key": record.get("s3_key"),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "embed_model": embed_model,
+            "doc_embedding": doc_embedding(chunk_vecs),
+            "doc_text_preview": text[:PREVIEW_CHARS],
+            "meta_kv": meta_kv or [],
+        }
+        try:
+            self.client.index(index=self.index_name, id=entry_id, document=document, refresh=True)
+        except Exception as e:
+            es_error("index")
+            logger.warning("doc_index_failed", extra={"error_code": type(e).__name__, "path": self.index_name})
+            return None
+        return entry_id
+
+    @traced("es.doc_search", lambda ids: {"docs": len(ids or [])})
+    @timed("doc_search")
+    def top_docs(self, tenant: str, query_vec: np.ndarray, embed_model: str,
+                 filters: List[Dict[str, Any]] | None = None) -> Optional[List[str]]:
+        """doc_ids of the tenant's closest documents; None means "no restriction" (fail open)."""
+        body = doc_knn_body(tenant, query_vec, self.top_m, self.num_candidates, embed_model, filters)
+        try:
+            res = self.client.search(index=self.index_name, body=body)
+        except Exception as e:
+            es_error("doc_search")
+            logger.warning("doc_search_failed", extra={"error_code": type(e).__name__, "path": self.index_name})
+            return None
+        ids = _doc_ids(res)
+        es_call("doc_search", res.get("took"), len(ids))
+        annotate(**{"es.index": self.index_name, "es.took_ms": res.get("took"), "top_m": self.top_m})
+        return ids or None
+
+
+class AsyncDocIndex:
+    """Query side of DocIndex on AsyncElasticsearch, used by the ASGI serving mode."""
+    def __init__(self, client: AsyncElasticsearch, index_name: str, top_m: int = 20, num_candidates: int = 100):
+        self.client = client
+        self.index_name = index_name
+        self.top_m = top_m
+        self.num_candidates = num_candidates
+
+    @traced("es.doc_search", lambda ids: {"docs": len(ids or [])})
+    @timed("doc_search")
+    async def top_docs(self, tenant: str, query_vec: np.ndarray, embed_model: str,
+                       filters: List[Dict[str, Any]] | None = None) -> Optional[List[str]]:
+        body = doc_knn_body(tenant, query_vec, self.top_m, self.num_candidates, embed_model, filters)
+        try:
+            res = await self.client.search(index=self.index_name, body=body)
+        except Exception as e:
+            es_error("doc_search")
+            logger.warning("doc_search_failed", extra={"error_code": type(e).__name__, "path": self.index_name})
+            return None
+        ids = _doc_ids(res)
+        es_call("doc_search", res.get("took"), len(ids))
+        annotate(**{"es.index": self.index_name, "es.took_ms": res.get("took"), "top_m": self.top_m})
+        return ids or None
@@ -1,15 +1,68 @@
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, AsyncElasticsearch
+from elasticsearch.serializer import NdjsonSerializer
 from app.Logger.log_main import get_logger
+from app.providers.SearchProvider.memory_es import async_memory_client, is_memory_url, memory_client
+
+try:
+    import orjson
+    from elasticsearch.serializer import OrjsonSerializer
+except ImportError:  # orjson is optional: the client's stdlib json serialisers are used instead
+    orjson = None
 
 logger = get_logger()
 
+
+if orjson is not None:
+    class OrjsonNdjsonSerializer(NdjsonSerializer):
+        """Bulk bodies through orjson, which writes float32 arrays from their buffer."""
+        def json_dumps(self, data):
+            return orjson.dumps(data, default=self.default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+        def json_loads(self, data):
+            return orjson.loads(data)
+
+
+def serializers() -> dict:
+    """
+    orjson for JSON and NDJSON bodies when it is installed. Vectors arrive as float32 NumPy arrays
+    (embedding_provider.as_vector): the stdlib encoder would box each dim and print it with float64
+    precision, orjson serialises the array natively at float32's shortest round-trip repr.
+    """
+    if orjson is None:
+        return {}
+    # the client maps these onto the compatibility-mode mimetypes as well
+    return {"application/json": OrjsonSerializer(), "application/x-ndjson": OrjsonNdjsonSerializer()}
+
+
 class ESClient:
     def __init__(self, es_url : str):
-        self.client = Elasticsearch(es_url)
+        # memory://<name> is the in-process stand-in used by bench/load_harness.py
+        self.client = memory_client(es_url) if is_memory_url(es_url) else Elasticsearch(es_url, serializers=serializers())
     
     def ping(self) -> bool:
         try:
             return bool(self.client.ping())
         except Exception as e:
             logger.warning("Elasticsearch ping failed", extra={"error": str(e)})
-            return False
\ No newline at end of file
+            return False
+
+
+_ASYNC_CLIENTS: dict = {}
+
+def get_async_es(es_url: str) -> AsyncElasticsearch:
+    """
+    One AsyncElasticsearch per URL per process (keeps the connection pool warm).
+    Uses the httpx transport so no extra aiohttp dependency is needed.
+    """
+    if es_url not in _ASYNC_CLIENTS:
+        if is_memory_url(es_url):
+            _ASYNC_CLIENTS[es_url] = async_memory_client(es_url)
+        else:
+            _ASYNC_CLIENTS[es_url] = AsyncElasticsearch(es_url, node_class="httpxasync", serializers=serializers())
+    return _ASYNC_CLIENTS[es_url]
+
+
+async def close_async_es() -> None:
+    for client in _ASYNC_CLIENTS.values():
+        await client.close()
+    _ASYNC_CLIENTS.clear()
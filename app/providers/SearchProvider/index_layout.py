@@ -0,0 +1,67 @@
+import hashlib
+import re
+from typing import List, Optional, Tuple
+
+_UNSAFE = re.compile(r"[^a-z0-9_-]+")
+
+
+class IndexLayout:
+    """
+    Where a tenant's chunks live in Elasticsearch.
+
+    - shared index (ES_INDEX_CHUNKS) with ES_CHUNK_SHARDS primaries; with ES_TENANT_ROUTING every
+      read / write carries `routing=<tenant>`, so a tenant's chunks sit on one shard and each query
+      fans out to that shard only
+    - tenants in ES_DEDICATED_TENANTS get their own index, addressed through an alias
+      (`<ES_INDEX_CHUNKS>-t-<tenant>`) so it can later be rebuilt and swapped underneath
+
+    The shared name is a read alias; writes go through ES_INDEX_CHUNKS_WRITE. Both point at one
+    versioned physical index (`<name>-v<N>`) except while a reindex swaps them (see reindex.py).
+    """
+    def __init__(self, base_index: str, routing: bool = False, dedicated_tenants: Tuple[str, ...] = (),
+                 write_alias: str = ""):
+        self.base_index = base_index
+        self.routing = routing
+        self.dedicated_tenants = frozenset(dedicated_tenants)
+        self.write_alias = write_alias or f"{base_index}-write"
+
+    @classmethod
+    def from_cfg(cls, cfg) -> "IndexLayout":
+        tenants = tuple(t.strip() for t in cfg.es_dedicated_tenants.split(",") if t.strip())
+        return cls(cfg.index_chunks, cfg.es_tenant_routing, tenants, cfg.index_chunks_write)
+
+    def dedicated_index(self, tenant: str) -> str:
+        # index names must be lowercase and free of most punctuation; the hash keeps distinct
+        # tenants that normalise to the same slug apart
+        slug = _UNSAFE.sub("_", tenant.lower())[:40]
+        digest = hashlib.sha1(tenant.encode("utf-8")).hexdigest()[:8]
+        return f"{self.base_index}-t-{slug}-{digest}"
+
+    def index_for(self, tenant: str) -> str:
+        if tenant in self.dedicated_tenants:
+            return self.dedicated_index(tenant)
+        return self.base_index
+
+    def routing_for(self, tenant: str) -> Optional[str]:
+        # a dedicated index holds one tenant: routing would only skew its shards
+        if self.routing and tenant not in self.dedicated_tenants:
+            return tenant
+        return None
+
+    def target(self, tenant: str) -> Tuple[str, Optional[str]]:
+        return self.index_for(tenant), self.routing_for(tenant)
+
+    def aliases_of(self, name: str) -> List[str]:
+        """Every alias that moves with a read alias when its physical index is replaced."""
+        return [name, self.write_alias] if name == self.base_index else [name]
+
+    def write_name(self, name: str) -> str:
+        return self.write_alias if name == self.base_index else name
+
+    def dedicated_indices(self) -> List[str]:
+        return [self.dedicated_index(t) for t in sorted(self.dedicated_tenants)]
+
+
+def tenant_of(es_doc_id: str) -> str:
+    """Tenant prefix of a chunk id built as `<tenant>:<doc_id>:<chunk_id>`."""
+    return es_doc_id.rsplit(":", 2)[0]
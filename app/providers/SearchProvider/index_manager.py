@@ -1,24 +1,86 @@
 from elasticsearch import Elasticsearch
 
+from app.configs import parse_kv
+from app.providers.SearchProvider.index_layout import IndexLayout
+from app.providers.SearchProvider.index_versions import index_meta, next_version_name, physical_indices
+from app.utils.errors import UpstreamError
+from app.utils.metadata_filters import META_DYNAMIC_TEMPLATES
+
+VECTOR_TYPES = ("hnsw", "int8_hnsw", "int4_hnsw", "bbq_hnsw")
+# first ES release that accepts the index_options type; older clusters reject the mapping
+VECTOR_TYPE_MIN_ES = {"bbq_hnsw": (8, 16)}
+
+# How a chunk index stores its vectors and text (ES_CHUNK_STORAGE):
+# - vector_in_source=False keeps the float vector out of `_source`; kNN and script_score read the
+#   indexed vector, so searches are unaffected. The JSON floats are most of a chunk's `_source`.
+#   A reindex from `_source` (index_migration) then has nothing to copy: use reindex.py instead
+# - int4 halves int8's quantised vectors again; bbq keeps 1 bit per dim and rescores the top hits
+# - best_compression switches stored fields (chunk_text) from LZ4 to DEFLATE
+STORAGE_PROFILES = {
+    "default": {"vector_type": "int8_hnsw", "vector_in_source": True, "codec": "default"},
+    "compact": {"vector_type": "int8_hnsw", "vector_in_source": False, "codec": "best_compression"},
+    "compact_int4": {"vector_type": "int4_hnsw", "vector_in_source": False, "codec": "best_compression"},
+    "compact_bbq": {"vector_type": "bbq_hnsw", "vector_in_source": False, "codec": "best_compression"},
+}
+
+
+def storage_profile(name: str, vector_type: str = "") -> dict:
+    if name not in STORAGE_PROFILES:
+        raise UpstreamError("ES_CHUNK_STORAGE_INVALID", f"ES_CHUNK_STORAGE must be one of {', '.join(STORAGE_PROFILES)}, got '{name}'", 500)
+    profile = {**STORAGE_PROFILES[name], **({"vector_type": vector_type} if vector_type else {})}
+    if profile["vector_type"] not in VECTOR_TYPES:
+        raise UpstreamError("ES_VECTOR_INDEX_TYPE_INVALID", f"ES_VECTOR_INDEX_TYPE must be one of {', '.join(VECTOR_TYPES)}, got '{vector_type}'", 500)
+    return profile
+
+
 class IndexManager:
-    def __init__(self, client: Elasticsearch, index_name: str, embedding_dim: int):
+    def __init__(self, client: Elasticsearch, index_name: str, embedding_dim: int, doc_index_name: str | None = None,
+                 layout: IndexLayout | None = None, shards: int = 1, replicas: int = 0,
+                 hnsw_m: int = 16, hnsw_ef_construction: int = 100, meta: dict | None = None,
+                 storage: str = "default", vector_type: str = ""):
         self.client = client
         self.index_name = index_name
         self.embedding_dim = embedding_dim
+        self.doc_index_name = doc_index_name
+        self.layout = layout or IndexLayout(index_name)
+        self.shards = shards
+        self.replicas = replicas
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        # recorded in the chunk mapping's _meta: which model built the vectors (see index_versions)
+        self.meta = meta or {}
+        self.storage = storage_profile(storage, vector_type)
 
-    
-    def ensure_chunks_index(self) -> None:
-        if self.client.indices.exists(index=self.index_name):
-            return
-        
+    @classmethod
+    def from_cfg(cls, client: Elasticsearch, cfg) -> "IndexManager":
+        return cls(client, cfg.index_chunks, cfg.embedding_dim, cfg.index_docs,
+                   layout=IndexLayout.from_cfg(cfg), shards=cfg.es_chunk_shards, replicas=cfg.es_chunk_replicas,
+                   hnsw_m=cfg.es_hnsw_m, hnsw_ef_construction=cfg.es_hnsw_ef_construction,
+                   meta=index_meta(cfg.embed_model_name, parse_kv(cfg.embed_tenant_models), cfg.embedding_dim),
+                   storage=cfg.es_chunk_storage, vector_type=cfg.es_vector_index_type)
+
+    def vector_index_options(self) -> dict:
+        vector_type = self.storage["vector_type"]
+        # int4 packs two dims per byte; bbq needs enough dims for its 1-bit codes to rank usefully
+        if vector_type == "int4_hnsw" and self.embedding_dim % 2:
+            raise UpstreamError("ES_VECTOR_INDEX_TYPE_INVALID", f"int4_hnsw needs an even dim count, got {self.embedding_dim}", 500)
+        if vector_type == "bbq_hnsw" and self.embedding_dim < 64:
+            raise UpstreamError("ES_VECTOR_INDEX_TYPE_INVALID", f"bbq_hnsw needs at least 64 dims, got {self.embedding_dim}", 500)
+        return {"type": vector_type, "m": self.hnsw_m, "ef_construction": self.hnsw_ef_construction}
+
+    def chunks_index_body(self, routing_required: bool = False, aliases: dict | None = None) -> dict:
         mapping = {
             "settings": {
                 "index": {
-                    "number_of_shards": 1,
-                    "number_of_replicas": 0
+                    "number_of_shards": self.shards,
+                    "number_of_replicas": self.replicas,
+                    "codec": self.storage["codec"],
                 }
             },
             "mappings": {
+                "_meta": self.meta,
+                # document metadata denormalised onto chunks (meta_str.* / meta_num.* / ...)
+                "dynamic_templates": META_DYNAMIC_TEMPLATES,
                 "properties": {
                     "tenant": {"type": "keyword"},
                     "scope": {"type": "keyword"},
@@ -32,17 +94,65 @@ class IndexManager:
                         "dims": self.embedding_dim,
                         "index": True,
                         "similarity": "cosine",
-                        "index_options": {"type": "int8_hnsw", "m": 16, "ef_construction": 100},
+                        "index_options": self.vector_index_options(),
                     },
                 }
             },
         }
+        if not self.storage["vector_in_source"]:
+            mapping["mappings"]["_source"] = {"excludes": ["embedding"]}
+        if routing_required:
+            # an unrouted write would land on a hash-chosen shard and be invisible to routed reads
+            mapping["mappings"]["_routing"] = {"required": True}
+        if aliases:
+            mapping["aliases"] = aliases
+        return mapping
+
+    def chunk_aliases(self, name: str) -> dict:
+        """Aliases a fresh physical index for `name` is created with (read + write for the shared one)."""
+        return {alias: ({"is_write_index": True} if alias == self.layout.write_alias else {})
+                for alias in self.layout.aliases_of(name)}
+
+    def ensure_chunks_index(self) -> None:
+        # every chunk index is a versioned physical index behind its alias(es), so reindex.py can
+        # build the next version alongside and swap it in without a gap
+        base = self.layout.base_index
+        if not self.client.indices.exists(index=base):
+            self.client.indices.create(index=next_version_name(self.client, base),
+                                       body=self.chunks_index_body(self.layout.routing, self.chunk_aliases(base)))
+        else:
+            current = physical_indices(self.client, base)
+            if len(current) == 1 and not self.client.indices.exists_alias(name=self.layout.write_alias):
+                # index from before the write alias existed: adopt it in place
+                self.client.indices.update_aliases(actions=[
+                    {"add": {"index": current[0], "alias": self.layout.write_alias, "is_write_index": True}}])
+            self._upgrade_mapping(current)
+
+        for alias in self.layout.dedicated_indices():
+            if not self.client.indices.exists(index=alias):
+                self.client.indices.create(index=next_version_name(self.client, alias),
+                                           body=self.chunks_index_body(aliases=self.chunk_aliases(alias)))
+            else:
+                self._upgrade_mapping(physical_indices(self.client, alias))
 
-        self.client.indices.create(index=self.index_name, body=mapping)
+    def _upgrade_mapping(self, indices: list) -> None:
+        # an index from before _meta was recorded was built with the model configured now
+        # (changing the model without a reindex never worked); record it so a later change does not
+        # make queries embed with a model the vectors were not built with
+        for index in indices:
+            mapping = self.client.indices.get_mapping(index=index)[index]["mappings"]
+            if not mapping.get("_meta") and self.meta:
+                self.client.indices.put_mapping(index=index, meta=self.meta)
+            # from before metadata filters: without the templates meta_* values would map dynamically
+            # (strings as text), and term filters on them would miss
+            if not mapping.get("dynamic_templates"):
+                self.client.indices.put_mapping(index=index, dynamic_templates=META_DYNAMIC_TEMPLATES)
 
     # Document index for metadata + doc_level vector search
     def ensure_doc_index(self, doc_index_name: str) -> None:
         if self.client.indices.exists(index=doc_index_name):
+            # created before doc vectors were written: the model filter of doc_index needs a keyword
+            self.client.indices.put_mapping(index=doc_index_name, properties={"embed_model": {"type": "keyword"}})
             return
         
         mapping = {
@@ -56,6 +166,7 @@ class IndexManager:
                         "filename": {"type": "keyword"},
                         "s3_key": {"type": "keyword"},
                         "created_at": {"type": "date"},
+                        "embed_model": {"type": "keyword"},
 
                         # Typed metadata
                         "meta_typed": {
@@ -0,0 +1,135 @@
+"""
+Move an existing chunk index onto the layout configured by ES_CHUNK_SHARDS / ES_TENANT_ROUTING /
+ES_DEDICATED_TENANTS (see index_layout.IndexLayout).
+
+    python -m app.providers.SearchProvider.index_migration --dry-run   # print the plan
+    python -m app.providers.SearchProvider.index_migration             # run it
+
+Steps, each skipped when already in place:
+1. copy every dedicated tenant's chunks from the shared index into its own index (behind its alias)
+2. if the shard count or routing differs, build the next `<ES_INDEX_CHUNKS>-v<N>` with the new
+   settings (and the old index's `_meta`: the vectors are copied, not re-embedded), reindex the
+   shared index into it (setting `_routing` from `tenant`, leaving out the dedicated tenants),
+   then atomically point the read and write aliases at it. A concrete index of that name is
+   dropped in the same alias action; an older aliased index is kept for rollback.
+3. otherwise delete the dedicated tenants' chunks from the shared index
+
+Reads keep working throughout. Pause ingestion while it runs: chunks written to the old index
+after its reindex starts are not carried over.
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+from elasticsearch import Elasticsearch
+
+from app.providers.SearchProvider.index_manager import IndexManager
+from app.providers.SearchProvider.index_versions import invalidate, next_version_name
+
+ROUTE_BY_TENANT = {"source": "ctx._routing = ctx._source.tenant", "lang": "painless"}
+
+
+def current_layout(client: Elasticsearch, name: str) -> Dict[str, Any]:
+    """Concrete index behind `name`, its primary shard count and whether routing is required."""
+    aliased = bool(client.indices.exists_alias(name=name))
+    settings = client.indices.get_settings(index=name)
+    concrete = next(iter(settings))
+    mapping = client.indices.get_mapping(index=concrete)[concrete]["mappings"]
+    return {
+        "aliased": aliased,
+        "index": concrete,
+        "shards": int(settings[concrete]["settings"]["index"]["number_of_shards"]),
+        "routing_required": bool(mapping.get("_routing", {}).get("required")),
+        "meta": mapping.get("_meta") or {},
+        "vectors_in_source": "embedding" not in mapping.get("_source", {}).get("excludes", []),
+    }
+
+
+def plan(client: Elasticsearch, manager: IndexManager) -> List[Dict[str, Any]]:
+    layout = manager.layout
+    base = layout.base_index
+    if not client.indices.exists(index=base):
+        return []  # nothing to migrate: warmup creates it with the configured layout
+    current = current_layout(client, base)
+    steps: List[Dict[str, Any]] = []
+
+    for tenant in sorted(layout.dedicated_tenants):
+        count = client.count(index=current["index"], body={"query": {"term": {"tenant": tenant}}})["count"]
+        if count:
+            steps.append({"step": "copy_tenant", "tenant": tenant, "from": current["index"],
+                          "to": layout.dedicated_index(tenant), "chunks": count})
+
+    if (current["shards"], current["routing_required"]) != (manager.shards, layout.routing):
+        steps.append({"step": "rebuild_shared", "from": current["index"], "to": next_version_name(client, base),
+                      "aliased": current["aliased"], "shards": manager.shards, "routing": layout.routing,
+                      "meta": current["meta"]})
+    else:
+        copied = [s["tenant"] for s in steps if s["step"] == "copy_tenant"]
+        steps.extend({"step": "delete_tenant", "tenant": tenant, "from": current["index"]} for tenant in copied)
+    if not current["vectors_in_source"] and any(s["step"] != "delete_tenant" for s in steps):
+        # _reindex copies _source: with the vector excluded the copies would have no embeddings
+        raise ValueError(f"{current['index']} keeps embeddings out of _source (ES_CHUNK_STORAGE); "
+                         "migrate with app.providers.SearchProvider.reindex, which re-embeds chunk_text")
+    return steps
+
+
+def apply(client: Elasticsearch, manager: IndexManager, steps: List[Dict[str, Any]], log=print) -> None:
+    layout = manager.layout
+    manager.ensure_chunks_index()  # creates the dedicated tenant indices + aliases
+    for step in steps:
+        started = time.time()
+        if step["step"] == "copy_tenant":
+            res = client.reindex(source={"index": step["from"], "query": {"term": {"tenant": step["tenant"]}}},
+                                 # a dedicated index is unrouted: drop any tenant routing the chunk carried
+                                 dest={"index": step["to"], "routing": "discard"},
+                                 wait_for_completion=True, refresh=True, slices="auto")
+        elif step["step"] == "rebuild_shared":
+            body = manager.chunks_index_body(layout.routing)
+            body["mappings"]["_meta"] = step["meta"] or manager.meta
+            client.indices.create(index=step["to"], body=body)
+            query = {"bool": {"must_not": [{"terms": {"tenant": sorted(layout.dedicated_tenants)}}]}}
+            dest = {"index": step["to"]} if layout.routing else {"index": step["to"], "routing": "discard"}
+            res = client.reindex(source={"index": step["from"], "query": query}, dest=dest,
+                                 script=ROUTE_BY_TENANT if layout.routing else None,
+                                 wait_for_completion=True, refresh=True, slices="auto")
+            actions = [{"add": {"index": step["to"], "alias": alias, "is_write_index": alias == layout.write_alias}}
+                       for alias in layout.aliases_of(layout.base_index)]
+            if step["aliased"]:
+                actions.extend({"remove": {"index": step["from"], "alias": alias}} for alias in layout.aliases_of(layout.base_index))
+            else:
+                # the name is taken by a concrete index: drop it in the same atomic action
+                actions.append({"remove_index": {"index": step["from"]}})
+            client.indices.update_aliases(actions=actions)
+            invalidate(layout.base_index)
+        else:
+            res = client.delete_by_query(index=step["from"], body={"query": {"term": {"tenant": step["tenant"]}}},
+                                         routing=layout.routing_for(step["tenant"]), refresh=True, slices="auto")
+        log(json.dumps({**step, "took_s": round(time.time() - started, 1),
+                        "docs": res.get("total") if isinstance(res, dict) else None}))
+
+
+def main():
+    from app.configs import load_config
+    from app.providers.SearchProvider.es_client import ESClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="print the steps without running them")
+    args = parser.parse_args()
+
+    cfg = load_config()
+    client = ESClient(cfg.es_url).client
+    manager = IndexManager.from_cfg(client, cfg)
+    steps = plan(client, manager)
+    if not steps:
+        print(json.dumps({"status": "up_to_date", "index": cfg.index_chunks}))
+        return
+    if args.dry_run:
+        for step in steps:
+            print(json.dumps(step))
+        return
+    apply(client, manager, steps)
+
+
+if __name__ == "__main__":
+    main()
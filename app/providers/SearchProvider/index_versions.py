@@ -0,0 +1,127 @@
+"""
+Which physical index an alias points at right now, and which embedding model built it.
+
+Every chunk index is created as `<alias>-v<N>` with `_meta: {embed_model, tenant_models,
+embedding_dim}` in its mapping. Queries and ingest embed with the model recorded there rather
+than EMBED_MODEL_NAME, so changing the model in config does nothing until a reindex
+(see reindex.py) has rebuilt the index with it and swapped the aliases.
+
+Lookups are cached per process for LIVE_TTL_S. Within a request the first lookup for an alias is
+pinned (`bind_request` starts a fresh set of pins): the embedder picks its model from that entry
+and ChunkIndex searches the concrete index recorded in the same entry (`pinned`). A swap, or
+another request refreshing the process cache, between the embed and the search cannot pair a
+vector from one model with an index built by another.
+"""
+import contextvars
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.Logger.log_main import get_logger
+from app.providers.SearchProvider.index_layout import IndexLayout
+
+logger = get_logger()
+
+LIVE_TTL_S = 10.0
+_VERSION = re.compile(r"-v(\d+)$")
+
+_LIVE: Dict[str, Tuple[float, Optional[Dict[str, Any]]]] = {}
+_LIVE_LOCK = threading.Lock()
+_CLIENTS: Dict[str, Any] = {}
+_PINNED: contextvars.ContextVar = contextvars.ContextVar("index_versions_pinned", default=None)
+
+
+def index_meta(embed_model: str, tenant_models: Dict[str, str], embedding_dim: int) -> Dict[str, Any]:
+    return {"embed_model": embed_model, "tenant_models": dict(tenant_models), "embedding_dim": int(embedding_dim)}
+
+
+def physical_indices(client, alias: str) -> List[str]:
+    """Concrete indices behind `alias` (the name itself when it is a plain index)."""
+    if client.indices.exists_alias(name=alias):
+        return sorted(client.indices.get_alias(name=alias))
+    if client.indices.exists(index=alias):
+        return [alias]
+    return []
+
+
+def next_version_name(client, alias: str) -> str:
+    """`<alias>-v<N+1>` past every version that exists, aliased or not."""
+    existing = client.indices.get_alias(index=f"{alias}-v*")
+    versions = [int(m.group(1)) for name in existing for m in [_VERSION.search(name)] if m]
+    return f"{alias}-v{max(versions, default=0) + 1}"
+
+
+def describe(client, alias: str) -> Optional[Dict[str, Any]]:
+    """{index, meta} for the single concrete index behind `alias`, None when missing or ambiguous."""
+    indices = physical_indices(client, alias)
+    if len(indices) != 1:
+        return None
+    index = indices[0]
+    mapping = client.indices.get_mapping(index=index)[index]["mappings"]
+    return {"index": index, "meta": mapping.get("_meta") or {}}
+
+
+def live_index(client, alias: str) -> Optional[Dict[str, Any]]:
+    """Cached `describe`; fails open (None) so an ES hiccup never blocks a query on this lookup."""
+    now = time.monotonic()
+    with _LIVE_LOCK:
+        hit = _LIVE.get(alias)
+    if hit and now - hit[0] < LIVE_TTL_S:
+        return hit[1]
+    try:
+        info = describe(client.options(request_timeout=2), alias)
+    except Exception as e:
+        logger.warning("index_versions_lookup_failed", extra={"error_code": type(e).__name__, "path": alias})
+        info = None  # cached too: a down cluster is not asked again on every request
+    with _LIVE_LOCK:
+        _LIVE[alias] = (now, info)
+    return info
+
+
+def bind_request() -> None:
+    """Called at request start (WebAPI, asgi_endpoint): no pins carried over from a previous request on this thread."""
+    # a mutable dict, so lookups made in a copied context (executor threads, tasks) pin for the whole request
+    _PINNED.set({})
+
+
+def pinned(alias: str) -> Optional[Dict[str, Any]]:
+    """The {index, meta} this request resolved for `alias`; None outside a request or before any lookup."""
+    pins = _PINNED.get()
+    return pins.get(alias) if pins is not None else None
+
+
+def _pin(client, alias: str) -> Optional[Dict[str, Any]]:
+    pins = _PINNED.get()
+    if pins is not None and alias in pins:
+        return pins[alias]
+    info = live_index(client, alias)
+    if pins is not None:
+        pins[alias] = info
+    return info
+
+
+def invalidate(alias: str | None = None) -> None:
+    with _LIVE_LOCK:
+        if alias is None:
+            _LIVE.clear()
+        else:
+            _LIVE.pop(alias, None)
+
+
+def live_embedding(cfg, tenant: str = "") -> Optional[Tuple[str, int]]:
+    """
+    (model, dims) the tenant's live index was built with; None for indices created before _meta.
+    Pins the entry for the rest of the request, so later searches use the index this model built.
+    """
+    from app.providers.SearchProvider.es_client import ESClient
+
+    if cfg.es_url not in _CLIENTS:
+        _CLIENTS[cfg.es_url] = ESClient(cfg.es_url).client
+    alias = IndexLayout.from_cfg(cfg).index_for(tenant)
+    info = _pin(_CLIENTS[cfg.es_url], alias)
+    meta = (info or {}).get("meta") or {}
+    if not meta.get("embed_model"):
+        return None
+    model = (meta.get("tenant_models") or {}).get(tenant or "", meta["embed_model"])
+    return model, int(meta["embedding_dim"])
@@ -0,0 +1,419 @@
+import fnmatch
+import itertools
+import json
+import math
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Any, Dict, List
+
+import numpy as np
+
+# ES_URL=memory://<name> swaps Elasticsearch for this process-local stand-in (benchmarks, local dev
+# without a cluster). It implements the subset of the client API the app uses and evaluates the
+# query shapes built in similarity_index: bool filters (term / terms / range / exists / nested, on
+# dotted paths), `match` on chunk_text scored with BM25, the cosineSimilarity script_score and
+# (exact) `knn`. Aliases, mapping `_meta`, sliced scroll and bulk cover what the reindex job needs;
+# mapping `_source.excludes` is honoured.
+
+_TOKEN = re.compile(r"\w+")
+_STORES: Dict[str, "_Store"] = {}
+_STORES_LOCK = threading.Lock()
+
+
+class ClusterBlockError(Exception):
+    """Write into an index with `index.blocks.write` set; ES answers 403 cluster_block_exception."""
+    status_code = 403
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall((text or "").lower())
+
+
+class _Store:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.indices: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # per index: doc id -> token counts of chunk_text, kept alongside for BM25
+        self.terms: Dict[str, Dict[str, Counter]] = {}
+        self.bodies: Dict[str, Dict[str, Any]] = {}
+        # alias -> {index: is_write_index}
+        self.aliases: Dict[str, Dict[str, bool]] = {}
+        self.scrolls: Dict[str, List[list]] = {}
+        self.scroll_ids = itertools.count(1)
+
+    def hidden(self, index: str) -> set:
+        """Fields the mapping keeps out of `_source`: stored for scoring, never returned."""
+        mappings = self.bodies.get(index, {}).get("mappings", {})
+        return set(mappings.get("_source", {}).get("excludes", []))
+
+    def resolve(self, name: str, write: bool = False) -> str:
+        """Concrete index behind a name; writes through a multi-index alias go to its write index."""
+        if name in self.indices:
+            return name
+        targets = self.aliases.get(name)
+        if not targets:
+            # writes create the index like ES does; reads of an unknown index simply find nothing
+            return name
+        if len(targets) == 1:
+            return next(iter(targets))
+        if write:
+            return next(index for index, is_write in targets.items() if is_write)
+        raise ValueError(f"memory ES: alias [{name}] points to several indices")
+
+
+def _range_ok(value: Any, spec: Dict[str, Any]) -> bool:
+    if value is None:
+        return False
+    checks = {"gt": lambda a, b: a > b, "gte": lambda a, b: a >= b, "lt": lambda a, b: a < b, "lte": lambda a, b: a <= b}
+    return all(checks[op](value, bound) for op, bound in spec.items() if op in checks)
+
+
+def _values(source: Dict[str, Any], path: str) -> List[Any]:
+    """Every value at a dotted path; arrays match per element like ES's multi-valued fields."""
+    values = [source]
+    for part in path.split("."):
+        values = [v.get(part) for v in values if isinstance(v, dict)]
+        values = [x for v in values for x in (v if isinstance(v, list) else [v])]
+    return [v for v in values if v is not None]
+
+
+def _matches(source: Dict[str, Any], clause: Dict[str, Any]) -> bool:
+    if "term" in clause:
+        (field, value), = clause["term"].items()
+        value = value.get("value") if isinstance(value, dict) else value
+        return value in _values(source, field)
+    if "terms" in clause:
+        (field, values), = clause["terms"].items()
+        return any(v in values for v in _values(source, field))
+    if "range" in clause:
+        (field, spec), = clause["range"].items()
+        return any(_range_ok(v, spec) for v in _values(source, field))
+    if "exists" in clause:
+        return bool(_values(source, clause["exists"]["field"]))
+    if "nested" in clause:
+        # each nested object is matched on its own, with field names relative to the nested path
+        path = clause["nested"]["path"]
+        return any(_matches({path: obj}, clause["nested"]["query"]) for obj in _values(source, path))
+    if "match_all" in clause or "match" in clause:
+        # `match` decides scoring, not membership (see _bm25)
+        return True
+    if "bool" in clause:
+        b = clause["bool"]
+        return (all(_matches(source, c) for c in b.get("filter", []) + b.get("must", []))
+                and not any(_matches(source, c) for c in b.get("must_not", [])))
+    if "script_score" in clause:
+        return _matches(source, clause["script_score"]["query"])
+    raise ValueError(f"memory ES: unsupported query {list(clause)}")
+
+
+def _project(source: Dict[str, Any], body: Dict[str, Any], hidden: set = frozenset()) -> Dict[str, Any]:
+    spec = body.get("_source") or {}
+    if isinstance(spec, list):
+        return {k: v for k, v in source.items() if k in spec and k not in hidden}
+    excludes = set(spec.get("excludes", []) if isinstance(spec, dict) else []) | hidden
+    return {k: v for k, v in source.items() if k not in excludes}
+
+
+def _in_slice(doc_id: str, spec: Dict[str, Any] | None) -> bool:
+    return spec is None or zlib.crc32(doc_id.encode("utf-8")) % spec["max"] == spec["id"]
+
+
+class _Indices:
+    def __init__(self, store: _Store):
+        self._store = store
+
+    def exists(self, index: str) -> bool:
+        return index in self._store.indices or index in self._store.aliases
+
+    def exists_alias(self, name: str, **kwargs) -> bool:
+        return name in self._store.aliases
+
+    def create(self, index: str, body: Dict[str, Any] | None = None, **kwargs) -> Dict[str, Any]:
+        with self._store.lock:
+            self._store.indices.setdefault(index, {})
+            self._store.terms.setdefault(index, {})
+            self._store.bodies[index] = dict(body or {})
+            for alias, spec in (body or {}).get("aliases", {}).items():
+                self._store.aliases.setdefault(alias, {})[index] = bool((spec or {}).get("is_write_index"))
+        return {"acknowledged": True, "index": index}
+
+    def delete(self, index: str, **kwargs) -> Dict[str, Any]:
+        with self._store.lock:
+            for name in [n for n in self._store.indices if fnmatch.fnmatchcase(n, index)]:
+                self._store.indices.pop(name)
+                self._store.terms.pop(name, None)
+                self._store.bodies.pop(name, None)
+                for targets in self._store.aliases.values():
+                    targets.pop(name, None)
+            self._store.aliases = {a: t for a, t in self._store.aliases.items() if t}
+        return {"acknowledged": True}
+
+    def get_alias(self, index: str | None = None, name: str | None = None, **kwargs) -> Dict[str, Any]:
+        with self._store.lock:
+            out: Dict[str, Any] = {}
+            for concrete in self._store.indices:
+                if index and not (fnmatch.fnmatchcase(concrete, index) or concrete in self._store.aliases.get(index, {})):
+                    continue
+                aliases = {a: ({"is_write_index": True} if t[concrete] else {})
+                           for a, t in self._store.aliases.items() if concrete in t and (not name or a == name)}
+                if name and not aliases:
+                    continue
+                out[concrete] = {"aliases": aliases}
+        if name and not out:
+            raise KeyError(f"alias [{name}] missing")
+        return out
+
+    def update_aliases(self, actions: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+        # applied under one lock: readers never see a half-swapped alias, as with the real API
+        with self._store.lock:
+            for action in actions:
+                (kind, spec), = action.items()
+                if kind == "add":
+                    self._store.aliases.setdefault(spec["alias"], {})[spec["index"]] = bool(spec.get("is_write_index"))
+                elif kind == "remove":
+                    self._store.aliases.get(spec["alias"], {}).pop(spec["index"], None)
+                elif kind == "remove_index":
+                    self.delete(spec["index"])
+            self._store.aliases = {a: t for a, t in self._store.aliases.items() if t}
+        return {"acknowledged": True}
+
+    def get_mapping(self, index: str, **kwargs) -> Dict[str, Any]:
+        concrete = self._store.resolve(index)
+        return {concrete: {"mappings": self._store.bodies.get(concrete, {}).get("mappings", {})}}
+
+    def get_settings(self, index: str, **kwargs) -> Dict[str, Any]:
+        concrete = self._store.resolve(index)
+        settings = self._store.bodies.get(concrete, {}).get("settings") or {"index": {"number_of_shards": 1}}
+        return {concrete: {"settings": settings}}
+
+    def put_mapping(self, index: str, meta: Dict[str, Any] | None = None, properties: Dict[str, Any] | None = None,
+                    dynamic_templates: List[Dict[str, Any]] | None = None, **kwargs) -> Dict[str, Any]:
+        concrete = self._store.resolve(index)
+        with self._store.lock:
+            mappings = self._store.bodies.setdefault(concrete, {}).setdefault("mappings", {})
+            if meta is not None:
+                mappings["_meta"] = meta
+            if dynamic_templates is not None:
+                mappings["dynamic_templates"] = dynamic_templates
+            mappings.setdefault("properties", {}).update(properties or {})
+        return {"acknowledged": True}
+
+    def put_settings(self, index: str, settings: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        concrete = self._store.resolve(index)
+        with self._store.lock:
+            current = self._store.bodies.setdefault(concrete, {}).setdefault("settings", {}).setdefault("index", {})
+            current.update(settings.get("index", settings))
+        return {"acknowledged": True}
+
+    def stats(self, index: str, **kwargs) -> Dict[str, Any]:
+        """
+        Store size *estimate*: `_source` compressed the way the codec would (zlib 1 ~ LZ4, 6 ~
+        DEFLATE) plus the raw float32 vectors and their quantised copy. For comparing profiles only.
+        """
+        concrete = self._store.resolve(index)
+        body = self._store.bodies.get(concrete, {})
+        best = body.get("settings", {}).get("index", {}).get("codec") == "best_compression"
+        vector = body.get("mappings", {}).get("properties", {}).get("embedding", {})
+        bits = {"hnsw": 32, "int8_hnsw": 8, "int4_hnsw": 4, "bbq_hnsw": 1}.get(vector.get("index_options", {}).get("type"), 32)
+        hidden = self._store.hidden(concrete)
+        with self._store.lock:
+            docs = list(self._store.indices.get(concrete, {}).values())
+        stored = json.dumps([_project(d, {}, hidden) for d in docs]).encode("utf-8")
+        size = len(zlib.compress(stored, 6 if best else 1))
+        size += sum(len(d.get("embedding") or []) for d in docs) * (4 + (bits / 8 if bits < 32 else 0))
+        primaries = {"docs": {"count": len(docs)}, "store": {"size_in_bytes": int(size)}}
+        return {"_all": {"primaries": primaries}, "indices": {concrete: {"primaries": primaries}}}
+
+    def forcemerge(self, index: str, **kwargs) -> Dict[str, Any]:
+        return {"_shards": {"failed": 0}}
+
+    def refresh(self, index: str | None = None, **kwargs) -> Dict[str, Any]:
+        return {"_shards": {"failed": 0}}
+
+
+class InMemoryElasticsearch:
+    def __init__(self, store: _Store):
+        self._store = store
+        self.indices = _Indices(store)
+
+    def ping(self) -> bool:
+        return True
+
+    def info(self, **kwargs) -> Dict[str, Any]:
+        # the mapping features it understands are those of the compose cluster's release
+        return {"name": "memory", "version": {"number": "8.17.0", "build_flavor": "memory"}}
+
+    def options(self, **kwargs) -> "InMemoryElasticsearch":
+        return self
+
+    def _put(self, index: str, id: str, document: Dict[str, Any]) -> None:
+        concrete = self._store.resolve(index, write=True)
+        if str(self._store.bodies.get(concrete, {}).get("settings", {}).get("index", {}).get("blocks.write")).lower() == "true":
+            raise ClusterBlockError(f"cluster_block_exception: index [{concrete}] blocked by: [FORBIDDEN/8/index write (api)];")
+        # stored the way ES parses it back: float32 arrays become plain JSON lists
+        document = {k: (v.tolist() if isinstance(v, np.ndarray) else v) for k, v in document.items()}
+        self._store.indices.setdefault(concrete, {})[id] = document
+        self._store.terms.setdefault(concrete, {})[id] = Counter(_tokens(document.get("chunk_text", "")))
+
+    # routing is accepted and ignored: there is a single "shard"
+    def index(self, index: str, id: str, document: Dict[str, Any], refresh: Any = None, **kwargs) -> Dict[str, Any]:
+        with self._store.lock:
+            self._put(index, id, document)
+        return {"_id": id, "result": "created"}
+
+    def bulk(self, operations: List[Dict[str, Any]], refresh: Any = None, **kwargs) -> Dict[str, Any]:
+        items = []
+        with self._store.lock:
+            for action, document in zip(operations[::2], operations[1::2]):
+                meta = action["index"]
+                try:
+                    self._put(meta["_index"], meta["_id"], document)
+                    items.append({"index": {"_id": meta["_id"], "status": 201}})
+                except ClusterBlockError as e:
+                    # like ES: a blocked item fails on its own, the request still succeeds
+                    items.append({"index": {"_id": meta["_id"], "status": 403, "error": str(e)}})
+        return {"errors": any("error" in i["index"] for i in items), "items": items}
+
+    def get(self, index: str, id: str, **kwargs) -> Dict[str, Any]:
+        concrete = self._store.resolve(index)
+        source = self._store.indices.get(concrete, {}).get(id)
+        if source is None:
+            raise KeyError(f"{index}/{id} not found")
+        return {"_id": id, "_index": concrete, "found": True, "_source": _project(source, {}, self._store.hidden(concrete))}
+
+    def _candidates(self, index: str, query: Dict[str, Any], slice_spec: Dict[str, Any] | None = None) -> List[tuple]:
+        with self._store.lock:
+            docs = list(self._store.indices.get(self._store.resolve(index), {}).items())
+        return [(doc_id, src) for doc_id, src in docs if _in_slice(doc_id, slice_spec) and _matches(src, query)]
+
+    def count(self, index: str, body: Dict[str, Any] | None = None, **kwargs) -> Dict[str, Any]:
+        query = (body or {}).get("query", {"match_all": {}})
+        return {"count": len(self._candidates(index, query))}
+
+    def _bm25(self, index: str, candidates: List[tuple], text: str, k1: float = 1.2, b: float = 0.75) -> List[tuple]:
+        terms = self._store.terms.get(index, {})
+        n_docs = max(1, len(terms))
+        avg_len = sum(sum(c.values()) for c in terms.values()) / n_docs or 1.0
+        query_terms = set(_tokens(text))
+        df = {t: sum(1 for c in terms.values() if t in c) for t in query_terms}
+
+        scored = []
+        for doc_id, src in candidates:
+            tf = terms.get(doc_id, Counter())
+            length = sum(tf.values())
+            score = 0.0
+            for t in query_terms:
+                if tf.get(t):
+                    idf = math.log(1 + (n_docs - df[t] + 0.5) / (df[t] + 0.5))
+                    score += idf * tf[t] * (k1 + 1) / (tf[t] + k1 * (1 - b + b * length / avg_len))
+            if score > 0:
+                scored.append((score, doc_id, src))
+        return scored
+
+    def _cosine(self, candidates: List[tuple], field: str, query_vec: List[float]) -> List[tuple]:
+        if not candidates:
+            return []
+        q = np.asarray(query_vec, dtype=np.float32)
+        mat = np.asarray([src[field] for _, src in candidates], dtype=np.float32)
+        sims = mat @ q / (np.linalg.norm(mat, axis=1) * np.linalg.norm(q) + 1e-12)
+        # same +1.0 shift as the script_score in vector_body
+        return [(float(s) + 1.0, doc_id, src) for s, (doc_id, src) in zip(sims, candidates)]
+
+    def search(self, index: str, body: Dict[str, Any], scroll: str | None = None, **kwargs) -> Dict[str, Any]:
+        start = time.perf_counter()
+        concrete = self._store.resolve(index)
+        query = body.get("query", {"match_all": {}})
+        candidates = self._candidates(concrete, query, body.get("slice"))
+
+        if "knn" in body:
+            knn = body["knn"]
+            kept = [c for c in candidates if _matches(c[1], {"bool": {"filter": knn.get("filter", [])}})]
+            # exact cosine (_cosine adds 1), halved to knn's (1 + cos) / 2; the real graph search is approximate
+            scored = [(s / 2, d, src) for s, d, src in self._cosine(kept, knn["field"], knn["query_vector"])]
+            scored = sorted(scored, key=lambda s: s[0], reverse=True)[:knn["k"]]
+        elif "script_score" in query:
+            params = query["script_score"]["script"]["params"]
+            scored = self._cosine(candidates, "embedding", params["q"])
+        else:
+            must = query.get("bool", {}).get("must", [])
+            match = next((m["match"] for m in must if "match" in m), None)
+            if match:
+                (field, spec), = match.items()
+                scored = self._bm25(concrete, candidates, spec["query"] if isinstance(spec, dict) else spec)
+            else:
+                scored = [(1.0, doc_id, src) for doc_id, src in candidates]
+
+        scored.sort(key=lambda s: s[0], reverse=True)
+        hidden = self._store.hidden(concrete)
+        hits = [
+            {"_index": concrete, "_id": doc_id, "_score": score, "_source": _project(src, body, hidden)}
+            for score, doc_id, src in scored
+        ]
+        size = body.get("size", 10)
+        res = {
+            "took": int((time.perf_counter() - start) * 1000),
+            "timed_out": False,
+            "hits": {"total": {"value": len(scored), "relation": "eq"}, "max_score": hits[0]["_score"] if hits else None, "hits": hits[:size]},
+        }
+        if scroll:
+            scroll_id = str(next(self._store.scroll_ids))
+            self._store.scrolls[scroll_id] = [hits[i:i + size] for i in range(size, len(hits), size)]
+            res["_scroll_id"] = scroll_id
+        return res
+
+    def scroll(self, scroll_id: str, **kwargs) -> Dict[str, Any]:
+        pages = self._store.scrolls.get(scroll_id, [])
+        page = pages.pop(0) if pages else []
+        return {"_scroll_id": scroll_id, "took": 0, "hits": {"hits": page}}
+
+    def clear_scroll(self, scroll_id: str | None = None, **kwargs) -> Dict[str, Any]:
+        self._store.scrolls.pop(scroll_id, None)
+        return {"succeeded": True}
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncInMemoryElasticsearch:
+    """Async face of the same store for the ASGI serving mode."""
+    def __init__(self, store: _Store):
+        self._sync = InMemoryElasticsearch(store)
+        self.indices = self._sync.indices
+
+    async def ping(self) -> bool:
+        return True
+
+    async def search(self, index: str, body: Dict[str, Any], **kwargs) -> Dict[str, Any]:
+        return self._sync.search(index=index, body=body, **kwargs)
+
+    async def get(self, index: str, id: str, **kwargs) -> Dict[str, Any]:
+        return self._sync.get(index=index, id=id, **kwargs)
+
+    async def count(self, index: str, body: Dict[str, Any] | None = None, **kwargs) -> Dict[str, Any]:
+        return self._sync.count(index=index, body=body, **kwargs)
+
+    async def close(self) -> None:
+        pass
+
+
+def is_memory_url(es_url: str) -> bool:
+    return es_url.startswith("memory://")
+
+
+def _store(es_url: str) -> _Store:
+    # one store per URL per process, shared by every client created for it
+    with _STORES_LOCK:
+        if es_url not in _STORES:
+            _STORES[es_url] = _Store()
+        return _STORES[es_url]
+
+
+def memory_client(es_url: str) -> InMemoryElasticsearch:
+    return InMemoryElasticsearch(_store(es_url))
+
+
+def async_memory_client(es_url: str) -> AsyncInMemoryElasticsearch:
+    return AsyncInMemoryElasticsearch(_store(es_url))
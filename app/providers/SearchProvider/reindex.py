@@ -0,0 +1,402 @@
+"""
+Rebuild a chunk index for a new embedding model, vector dims or HNSW parameters while queries
+keep being served from the current one.
+
+    python -m app.providers.SearchProvider.reindex [--alias rag_chunks] [--slices 4]
+    POST /v1/admin/reindex                 (same job, in the background of the API process)
+
+The target settings come from the current config (EMBED_MODEL_NAME, EMBED_TENANT_MODELS,
+ES_EMBEDDING_DIM, ES_HNSW_M, ES_HNSW_EF_CONSTRUCTION) unless overridden. Queries and ingest keep
+using the model recorded in the live index's `_meta` (index_versions) until the swap, so config
+can be changed and rolled out first.
+
+1. create the next `<alias>-v<N>` with the new mapping (refresh off, no replicas while loading)
+2. sliced scroll over the live index, `chunk_text` only, re-embedded in batches and bulk-written:
+   nothing is downloaded from storage again
+3. catch-up passes over chunks written since the copy started (`created_at`), until few remain
+4. count check, then one `update_aliases` call moves the read and write aliases together
+5. once every process has dropped its cached view of the alias, the old index is write-blocked and
+   a last catch-up copies what was written to it after the swap. Requests that pinned the old index
+   before the swap and write after the block get a 409 INDEX_SWAPPED and retry against the new one
+
+The old index is kept, write-blocked: `rollback` unblocks it, moves the aliases back and blocks
+the new one the same way, re-embedding with the old model whatever was ingested into it after the swap. Delete it once the new one has proven itself.
+Progress is kept as JSON under LOCAL_STORAGE_DIR/reindex so every worker can report on it.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.Logger.log_main import get_logger
+from app.configs import parse_kv
+from app.providers.SearchProvider.index_layout import IndexLayout
+from app.providers.SearchProvider.index_manager import IndexManager
+from app.providers.SearchProvider.index_versions import (LIVE_TTL_S, describe, index_meta, invalidate,
+                                                          next_version_name)
+from app.utils.errors import AppError, NotFoundError, ValidationError
+
+logger = get_logger()
+
+HEARTBEAT_STALE_S = 60
+CATCHUP_MAX_PASSES = 5
+CATCHUP_DONE_BELOW = 50
+# ingest nodes stamp created_at with their own clock, shortly before the write lands
+CLOCK_SKEW_S = 10
+SCROLL_KEEPALIVE = "5m"
+
+
+def jobs_dir(cfg) -> str:
+    return f"{cfg.local_storage_dir}/reindex"
+
+
+def _job_path(cfg, job_id: str) -> str:
+    if not job_id or os.path.basename(job_id) != job_id:
+        raise NotFoundError("REINDEX_JOB_NOT_FOUND", f"Reindex job '{job_id}' not found", 404)
+    return os.path.join(jobs_dir(cfg), f"{job_id}.json")
+
+
+def load_job(cfg, job_id: str) -> Dict[str, Any]:
+    try:
+        with open(_job_path(cfg, job_id), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise NotFoundError("REINDEX_JOB_NOT_FOUND", f"Reindex job '{job_id}' not found", 404)
+
+
+def list_jobs(cfg, limit: int = 20) -> List[Dict[str, Any]]:
+    try:
+        names = [n for n in os.listdir(jobs_dir(cfg)) if n.endswith(".json")]
+    except FileNotFoundError:
+        return []
+    jobs = []
+    for name in names:
+        try:
+            with open(os.path.join(jobs_dir(cfg), name), encoding="utf-8") as f:
+                jobs.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # being replaced right now
+    jobs.sort(key=lambda j: j.get("started_at", 0), reverse=True)
+    return jobs[:limit]
+
+
+def running_job(cfg, alias: str) -> Optional[Dict[str, Any]]:
+    """A job on `alias` whose thread still heartbeats (a crashed process leaves a stale 'running')."""
+    for job in list_jobs(cfg, limit=1000):
+        if job["alias"] == alias and job["status"] in ("running", "rolling_back") \
+                and time.time() - job.get("heartbeat", 0) < HEARTBEAT_STALE_S:
+            return job
+    return None
+
+
+def _iso(ts: float) -> str:
+    return datetime.utcfromtimestamp(ts).isoformat() + "Z"
+
+
+def block_writes(client, index: str, blocked: bool = True) -> None:
+    client.indices.put_settings(index=index, settings={"index": {"blocks.write": blocked}})
+
+
+class ReindexJob:
+    def __init__(self, cfg, client, alias: str | None = None, embed_model: str | None = None,
+                 tenant_models: Dict[str, str] | None = None, embedding_dim: int | None = None,
+                 hnsw_m: int | None = None, hnsw_ef_construction: int | None = None,
+                 slices: int = 4, batch_size: int = 256):
+        self.cfg = cfg
+        self.client = client
+        self.layout = IndexLayout.from_cfg(cfg)
+        self.manager = IndexManager.from_cfg(client, cfg)
+        self.alias = alias or self.layout.base_index
+        if self.alias not in [self.layout.base_index, *self.layout.dedicated_indices()]:
+            raise ValidationError("REINDEX_ALIAS_INVALID", f"'{self.alias}' is not a chunk index alias of this layout", 400)
+        if slices < 1 or batch_size < 1:
+            raise ValidationError("REINDEX_PARAMS_INVALID", "slices and batch_size must be positive", 400)
+
+        self.manager.embedding_dim = int(embedding_dim or cfg.embedding_dim)
+        self.manager.hnsw_m = int(hnsw_m or cfg.es_hnsw_m)
+        self.manager.hnsw_ef_construction = int(hnsw_ef_construction or cfg.es_hnsw_ef_construction)
+        self.manager.meta = index_meta(embed_model or cfg.embed_model_name,
+                                       parse_kv(cfg.embed_tenant_models) if tenant_models is None else tenant_models,
+                                       self.manager.embedding_dim)
+        # dedicated tenant indices hold one tenant and are never routed
+        self.routed = self.layout.routing and self.alias == self.layout.base_index
+        self.slices = slices
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._embedders: Dict[str, Any] = {}
+        self.state: Dict[str, Any] = {
+            "job_id": uuid.uuid4().hex[:12],
+            "alias": self.alias,
+            "status": "pending",
+            "phase": None,
+            "target": {**self.manager.meta, "hnsw_m": self.manager.hnsw_m,
+                       "hnsw_ef_construction": self.manager.hnsw_ef_construction},
+            "source_index": None,
+            "target_index": None,
+            "total": 0,
+            "copied": 0,
+            "caught_up": 0,
+            "rate_per_s": 0.0,
+            "eta_s": None,
+            "started_at": time.time(),
+            "heartbeat": time.time(),
+            "swapped_at": None,
+            "finished_at": None,
+            "error": None,
+        }
+
+    @property
+    def job_id(self) -> str:
+        return self.state["job_id"]
+
+    # ---- state -------------------------------------------------------------------------------
+
+    def save(self, **changes) -> None:
+        with self._lock:
+            self.state.update(changes)
+            self.state["heartbeat"] = time.time()
+            copied, elapsed = self.state["copied"], time.time() - self.state["started_at"]
+            if self.state["phase"] == "copy" and copied and elapsed > 0:
+                rate = copied / elapsed
+                self.state["rate_per_s"] = round(rate, 1)
+                self.state["eta_s"] = round(max(0, self.state["total"] - copied) / rate, 1)
+            os.makedirs(jobs_dir(self.cfg), exist_ok=True)
+            # atomic replace: readers in other workers never see a half-written file
+            fd, tmp = tempfile.mkstemp(dir=jobs_dir(self.cfg), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.state, f)
+            os.replace(tmp, _job_path(self.cfg, self.job_id))
+
+    def _progress(self, key: str, n: int) -> None:
+        with self._lock:
+            self.state[key] += n
+        self.save()
+
+    # ---- copy --------------------------------------------------------------------------------
+
+    def _embedder(self, model_name: str):
+        from app.providers.EmbeddingsProvider.embedding_provider import LocalEmbeddingProvider
+
+        with self._lock:
+            if model_name not in self._embedders:
+                # no micro-batcher: the job already encodes whole batches
+                self._embedders[model_name] = LocalEmbeddingProvider(
+                    model_name, backend=self.cfg.embed_backend, quantize=self.cfg.embed_onnx_quantize,
+                    threads=self.cfg.embed_onnx_threads, export_dir=f"{self.cfg.local_storage_dir}/onnx")
+            return self._embedders[model_name]
+
+    def check_models(self, meta: Dict[str, Any]) -> None:
+        """Every model the meta names must produce its dims; fails before anything is written."""
+        for model_name in {meta["embed_model"], *meta["tenant_models"].values()}:
+            dim = self._embedder(model_name).embedding_dim
+            if dim != meta["embedding_dim"]:
+                raise ValidationError("EMBEDDING_DIM_MISMATCH",
+                                      f"Embedding model '{model_name}' produces {dim} dims, reindex target expects {meta['embedding_dim']}", 400)
+
+    def _write_batch(self, hits: List[Dict[str, Any]], dest: str, meta: Dict[str, Any]) -> int:
+        by_model: Dict[str, List[Dict[str, Any]]] = {}
+        for hit in hits:
+            tenant = hit["_source"].get("tenant", "")
+            by_model.setdefault(meta["tenant_models"].get(tenant, meta["embed_model"]), []).append(hit)
+
+        operations: List[Dict[str, Any]] = []
+        for model_name, group in by_model.items():
+            vecs = self._embedder(model_name).embed_texts([h["_source"].get("chunk_text", "") for h in group],
+                                                          batch_size=min(self.batch_size, 64))
+            for hit, vec in zip(group, vecs):
+                action = {"_index": dest, "_id": hit["_id"]}
+                if self.routed:
+                    action["routing"] = hit["_source"]["tenant"]
+                operations.extend([{"index": action}, {**hit["_source"], "embedding": vec}])
+        res = self.client.bulk(operations=operations, refresh=False)
+        if res.get("errors"):
+            failed = [i["index"] for i in res["items"] if i["index"].get("error")]
+            raise AppError("REINDEX_BULK_FAILED", f"{len(failed)} chunks failed to index, first: {failed[0].get('error')}", 502)
+        return len(hits)
+
+    def _scan(self, source: str, dest: str, meta: Dict[str, Any], query: Dict[str, Any],
+              slice_id: int, slices: int, counter: str) -> None:
+        body: Dict[str, Any] = {"size": self.batch_size, "query": query, "sort": ["_doc"],
+                                "_source": {"excludes": ["embedding"]}}
+        if slices > 1:
+            body["slice"] = {"id": slice_id, "max": slices}
+        res = self.client.search(index=source, body=body, scroll=SCROLL_KEEPALIVE)
+        scroll_id = res.get("_scroll_id")
+        try:
+            while res["hits"]["hits"]:
+                self._progress(counter, self._write_batch(res["hits"]["hits"], dest, meta))
+                res = self.client.scroll(scroll_id=scroll_id, scroll=SCROLL_KEEPALIVE)
+                scroll_id = res.get("_scroll_id", scroll_id)
+        finally:
+            if scroll_id:
+                self.client.clear_scroll(scroll_id=scroll_id)
+
+    def copy(self, source: str, dest: str, meta: Dict[str, Any], query: Dict[str, Any] | None = None,
+             slices: int = 1, counter: str = "copied") -> None:
+        query = query or {"match_all": {}}
+        if slices == 1:
+            self._scan(source, dest, meta, query, 0, 1, counter)
+            return
+        # one scroll per slice; ES splits the shard's docs between them
+        with ThreadPoolExecutor(max_workers=slices, thread_name_prefix="reindex") as pool:
+            for future in [pool.submit(self._scan, source, dest, meta, query, i, slices, counter) for i in range(slices)]:
+                future.result()
+
+    def catch_up(self, source: str, dest: str, meta: Dict[str, Any], since: float) -> float:
+        """Copy chunks written to `source` since `since` until a pass finds few; returns the last watermark."""
+        for _ in range(CATCHUP_MAX_PASSES):
+            watermark = time.time()
+            query = {"range": {"created_at": {"gte": _iso(since - CLOCK_SKEW_S)}}}
+            before = self.state["caught_up"]
+            self.client.indices.refresh(index=source)
+            self.copy(source, dest, meta, query, counter="caught_up")
+            since = watermark
+            if self.state["caught_up"] - before < CATCHUP_DONE_BELOW:
+                break
+        return since
+
+    # ---- swap --------------------------------------------------------------------------------
+
+    def swap_actions(self, old: str, new: str, aliased: bool) -> List[Dict[str, Any]]:
+        aliases = self.layout.aliases_of(self.alias)
+        actions: List[Dict[str, Any]] = [
+            {"add": {"index": new, "alias": a, "is_write_index": a == self.layout.write_alias}} for a in aliases]
+        if aliased:
+            actions.extend({"remove": {"index": old, "alias": a}} for a in aliases)
+        else:
+            # a pre-alias concrete index holds the name: it has to go in the same atomic action
+            actions.append({"remove_index": {"index": old}})
+        return actions
+
+    def run(self) -> Dict[str, Any]:
+        self.save(status="running", phase="prepare")
+        target: Optional[str] = None
+        try:
+            self.check_models(self.manager.meta)
+            live = describe(self.client, self.alias)
+            if live is None:
+                raise AppError("REINDEX_SOURCE_UNAVAILABLE", f"'{self.alias}' does not resolve to exactly one index", 409)
+            source = live["index"]
+            aliased = source != self.alias
+            target = next_version_name(self.client, self.alias)
+            self.client.indices.create(index=target, body=self.manager.chunks_index_body(self.routed))
+            # no refreshes or replica copies while bulk loading; restored before the swap
+            self.client.indices.put_settings(index=target, settings={"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+            self.client.indices.refresh(index=source)
+            total = self.client.count(index=source)["count"]
+            self.save(phase="copy", source_index=source, target_index=target, total=total,
+                      source_meta=live["meta"], rollback_available=aliased)
+
+            started = time.time()
+            self.copy(source, target, self.manager.meta, slices=self.slices)
+            self.save(phase="catch_up")
+            since = self.catch_up(source, target, self.manager.meta, started)
+
+            self.client.indices.put_settings(index=target, settings={"index": {"refresh_interval": "1s",
+                                                                               "number_of_replicas": self.manager.replicas}})
+            self.client.indices.refresh(index=target)
+            expected = self.client.count(index=source)["count"]
+            got = self.client.count(index=target)["count"]
+            if got < expected:
+                raise AppError("REINDEX_INCOMPLETE", f"{target} holds {got} chunks, {source} holds {expected}", 500)
+
+            self.save(phase="swap")
+            self.client.indices.update_aliases(actions=self.swap_actions(source, target, aliased))
+            invalidate(self.alias)
+            self.save(phase="settle", swapped_at=time.time())
+            logger.info("reindex_swapped", extra={"path": self.alias, "provider": target})
+
+            if aliased:
+                # other processes may keep writing to the old index until their cached view expires;
+                # requests that pinned it before the swap can still write after that, so it is blocked
+                # and the catch-up below is then the last write it will ever see
+                time.sleep(2 * LIVE_TTL_S + 1)
+                block_writes(self.client, source)
+                self.catch_up(source, target, self.manager.meta, since)
+                self.client.indices.refresh(index=target)
+            self.save(status="done", phase=None, finished_at=time.time())
+        except Exception as e:
+            if target and not self.state.get("swapped_at") and self.client.indices.exists(index=target):
+                self.client.indices.delete(index=target)  # never served: nothing to keep
+            self.save(status="failed", error=f"{type(e).__name__}: {e}", finished_at=time.time())
+            logger.exception("reindex_failed", extra={"path": self.alias, "error_code": getattr(e, "code", type(e).__name__)})
+        return self.state
+
+
+def rollback(cfg, client, job_id: str) -> Dict[str, Any]:
+    """Point the aliases back at the job's source index, carrying over chunks ingested since the swap."""
+    state = load_job(cfg, job_id)
+    if state["status"] != "done" or not state.get("rollback_available"):
+        raise AppError("REINDEX_ROLLBACK_UNAVAILABLE", f"Reindex job '{job_id}' is {state['status']} and cannot be rolled back", 409)
+    if running_job(cfg, state["alias"]):
+        raise AppError("REINDEX_RUNNING", f"A reindex of '{state['alias']}' is running", 409)
+    old, new = state["source_index"], state["target_index"]
+    if not client.indices.exists(index=old):
+        raise AppError("REINDEX_ROLLBACK_UNAVAILABLE", f"Previous index '{old}' no longer exists", 409)
+
+    job = ReindexJob(cfg, client, alias=state["alias"])
+    job.state = {**state, "status": "rolling_back", "caught_up": 0}
+    job.save()
+    job.check_models(state["source_meta"])
+    block_writes(client, old, False)
+    # chunks ingested after the swap only exist in the new index, embedded with the new model
+    since = job.catch_up(new, old, state["source_meta"], state["swapped_at"])
+    client.indices.update_aliases(actions=job.swap_actions(new, old, aliased=True))
+    invalidate(state["alias"])
+    time.sleep(2 * LIVE_TTL_S + 1)
+    block_writes(client, new)
+    job.catch_up(new, old, state["source_meta"], since)
+    job.save(status="rolled_back", rolled_back_at=time.time())
+    logger.info("reindex_rolled_back", extra={"path": state["alias"], "provider": old})
+    return job.state
+
+
+def start_job(cfg, client, **params) -> Dict[str, Any]:
+    """Validate, then run the job on a daemon thread; returns its initial state."""
+    job = ReindexJob(cfg, client, **params)
+    if running_job(cfg, job.alias):
+        raise AppError("REINDEX_RUNNING", f"A reindex of '{job.alias}' is already running", 409)
+    job.save(status="running", phase="prepare")
+    threading.Thread(target=job.run, name=f"reindex-{job.job_id}", daemon=True).start()
+    return job.state
+
+
+def main():
+    from app.configs import load_config
+    from app.providers.SearchProvider.es_client import ESClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alias", help="chunk alias to rebuild (default ES_INDEX_CHUNKS)")
+    parser.add_argument("--embed-model", help="default EMBED_MODEL_NAME")
+    parser.add_argument("--embedding-dim", type=int, help="default ES_EMBEDDING_DIM")
+    parser.add_argument("--hnsw-m", type=int, help="default ES_HNSW_M")
+    parser.add_argument("--hnsw-ef-construction", type=int, help="default ES_HNSW_EF_CONSTRUCTION")
+    parser.add_argument("--slices", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--rollback", metavar="JOB_ID", help="move the aliases back to the job's previous index")
+    args = parser.parse_args()
+
+    cfg = load_config()
+    client = ESClient(cfg.es_url).client
+    if args.rollback:
+        print(json.dumps(rollback(cfg, client, args.rollback)))
+        return
+    job = ReindexJob(cfg, client, alias=args.alias, embed_model=args.embed_model, embedding_dim=args.embedding_dim,
+                     hnsw_m=args.hnsw_m, hnsw_ef_construction=args.hnsw_ef_construction,
+                     slices=args.slices, batch_size=args.batch_size)
+    if running_job(cfg, job.alias):
+        raise SystemExit(f"a reindex of '{job.alias}' is already running")
+    state = job.run()
+    print(json.dumps(state))
+    if state["status"] != "done":
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,90 +1,243 @@
 from typing import List, Dict, Any
 
-from elasticsearch import Elasticsearch
+import numpy as np
+
+from elasticsearch import Elasticsearch, AsyncElasticsearch
 from app.Models.index_dto import ChunkIndexDTO
+from app.providers.SearchProvider.index_layout import IndexLayout, tenant_of
+from app.providers.SearchProvider.index_versions import pinned
+from app.utils.errors import AppError
+from app.utils.metrics import es_call, es_error, timed
+from app.utils.tracing import annotate, traced
+
+def _filters(tenant: str, doc_id: str | None, doc_ids: List[str] | None = None,
+             meta_filters: List[Dict[str, Any]] | None = None) -> List[Dict[str, Any]]:
+    filters = [{"term": {"tenant": tenant}}]
+    if doc_id:
+        filters.append({"term": {"doc_id": doc_id}})
+    if doc_ids:
+        # two-stage retrieval: only chunks of the documents the doc-level kNN picked (doc_index)
+        filters.append({"terms": {"doc_id": list(doc_ids)}})
+    # metadata conditions on the chunks' denormalised fields (metadata_filters.chunk_clauses)
+    filters.extend(meta_filters or [])
+    return filters
+
+
+def bm25_body(tenant: str, query: str, top_k: int, doc_id: str | None = None,
+              doc_ids: List[str] | None = None, meta_filters: List[Dict[str, Any]] | None = None) -> Dict[str, Any]:
+    return {
+        "size": top_k,
+        "query": {
+            "bool": {
+                "filter": _filters(tenant, doc_id, doc_ids, meta_filters),
+                "must": [{"match": {"chunk_text": {"query": query}}}]
+            }
+        },
+        "_source": {
+            "excludes": ["embedding"]
+        }
+    }
+
+
+def vector_body(tenant: str, query_vec: np.ndarray | List[float], top_k: int, doc_id: str | None = None,
+                num_candidates: int = 0, doc_ids: List[str] | None = None,
+                meta_filters: List[Dict[str, Any]] | None = None) -> Dict[str, Any]:
+    if num_candidates:
+        # approximate: walks the (quantised) HNSW graph instead of scoring every filtered chunk
+        return {
+            "size": top_k,
+            "knn": {
+                "field": "embedding",
+                "query_vector": query_vec,
+                "k": top_k,
+                "num_candidates": max(num_candidates, top_k),
+                "filter": _filters(tenant, doc_id, doc_ids, meta_filters),
+            },
+            "_source": {
+                "excludes": ["embedding"]
+            }
+        }
+    return {
+        "size": top_k,
+        "query": {
+            "script_score": {
+                "query": {
+                    "bool": {
+                        "filter": _filters(tenant, doc_id, doc_ids, meta_filters),
+                    }
+                },
+                "script": {
+                    "source": "cosineSimilarity(params.q, 'embedding') + 1.0",
+                    "params": {"q": query_vec}
+                },
+            }
+        },
+        "_source": {
+            "excludes": ["embedding"]
+        }
+    }
+
+
+def resolve_target(layout: IndexLayout, tenant: str, write: bool = False) -> tuple:
+    """
+    (index, routing) for a tenant. Pinned to the concrete index this request's embedder resolved
+    for the alias (index_versions.pinned) so the query vector and the index it searches come from
+    one model; otherwise the read alias, or the write alias for writes.
+    """
+    index, routing = layout.target(tenant)
+    live = pinned(index)
+    if live:
+        return live["index"], routing
+    return (layout.write_name(index) if write else index), routing
+
+
+def to_hits(res: Dict[str, Any]) -> List[Dict[str, Any]]:
+    hits = res.get("hits", {}).get("hits", [])
+    return [{"es_id": h["_id"], "score": h["_score"], "source": h["_source"]} for h in hits]
+
+
+def with_diagnostics(body: Dict[str, Any], profile: bool, explain: bool) -> Dict[str, Any]:
+    # profile / explain change what ES returns, not which hits it returns
+    if profile:
+        body["profile"] = True
+    if explain:
+        body["explain"] = True
+    return body
+
+
+def _ms(nanos: int) -> float:
+    return round(nanos / 1e6, 3)
+
+
+def _query_node(node: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": node.get("type"),
+        "description": node.get("description"),
+        "time_ms": _ms(node.get("time_in_nanos", 0)),
+        "children": [_query_node(c) for c in node.get("children", [])],
+    }
+
+
+def _shard_profile(shard: Dict[str, Any]) -> Dict[str, Any]:
+    searches = shard.get("searches", [])
+    queries = [q for search in searches for q in search.get("query", [])]
+    collectors = [c for search in searches for c in search.get("collector", [])]
+    return {
+        "id": shard.get("id"),
+        "query_ms": _ms(sum(q.get("time_in_nanos", 0) for q in queries)),
+        "rewrite_ms": _ms(sum(search.get("rewrite_time", 0) for search in searches)),
+        "collector_ms": _ms(sum(c.get("time_in_nanos", 0) for c in collectors)),
+        "fetch_ms": _ms((shard.get("fetch") or {}).get("time_in_nanos", 0)),
+        "queries": [_query_node(q) for q in queries],
+    }
+
+
+def _plain(value: Any) -> Any:
+    # query bodies carry the float32 query vector; API responses need plain JSON types
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+def diagnostics(body: Dict[str, Any], res: Dict[str, Any]) -> Dict[str, Any]:
+    """ES `took`, the exact body sent, per-shard query/fetch timings (profile) and per-hit explanations (explain)."""
+    out: Dict[str, Any] = {"took_ms": res.get("took"), "query_body": _plain(body)}
+    if "profile" in res:
+        out["shards"] = [_shard_profile(shard) for shard in res["profile"].get("shards", [])]
+    if body.get("explain"):
+        out["explanations"] = {h["_id"]: h.get("_explanation") for h in res.get("hits", {}).get("hits", [])}
+    return out
+
 
 class ChunkIndex:
-    def __init__(self, client: Elasticsearch, index_name: str):
+    def __init__(self, client: Elasticsearch, index_name: str, layout: IndexLayout | None = None,
+                 knn_candidates: int = 0):
         self.client = client
         self.index_name = index_name
+        # tenant -> (index, routing); without a layout everything goes to index_name unrouted
+        self.layout = layout or IndexLayout(index_name)
+        # 0: exact script_score over the tenant's chunks; >0: kNN with that many candidates per shard
+        self.knn_candidates = knn_candidates
+        # filled by searches run with profile/explain, keyed by operation ("bm25" / "vector")
+        self.diagnostics: Dict[str, Any] = {}
         
+    @traced("es.index_chunk")
+    @timed("index")
     def upsert_chunk(self, dto: ChunkIndexDTO) -> str:
         doc_id = f"{dto.tenant}:{dto.doc_id}:{dto.chunk_id}"
-        self.client.index(
-            index=self.index_name,
-            id=doc_id,
-            document=dto.to_es_doc(),
-            refresh=True
-        )
+        index, routing = resolve_target(self.layout, dto.tenant, write=True)
+        try:
+            self.client.index(
+                index=index,
+                id=doc_id,
+                document=dto.to_es_doc(),
+                routing=routing,
+                refresh=True
+            )
+        except Exception as e:
+            es_error("index")
+            if "cluster_block_exception" in str(e):
+                # this request pinned an index that a reindex has since swapped out and write-blocked
+                raise AppError("INDEX_SWAPPED", f"'{index}' was replaced by a reindex during this request, retry it", 409) from e
+            raise
         return doc_id
     
+    @traced("es.get_chunk")
     def get_chunk(self, es_doc_id: str) -> dict:
+        index, routing = resolve_target(self.layout, tenant_of(es_doc_id))
         response = self.client.get(
-            index=self.index_name,
-            id=es_doc_id
+            index=index,
+            id=es_doc_id,
+            routing=routing
         )
         return response['_source']
     
-    def bm25_search(self, tenant :str, query : str, top_k: int= 8, doc_id: str | None = None) -> List[Dict[str, Any]]:
-        filters = [{"term": {"tenant": tenant}}]
-        if doc_id:
-            filters.append({"term": {"doc_id": doc_id}})
-        body = {
-            "size": top_k,
-            "query": {
-                "bool": {
-                    "filter": filters,
-                    "must": [{"match": {"chunk_text": {"query": query}}}]
-                }
-            },
-            "_source": {
-                "excludes": ["embedding"]
-            }
-        }
-        # print(f"BM25 index={self.index_name} tenant={tenant} q={query}")
-        res = self.client.search( index=self.index_name, body=body, request_timeout=30)
-
-        hits = res.get("hits", {}).get("hits", [])
-        # print("BM25 raw_total=", res.get("hits", {}).get("total"))
-
-        return [{"es_id": h["_id"], "score": h["_score"], "source": h["_source"]} for h in hits]
-
-
-    def vector_search(self, tenant: str, query_vec: List[float], top_k: int = 8, doc_id: str | None = None) -> List[Dict[str, Any]]:
-        filters = [{"term": {"tenant": tenant}}]
-        if doc_id:
-            filters.append({"term": {"doc_id": doc_id}})
-        body = {
-            "size": top_k,
-            "query": {
-                "script_score": {
-                    "query": {
-                        "bool": {
-                            "filter": filters,
-                        }
-                    },
-                    "script": {
-                        "source": "cosineSimilarity(params.q, 'embedding') + 1.0",
-                        "params": {"q": query_vec}
-                    },
-                }
-            },
-            "_source": {
-                "excludes": ["embedding"]
-            }
-        }
-        res = self.client.search(index=self.index_name, body=body)
+    @traced("es.bm25_search", lambda hits: {"hits": len(hits)})
+    @timed("bm25")
+    def bm25_search(self, tenant :str, query : str, top_k: int= 8, doc_id: str | None = None,
+                    profile: bool = False, explain: bool = False, doc_ids: List[str] | None = None,
+                    meta_filters: List[Dict[str, Any]] | None = None) -> List[Dict[str, Any]]:
+        body = with_diagnostics(bm25_body(tenant, query, top_k, doc_id, doc_ids, meta_filters), profile, explain)
+        index, routing = resolve_target(self.layout, tenant)
+        try:
+            res = self.client.search(index=index, body=body, routing=routing, request_timeout=30)
+        except Exception:
+            es_error("bm25")
+            raise
+        annotate(**{"es.index": index, "es.routed": routing is not None, "es.took_ms": res.get("took"), "top_k": top_k})
+        hits = to_hits(res)
+        es_call("bm25", res.get("took"), len(hits))
+        if profile or explain:
+            self.diagnostics["bm25"] = diagnostics(body, res)
+        return hits
 
-        return [
-            {
-                "es_id": hit['_id'],
-                "score": hit['_score'],
-                "source": hit['_source']
-            }
-            for hit in res['hits']['hits']
-        ]
+    @traced("es.vector_search", lambda hits: {"hits": len(hits)})
+    @timed("vector")
+    def vector_search(self, tenant: str, query_vec: np.ndarray, top_k: int = 8, doc_id: str | None = None,
+                      profile: bool = False, explain: bool = False, doc_ids: List[str] | None = None,
+                      meta_filters: List[Dict[str, Any]] | None = None) -> List[Dict[str, Any]]:
+        body = with_diagnostics(vector_body(tenant, query_vec, top_k, doc_id, self.knn_candidates, doc_ids, meta_filters),
+                                profile, explain)
+        index, routing = resolve_target(self.layout, tenant)
+        try:
+            res = self.client.search(index=index, body=body, routing=routing)
+        except Exception:
+            es_error("vector")
+            raise
+        annotate(**{"es.index": index, "es.routed": routing is not None, "es.took_ms": res.get("took"), "top_k": top_k,
+                    "es.knn": bool(self.knn_candidates)})
+        hits = to_hits(res)
+        es_call("vector", res.get("took"), len(hits))
+        if profile or explain:
+            self.diagnostics["vector"] = diagnostics(body, res)
+        return hits
 
 
+    @traced("es.count_chunks")
     def count_chunks(self, tenant: str, scope: str, doc_id: str) -> int:
         body = {
             "query": {
@@ -97,5 +250,57 @@ class ChunkIndex:
                 }
             }
         }
-        res = self.client.count(index=self.index_name, body=body)
-        return res.get("count", 0)
\ No newline at end of file
+        index, routing = resolve_target(self.layout, tenant)
+        res = self.client.count(index=index, body=body, routing=routing)
+        return res.get("count", 0)
+
+
+class AsyncChunkIndex:
+    """Read side of ChunkIndex on AsyncElasticsearch, used by the ASGI serving mode."""
+    def __init__(self, client: AsyncElasticsearch, index_name: str, layout: IndexLayout | None = None,
+                 knn_candidates: int = 0):
+        self.client = client
+        self.index_name = index_name
+        self.layout = layout or IndexLayout(index_name)
+        self.knn_candidates = knn_candidates
+        self.diagnostics: Dict[str, Any] = {}
+
+    @traced("es.bm25_search", lambda hits: {"hits": len(hits)})
+    @timed("bm25")
+    async def bm25_search(self, tenant: str, query: str, top_k: int = 8, doc_id: str | None = None,
+                          profile: bool = False, explain: bool = False, doc_ids: List[str] | None = None,
+                          meta_filters: List[Dict[str, Any]] | None = None) -> List[Dict[str, Any]]:
+        body = with_diagnostics(bm25_body(tenant, query, top_k, doc_id, doc_ids, meta_filters), profile, explain)
+        index, routing = resolve_target(self.layout, tenant)
+        try:
+            res = await self.client.search(index=index, body=body, routing=routing, request_timeout=30)
+        except Exception:
+            es_error("bm25")
+            raise
+        annotate(**{"es.index": index, "es.routed": routing is not None, "es.took_ms": res.get("took"), "top_k": top_k})
+        hits = to_hits(res)
+        es_call("bm25", res.get("took"), len(hits))
+        if profile or explain:
+            self.diagnostics["bm25"] = diagnostics(body, res)
+        return hits
+
+    @traced("es.vector_search", lambda hits: {"hits": len(hits)})
+    @timed("vector")
+    async def vector_search(self, tenant: str, query_vec: np.ndarray, top_k: int = 8, doc_id: str | None = None,
+                            profile: bool = False, explain: bool = False, doc_ids: List[str] | None = None,
+                            meta_filters: List[Dict[str, Any]] | None = None) -> List[Dict[str, Any]]:
+        body = with_diagnostics(vector_body(tenant, query_vec, top_k, doc_id, self.knn_candidates, doc_ids, meta_filters),
+                                profile, explain)
+        index, routing = resolve_target(self.layout, tenant)
+        try:
+            res = await self.client.search(index=index, body=body, routing=routing)
+        except Exception:
+            es_error("vector")
+            raise
+        annotate(**{"es.index": index, "es.routed": routing is not None, "es.took_ms": res.get("took"), "top_k": top_k,
+                    "es.knn": bool(self.knn_candidates)})
+        hits = to_hits(res)
+        es_call("vector", res.get("took"), len(hits))
+        if profile or explain:
+            self.diagnostics["vector"] = diagnostics(body, res)
+        return hits
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.Logger.log_main import get_logger
+from app.utils.metrics import cache_event
+from app.utils.tracing import annotate, traced
+
+logger = get_logger()
+
+# other workers share the directory; their writes only show up in our byte count after a rescan
+RESCAN_INTERVAL_S = 30.0
+
+_CACHES: Dict[str, "DiskCache"] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class DiskCache:
+    """
+    Content-addressed blob cache on local disk with a byte budget.
+
+    Layout under `cache_dir`:
+      blobs/<sha256[:2]>/<sha256>   object bytes, shared by every key with the same content
+      keys/<sha256(key)>.json       {key, etag, sha256, size}
+
+    Recency is the blob's mtime (touched on every hit), so LRU eviction works across the
+    worker processes that share the directory.
+    """
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = 0
+        self._last_scan = 0.0
+        (self.dir / "blobs").mkdir(parents=True, exist_ok=True)
+        (self.dir / "keys").mkdir(parents=True, exist_ok=True)
+        self._evict(sweep_keys=True)
+
+    def _key_path(self, key: str) -> Path:
+        return self.dir / "keys" / f"{_sha256(key.encode('utf-8'))}.json"
+
+    def _blob_path(self, sha: str) -> Path:
+        return self.dir / "blobs" / sha[:2] / sha
+
+    def lookup(self, key: str) -> Optional[dict]:
+        try:
+            return json.loads(self._key_path(key).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get(self, entry: dict) -> Optional[bytes]:
+        path = self._blob_path(entry["sha256"])
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted (possibly by another worker) since the key entry was written
+            return None
+        if len(data) != entry["size"]:
+            return None
+        return data
+
+    def put(self, key: str, content: bytes, etag: Optional[str]) -> None:
+        sha = _sha256(content)
+        blob = self._blob_path(sha)
+        if not blob.exists():
+            _write_atomic(blob, content)
+            with self._lock:
+                self._total += len(content)
+        _write_atomic(self._key_path(key), json.dumps(
+            {"key": key, "etag": etag, "sha256": sha, "size": len(content)}
+        ).encode("utf-8"))
+        self._maybe_evict()
+
+    def drop(self, key: str) -> None:
+        self._key_path(key).unlink(missing_ok=True)
+
+    def _maybe_evict(self) -> None:
+        with self._lock:
+            due = self._total > self.max_bytes or time.monotonic() - self._last_scan > RESCAN_INTERVAL_S
+        if due:
+            self._evict()
+
+    def _evict(self, sweep_keys: bool = False) -> None:
+        """
+        Rescan the blob store and delete least-recently-used blobs until it fits the budget. Key
+        entries left pointing at a deleted blob are removed in the same pass (and on startup,
+        `sweep_keys`, for blobs other workers evicted), so keys/ does not grow without bound.
+        """
+        with self._lock:
+            blobs = []
+            for path in (self.dir / "blobs").glob("*/*"):
+                if path.name.endswith(".tmp"):
+                    continue
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                blobs.append((st.st_mtime, st.st_size, path))
+            total = sum(size for _, size, _ in blobs)
+            evicted = False
+            # evict down to 90% so a full cache does not rescan on every write
+            if total > self.max_bytes:
+                for _, size, path in sorted(blobs, key=lambda b: b[0]):
+                    if total <= self.max_bytes * 0.9:
+                        break
+                    path.unlink(missing_ok=True)
+                    total -= size
+                    evicted = True
+            self._total = total
+            self._last_scan = time.monotonic()
+        orphans = self._drop_orphan_keys() if evicted or sweep_keys else 0
+        if evicted:
+            logger.info("storage_cache_evicted")
+        if orphans:
+            logger.info("storage_cache_keys_dropped")
+
+    def _drop_orphan_keys(self) -> int:
+        dropped = 0
+        for path in (self.dir / "keys").glob("*.json"):
+            try:
+                sha = json.loads(path.read_text())["sha256"]
+            except FileNotFoundError:
+                continue
+            except (ValueError, KeyError):
+                sha = None  # unreadable entry: lookup() would treat it as a miss anyway
+            if sha is None or not self._blob_path(sha).exists():
+                path.unlink(missing_ok=True)
+                dropped += 1
+        return dropped
+
+
+def disk_cache(cache_dir: str, max_bytes: int) -> DiskCache:
+    # one cache per directory per process: providers are created per request
+    with _CACHES_LOCK:
+        if cache_dir not in _CACHES:
+            _CACHES[cache_dir] = DiskCache(cache_dir, max_bytes)
+        return _CACHES[cache_dir]
+
+
+class CachedStorageProvider:
+    """
+    Read-through local disk cache around any storage provider (S3StorageProvider,
+    FileSystemStorageProvider). With `validate`, a hit is only served when the inner provider's
+    current ETag matches the cached one (a HEAD instead of a GET); without it cached keys are
+    trusted, which holds for the immutable raw/<tenant>/<doc_id>/ keys.
+    """
+    def __init__(self, inner, cache: DiskCache, validate: bool = True):
+        self.inner = inner
+        self.cache = cache
+        self.validate = validate and hasattr(inner, "etag")
+
+    def save(self, key: str, content: bytes):
+        etag = self.inner.save(key, content)
+        # write-through: uploads are usually ingested right after
+        try:
+            self.cache.put(key, content, etag)
+        except OSError as e:
+            self.cache.drop(key)
+            logger.warning("storage_cache_write_failed", extra={"error_code": type(e).__name__})
+        return etag
+
+    @traced("storage_cache.read", lambda body: {"bytes": len(body)})
+    def read(self, key: str) -> bytes:
+        # ETag before GET: on a race the cached bytes are never older than the ETag they are stored under
+        etag = self.inner.etag(key) if self.validate else None
+        entry = self.cache.lookup(key)
+        if entry is not None and self.validate and entry.get("etag") != etag:
+            entry = None
+        data = self.cache.get(entry) if entry is not None else None
+        cache_event("storage", data is not None)
+        annotate(cache_hit=data is not None)
+        if data is not None:
+            return data
+
+        data = self.inner.read(key)
+        try:
+            self.cache.put(key, data, etag)
+        except OSError as e:
+            # a full or read-only cache disk must not fail the read
+            logger.warning("storage_cache_write_failed", extra={"error_code": type(e).__name__})
+        return data
+
+    def exists(self, key: str) -> bool:
+        if not self.validate and self.cache.lookup(key) is not None:
+            return True
+        return self.inner.exists(key)
+
+    def etag(self, key: str) -> str:
+        return self.inner.etag(key)
@@ -0,0 +1,26 @@
+from app.utils.errors import AppError
+
+BACKENDS = ("s3", "fs")
+
+
+def _backend(cfg):
+    if cfg.storage_backend == "s3":
+        from app.providers.StorageProvider.s3_provider import S3StorageProvider
+        return S3StorageProvider(cfg.s3_bucket, cfg.aws_region)
+    if cfg.storage_backend == "fs":
+        from app.providers.StorageProvider.fs_provider import FileSystemStorageProvider
+        return FileSystemStorageProvider(cfg.storage_fs_dir)
+    raise AppError("STORAGE_BACKEND_INVALID", f"STORAGE_BACKEND must be one of: {BACKENDS}", 500)
+
+
+def get_storage(cfg):
+    """
+    Raw document storage selected by STORAGE_BACKEND: `s3` (default) or `fs` (local directory),
+    behind the local disk cache unless STORAGE_CACHE_MAX_BYTES is 0.
+    """
+    storage = _backend(cfg)
+    if cfg.storage_cache_max_bytes <= 0:
+        return storage
+    from app.providers.StorageProvider.cached_provider import CachedStorageProvider, disk_cache
+    cache = disk_cache(cfg.storage_cache_dir, cfg.storage_cache_max_bytes)
+    return CachedStorageProvider(storage, cache, validate=cfg.storage_cache_validate)
@@ -0,0 +1,71 @@
+import os
+
+from flask import g, request, send_file
+from flask_restx import Namespace, Resource
+
+from app.providers.SearchProvider.es_client import ESClient
+from app.providers.SearchProvider.reindex import list_jobs, load_job, rollback, start_job
+from app.utils.admin_auth import require_admin
+from app.utils.profiling import list_profiles, profile_path
+from app.utils.slowlog import top_slow
+
+ns = Namespace("admin", description="Operator diagnostics (requires X-Admin-Token)", path="/v1/admin")
+
+@ns.route("/profiles")
+class Profiles(Resource):
+    def get(self):
+        """Recent request profiles, newest first (?limit=50)."""
+        require_admin()
+        limit = request.args.get("limit", 50, type=int)
+        return {"profiles": list_profiles(g.cfg, limit)}
+
+@ns.route("/profiles/<string:name>")
+class ProfileDownload(Resource):
+    def get(self, name):
+        """Download one profile: `.folded` (flamegraph.pl / speedscope) or `.prof` (pstats / snakeviz)."""
+        require_admin()
+        path = profile_path(g.cfg, name)
+        return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+
+@ns.route("/slow-requests")
+class SlowRequests(Resource):
+    def get(self):
+        """Top-N slowest requests of the last window with their stage breakdown (?n=20&window_s=3600&endpoint=/v1/rag/query)."""
+        require_admin()
+        n = request.args.get("n", 20, type=int)
+        window_s = request.args.get("window_s", 3600, type=float)
+        endpoint = request.args.get("endpoint") or None
+        return {"window_s": window_s, "requests": top_slow(g.cfg, n, window_s, endpoint)}
+
+@ns.route("/reindex")
+class Reindex(Resource):
+    def get(self):
+        """Recent reindex jobs with their progress, newest first (?limit=20)."""
+        require_admin()
+        return {"jobs": list_jobs(g.cfg, request.args.get("limit", 20, type=int))}
+
+    def post(self):
+        """
+        Rebuild a chunk index in the background and swap it in behind its aliases. Body (all optional):
+        alias, embed_model, tenant_models, embedding_dim, hnsw_m, hnsw_ef_construction, slices, batch_size;
+        defaults come from the current config.
+        """
+        require_admin()
+        body = request.get_json(silent=True) or {}
+        params = {k: body[k] for k in ("alias", "embed_model", "tenant_models", "embedding_dim", "hnsw_m",
+                                       "hnsw_ef_construction", "slices", "batch_size") if body.get(k) is not None}
+        return start_job(g.cfg, ESClient(g.cfg.es_url).client, **params), 202
+
+@ns.route("/reindex/<string:job_id>")
+class ReindexStatus(Resource):
+    def get(self, job_id):
+        """One job: phase, copied / total, rate, ETA, source and target index."""
+        require_admin()
+        return load_job(g.cfg, job_id)
+
+@ns.route("/reindex/<string:job_id>/rollback")
+class ReindexRollback(Resource):
+    def post(self, job_id):
+        """Point the aliases back at the index the job replaced (blocks until done)."""
+        require_admin()
+        return rollback(g.cfg, ESClient(g.cfg.es_url).client, job_id)
@@ -3,6 +3,7 @@ from flask_restx import Namespace, Resource
 
 
 from app.providers.SearchProvider.es_client import ESClient
+from app.providers.SearchProvider.index_layout import IndexLayout
 from app.providers.SearchProvider.similarity_index import ChunkIndex
 from app.utils.errors import NotFoundError
 
@@ -12,7 +13,7 @@ ns = Namespace('chunks', description='Chunk debug endpoints', path='/v1/chunks')
 class GetChunk(Resource):
     def get(self, es_doc_id: str):
         es = ESClient(g.cfg.es_url)
-        index = ChunkIndex(es.client, g.cfg.index_chunks)
+        index = ChunkIndex(es.client, g.cfg.index_chunks, IndexLayout.from_cfg(g.cfg))
         try:
             src = index.get_chunk(es_doc_id)
         except Exception:
@@ -2,11 +2,14 @@ import uuid
 from flask import g, request
 from flask_restx import Namespace, Resource
 
-from app.providers.StorageProvider.s3_provider import S3StorageProvider
+from app.providers.StorageProvider.storage_factory import get_storage
 from app.utils.registry import Registry
-from app.utils.errors import ValidationError
+from app.utils.metadata_registry import MetadataRegistry
+from app.utils.metadata_filters import validate_metadata
+from app.utils.errors import ValidationError, NotFoundError
 from app.utils.quota_store import QuotaStore
 from app.utils.size_fmt import bytes_to_mb
+from app.utils.text_artifacts import content_sha256
 
 ns = Namespace("documents", description="Document upload & metadata", path="/v1/documents")
 
@@ -70,7 +73,7 @@ class UploadDocument(Resource):
             raise ValidationError(decision["reason"], f"Tenant upload quota exceeded: {decision}", 429)
 
         # 6) upload and registry writes
-        s3 = S3StorageProvider(g.cfg.s3_bucket, g.cfg.aws_region)
+        s3 = get_storage(g.cfg)
         reg = Registry(f"{g.cfg.local_storage_dir}/registry.json")
 
         
@@ -80,7 +83,7 @@ class UploadDocument(Resource):
             key = f"raw/{tenant}/{doc_id}/{filename}"
 
             s3.save(key, content)
-            reg.put(doc_id, {"doc_id": doc_id, "filename": filename, "s3_key": key, "tenant": tenant})
+            reg.put(doc_id, {"doc_id": doc_id, "filename": filename, "s3_key": key, "tenant": tenant, "sha256": content_sha256(content)})
 
             uploaded.append({"doc_id": doc_id, "filename": filename, "s3_key": key, "tenant": tenant})
 
@@ -120,4 +123,32 @@ class UploadDocument(Resource):
                 "files": decision.get("files_used"),
                 "bytes": decision.get("bytes_used")
             }
-        }, 201
\ No newline at end of file
+        }, 201
+
+@ns.route("/<string:doc_id>/metadata")
+class DocumentMetadata(Resource):
+    def get(self, doc_id: str):
+        tenant = (getattr(g, "tenant", "") or "").strip()
+        record = Registry(f"{g.cfg.local_storage_dir}/registry.json").get(doc_id)
+        if not record or record.get("tenant") != tenant:
+            raise NotFoundError("DOC_NOT_FOUND", f"Document with id {doc_id} not found", 404)
+        return {"doc_id": doc_id, "tenant": tenant, "metadata": record.get("metadata") or {}}
+
+    def put(self, doc_id: str):
+        """
+        Replace a document's metadata ({"metadata": {field: value}}), typed by the metadata registry.
+        Chunks carry it from the next ingest: POST /v1/ingest/<doc_id> re-indexes them.
+        """
+        tenant = (getattr(g, "tenant", "") or "").strip()
+        if not tenant:
+            raise ValidationError("MISSING_TENANT", "Request must include 'X-Tenant-Id' header", 400)
+        reg = Registry(f"{g.cfg.local_storage_dir}/registry.json")
+        record = reg.get(doc_id)
+        if not record or record.get("tenant") != tenant:
+            raise NotFoundError("DOC_NOT_FOUND", f"Document with id {doc_id} not found", 404)
+
+        payload = request.get_json(silent=True) or {}
+        metadata = validate_metadata(MetadataRegistry(g.cfg.metadata_registry_path), payload.get("metadata"))
+        reg.put(doc_id, {**record, "metadata": metadata})
+        return {"status": "success", "doc_id": doc_id, "tenant": tenant, "metadata": metadata,
+                "message": f"Re-ingest the document (POST /v1/ingest/{doc_id}) to apply the metadata to its chunks"}
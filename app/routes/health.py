@@ -1,10 +1,12 @@
 from flask import g
 from flask_restx import Resource, Namespace
-from elasticsearch import Elasticsearch
 
 
 from app.providers.SearchProvider.es_client import ESClient
+from app.providers.LLMProvider.llm_scheduler import scheduler_stats
+from app.providers.EmbeddingsProvider.embedding_provider import batcher_stats, model_stats
 from app.utils.errors import UpstreamError
+from app.utils.warmup import readiness
 
 ns = Namespace("health", description="Health Check", path="/v1/health")
 
@@ -29,8 +31,29 @@ class HealthES(Resource):
 class HealthIndex(Resource):
     def get(self):
         """Health check for Elasticsearch index."""
-        es = Elasticsearch(g.cfg.es_url)
+        es = ESClient(g.cfg.es_url).client
         exist = bool(es.indices.exists(index=g.cfg.index_chunks))
         if not exist:
             raise UpstreamError("ES_INDEX_MISSING", f"Elasticsearch index '{g.cfg.index_chunks}' does not exist", 503)
-        return {"status": "ok", "index": g.cfg.index_chunks, "es_index": "exists"}
\ No newline at end of file
+        return {"status": "ok", "index": g.cfg.index_chunks, "es_index": "exists"}
+
+@ns.route("/llm")
+class HealthLLM(Resource):
+    def get(self):
+        """LLM scheduler state per provider (rate-limit budget usage, queue depth, circuit breaker)."""
+        return {"status": "ok", "providers": scheduler_stats()}
+
+@ns.route("/embeddings")
+class HealthEmbeddings(Resource):
+    def get(self):
+        """Embedding model residency / load stats and micro-batcher stats (batch fill, queueing delay)."""
+        return {"status": "ok", "models": model_stats(), "batchers": batcher_stats()}
+
+@ns.route("/ready")
+class HealthReady(Resource):
+    def get(self):
+        """Readiness: 200 only once warmup (model, dummy embed, tokenizer, ES indices) has completed."""
+        state = readiness()
+        if not state["ready"]:
+            return {"status": "warming_up", **state}, 503
+        return {"status": "ready", **state}
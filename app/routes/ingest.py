@@ -3,15 +3,20 @@ from flask import g
 from flask_restx import Namespace, Resource
 
 from app.utils.registry import Registry
+from app.utils.metadata_registry import MetadataRegistry
+from app.utils.metadata_filters import chunk_meta, doc_meta_kv
 from app.providers.StorageProvider.local_provider import LocalStorageProvider
-from app.utils.text_extract import extract_text
-from app.providers.Chunking.chunker import chunk_text
-from app.providers.EmbeddingsProvider.embedding_provider import LocalEmbeddingProvider
-from app.providers.StorageProvider.s3_provider import S3StorageProvider
+from app.utils.text_artifacts import load_document_text
+from app.providers.EmbeddingsProvider.embedding_provider import get_embedder
+from app.providers.StorageProvider.storage_factory import get_storage
 from app.providers.SearchProvider.es_client import ESClient
+from app.providers.SearchProvider.index_layout import IndexLayout
 from app.providers.SearchProvider.similarity_index import ChunkIndex
+from app.providers.SearchProvider.doc_index import DocIndex
+from app.utils.metrics import ingest_chunks
 from app.Models.index_dto import ChunkIndexDTO
 from app.utils.errors import ValidationError, NotFoundError
+from app.utils.warmup import require_indices
 
 ns = Namespace("ingest", description="Ingest documents into the system", path="/v1/ingest")
 
@@ -19,6 +24,7 @@ ns = Namespace("ingest", description="Ingest documents into the system", path="/
 class IngestDoc(Resource):
     def post(self, doc_id: str):
         """Ingest a document by its ID: extract text, chunk, embed, and index."""
+        require_indices()
         # Retrieve document metadata
         reg= Registry(f"{g.cfg.local_storage_dir}/registry.json")
         record = reg.get(doc_id)
@@ -29,8 +35,6 @@ class IngestDoc(Resource):
         # content = storage.read(record["path"])
         # filename = record["filename"]
 
-        s3 = S3StorageProvider(g.cfg.s3_bucket, g.cfg.aws_region)
-        content = s3.read(record["s3_key"])
         filename = record["filename"]
         request_tenant = (getattr(g, "tenant", "") or "").strip()
         if not request_tenant:
@@ -43,23 +47,28 @@ class IngestDoc(Resource):
         if tenant != request_tenant:
             raise ValidationError("TENANT_MISMATCH", f"Document {doc_id} belongs to tenant {tenant}, not {request_tenant}", 403)
 
-        text = extract_text(filename, content)
-        if not text.strip():
+        # extracted text + chunks come from the text artifact when this doc was parsed before
+        doc = load_document_text(g.cfg, record, get_storage(g.cfg))
+        if not doc.text.strip():
             raise ValidationError("EMPTY_TEXT", f"Extracted text from document {doc_id} is empty", 400)
         scope = "corpus"
 
-        chunks = chunk_text(text)
+        chunks = doc.chunks
         if not chunks:
             raise ValidationError("EMPTY_CHUNKS", f"Chunked text from document {doc_id} is empty", 400)
         
-        embedder = LocalEmbeddingProvider(g.cfg.embed_model_name)
+        embedder = get_embedder(g.cfg, tenant)
         es = ESClient(g.cfg.es_url)
-        index = ChunkIndex(es.client, g.cfg.index_chunks)
+        index = ChunkIndex(es.client, g.cfg.index_chunks, IndexLayout.from_cfg(g.cfg))
 
 
+        # document metadata goes onto every chunk so filters apply inside the searches
+        fields = MetadataRegistry(g.cfg.metadata_registry_path)
+        meta = chunk_meta(fields, record.get("metadata"))
+
         es_ids = []
-        for i, ch in enumerate(chunks, start=1):
-            vec = embedder.embed_text(ch)
+        vecs = embedder.embed_texts(chunks)
+        for i, (ch, vec) in enumerate(zip(chunks, vecs), start=1):
             dto = ChunkIndexDTO(
                 tenant=tenant,
                 scope=scope,
@@ -69,10 +78,15 @@ class IngestDoc(Resource):
                 created_at=ChunkIndexDTO.now_iso(),
                 chunk_text=ch,
                 embedding=vec,
+                meta=meta,
             )
             es_doc_id = index.upsert_chunk(dto)
             es_ids.append(es_doc_id)
 
+        # doc-level vector for the first stage of two-stage retrieval
+        DocIndex(es.client, g.cfg.index_docs).upsert_doc(tenant, doc_id, record, vecs, embedder.model_name, doc.text,
+                                                         doc_meta_kv(fields, record.get("metadata")))
+        ingest_chunks(len(es_ids))
         return {"status": "success", "doc_id": doc_id, "chunks_indexed": len(es_ids)}, 201
     
 
@@ -80,6 +94,7 @@ class IngestDoc(Resource):
 class IngestTenant(Resource):
     def post(self):
         """Ingest all unindexed documents for a tenant."""
+        require_indices()
         request_tenant = (getattr(g, "tenant", "") or "").strip()
         if not request_tenant:
             raise ValidationError("MISSING_TENANT", "Request must include 'X-Tenant-Id' header", 400)
@@ -90,10 +105,12 @@ class IngestTenant(Resource):
             raise NotFoundError("NO_DOCS_FOUND", f"No documents found for tenant {request_tenant}", 404)
         
         # Create Heavy dependencies once
-        s3 = S3StorageProvider(g.cfg.s3_bucket, g.cfg.aws_region)
-        embedder = LocalEmbeddingProvider(g.cfg.embed_model_name)
+        s3 = get_storage(g.cfg)
+        embedder = get_embedder(g.cfg, request_tenant)
         es = ESClient(g.cfg.es_url)
-        index = ChunkIndex(es.client, g.cfg.index_chunks)
+        index = ChunkIndex(es.client, g.cfg.index_chunks, IndexLayout.from_cfg(g.cfg))
+        docs = DocIndex(es.client, g.cfg.index_docs)
+        fields = MetadataRegistry(g.cfg.metadata_registry_path)
         scope = "corpus"
 
         summary = {
@@ -115,20 +132,20 @@ class IngestTenant(Resource):
                     continue
                 
                 # Ingest pipeline
-                content = s3.read(record["s3_key"])
                 filename = record["filename"]
 
-                text = extract_text(filename, content)
-                if not text.strip():
+                doc = load_document_text(g.cfg, record, s3)
+                if not doc.text.strip():
                     raise ValidationError("EMPTY_TEXT", f"Extracted text from document {doc_id} is empty", 400)
                 
-                chunks = chunk_text(text)
+                chunks = doc.chunks
                 if not chunks:
                     raise ValidationError("EMPTY_CHUNKS", f"Chunked text from document {doc_id} is empty", 400)
 
+                meta = chunk_meta(fields, record.get("metadata"))
                 es_ids = []
-                for i, ch in enumerate(chunks, start=1):
-                    vec = embedder.embed_text(ch)
+                vecs = embedder.embed_texts(chunks)
+                for i, (ch, vec) in enumerate(zip(chunks, vecs), start=1):
                     dto = ChunkIndexDTO(
                         tenant=request_tenant,
                         scope=scope,
@@ -138,9 +155,13 @@ class IngestTenant(Resource):
                         created_at=ChunkIndexDTO.now_iso(),
                         chunk_text=ch,
                         embedding=vec,
+                        meta=meta,
                     )
                     es_ids.append(index.upsert_chunk(dto))
 
+                docs.upsert_doc(request_tenant, doc_id, record, vecs, embedder.model_name, doc.text,
+                                doc_meta_kv(fields, record.get("metadata")))
+                ingest_chunks(len(es_ids))
                 summary["ingested"].append({"doc_id": doc_id, "chunks_indexed": len(es_ids)})
 
             except Exception as e:
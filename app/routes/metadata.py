@@ -0,0 +1,25 @@
+from flask import g, request
+from flask_restx import Namespace, Resource
+
+from app.utils.errors import ValidationError
+from app.utils.metadata_registry import MetadataRegistry
+
+ns = Namespace("metadata", description="Metadata field registry", path="/v1/metadata")
+
+@ns.route("/fields")
+class MetadataFields(Resource):
+    def get(self):
+        """Registered metadata fields with their types."""
+        reg = MetadataRegistry(g.cfg.metadata_registry_path)
+        return {"fields": reg.list_fields()}
+
+    def post(self):
+        """Register (or update) a field: key, type (string / number / boolean / date), description, indexed."""
+        payload = request.get_json(silent=True) or {}
+        reg = MetadataRegistry(g.cfg.metadata_registry_path)
+        try:
+            field = reg.register_field(payload.get("key"), payload.get("type"), payload.get("description", ""),
+                                       payload.get("indexed", True))
+        except ValueError as e:
+            raise ValidationError("INVALID_METADATA_FIELD", str(e), 400)
+        return field, 201
@@ -0,0 +1,13 @@
+from flask import Response
+from flask_restx import Namespace, Resource
+
+from app.utils.metrics import render
+
+ns = Namespace("metrics", description="Prometheus metrics", path="/metrics")
+
+@ns.route("")
+class Metrics(Resource):
+    def get(self):
+        """Prometheus exposition (request / stage latency histograms, LLM tokens, cache, ES errors, ingest chunks)."""
+        body, content_type = render()
+        return Response(body, content_type=content_type)
@@ -1,49 +1,56 @@
+import time
 from flask import g, request
 from flask_restx import Namespace, Resource
 
-from app.providers.EmbeddingsProvider.embedding_provider import LocalEmbeddingProvider
+from app.providers.EmbeddingsProvider.embedding_provider import get_embedder
 from app.providers.SearchProvider.es_client import ESClient
+from app.providers.SearchProvider.index_layout import IndexLayout
 from app.providers.SearchProvider.similarity_index import ChunkIndex
-from app.utils.errors import ValidationError
+from app.providers.SearchProvider.doc_index import DocIndex
 from app.utils.hybrid_merge import merge_results
-
-from app.Logger.log_main import get_logger
+from app.utils.metadata_filters import chunk_clauses, doc_clauses
+from app.utils.rag_handlers import parse_retrieve, retrieve_body, shared_response
+from app.utils.single_flight import SingleFlight, coalesce
 
 ns = Namespace("retrieve", description="Hybrid retrieval (BM25 + vector)", path="/v1/retrieve")
-logger = get_logger()
+
+RETRIEVE_FLIGHT = SingleFlight("retrieve")
 
 @ns.route("/")
 class Retrieve(Resource):
     def post(self):
-        
-        print("DEBUG raw body:", request.get_data(as_text=True))
-        print("DEBUG json:", request.get_json(silent=True))
-        print("DEBUG content-type:", request.content_type)
-
-
-        payload = request.get_json(silent=True) or {}
-        query = (payload.get("query") or "").strip()
-        top_k = int(payload.get("top_k") or 8)
-        tenant = payload.get("tenant") or "demo"
-        logger.info("debug_retrieve_payload", extra={"content_type": request.content_type, "raw": request.get_data(as_text=True)})
-        if not query:
-            raise ValidationError("MISSING_QUERY", "Request must include non-empty 'query'", 400)
-
-        embedder = LocalEmbeddingProvider(g.cfg.embed_model_name)
-        qvec = embedder.embed_text(query)
-
-        es = ESClient(g.cfg.es_url)
-        index = ChunkIndex(es.client, g.cfg.index_chunks)
-
-        bm25 = index.bm25_search(tenant=tenant, query=query, top_k=top_k)
-        vec = index.vector_search(tenant=tenant, query_vec=qvec, top_k=top_k)
-
-        merged = merge_results(bm25, vec, w_bm25=0.5, w_vec=0.5, top_k=top_k)
-
-        return {
-            "status": "success",
-            "query": query,
-            "top_k": top_k,
-            "tenant": tenant,
-            "results": merged,
-        }
+        started = time.time()
+        req = parse_retrieve(g.cfg, request.get_json(silent=True) or {})
+
+        def search():
+            t0 = time.time()
+            embedder = get_embedder(g.cfg, req.tenant)
+            qvec = embedder.embed_text(req.query)
+            t_embed = int((time.time() - t0) * 1000)
+
+            t1 = time.time()
+            es = ESClient(g.cfg.es_url)
+            index = ChunkIndex(es.client, g.cfg.index_chunks, IndexLayout.from_cfg(g.cfg), g.cfg.es_knn_num_candidates)
+
+            doc_ids = None
+            if req.mode == "two_stage":
+                docs = DocIndex(es.client, g.cfg.index_docs, g.cfg.retrieval_doc_top_m, g.cfg.retrieval_doc_num_candidates)
+                doc_ids = docs.top_docs(req.tenant, qvec, embedder.model_name, doc_clauses(req.conditions))
+
+            meta_filters = chunk_clauses(req.conditions)
+            bm25 = index.bm25_search(tenant=req.tenant, query=req.query, top_k=req.top_k, profile=req.profile,
+                                     explain=req.explain, doc_ids=doc_ids, meta_filters=meta_filters)
+            vec = index.vector_search(tenant=req.tenant, query_vec=qvec, top_k=req.top_k, profile=req.profile,
+                                      explain=req.explain, doc_ids=doc_ids, meta_filters=meta_filters)
+
+            t_search = time.time()
+            merged = merge_results(bm25, vec, w_bm25=0.5, w_vec=0.5, top_k=req.top_k)
+            t_merge = int((time.time() - t_search) * 1000)
+            t_retrieve = int((time.time() - t1) * 1000)
+            return retrieve_body(req, doc_ids, merged, t_embed, t_retrieve, t_merge, t0, index.diagnostics)
+
+        # profile / explain diagnostics belong to the request that asked for them: never shared
+        if req.profile or req.explain:
+            return search()
+        return coalesce(g.cfg, RETRIEVE_FLIGHT, req.key, search,
+                        share=lambda r: shared_response(r, req.query, started))
@@ -1,8 +1,10 @@
+import time
 from flask import g, request
 from flask_restx import Namespace, Resource
 
-from app.providers.EmbeddingsProvider.embedding_provider import LocalEmbeddingProvider
+from app.providers.EmbeddingsProvider.embedding_provider import get_embedder
 from app.providers.SearchProvider.es_client import ESClient
+from app.providers.SearchProvider.index_layout import IndexLayout
 from app.providers.SearchProvider.similarity_index import ChunkIndex
 from app.utils.errors import ValidationError
 
@@ -11,32 +13,48 @@ ns = Namespace("retrieve_debug", description="Debug retrieval components", path=
 @ns.route("/bm25")
 class DebugBM25(Resource):
     def post(self):
+        """BM25 hits. `profile: true` / `explain: true` add ES query profile, per-hit explanations and the exact query body."""
         payload = request.get_json(silent=True) or {}
         query = (payload.get("query") or "").strip()
         top_k = int(payload.get("top_k") or 8)
         tenant = payload.get("tenant") or "demo"
+        profile, explain = bool(payload.get("profile")), bool(payload.get("explain"))
         if not query:
             raise ValidationError("MISSING_QUERY", "query required", 400)
 
+        t0 = time.time()
         es = ESClient(g.cfg.es_url)
-        index = ChunkIndex(es.client, g.cfg.index_chunks)
-        bm25 = index.bm25_search(tenant=tenant, query=query, top_k=top_k)
-        return {"status": "success", "tenant": tenant, "query": query, "bm25": bm25}
+        index = ChunkIndex(es.client, g.cfg.index_chunks, IndexLayout.from_cfg(g.cfg))
+        bm25 = index.bm25_search(tenant=tenant, query=query, top_k=top_k, profile=profile, explain=explain)
+        resp = {"status": "success", "tenant": tenant, "query": query, "bm25": bm25}
+        if profile or explain:
+            resp["es_diagnostics"] = index.diagnostics
+            resp["timings_ms"] = {"bm25": int((time.time() - t0) * 1000)}
+        return resp
 
 @ns.route("/vector")
 class DebugVector(Resource):
     def post(self):
+        """Vector hits. `profile: true` / `explain: true` add ES query profile, per-hit explanations and the exact query body."""
         payload = request.get_json(silent=True) or {}
         query = (payload.get("query") or "").strip()
         top_k = int(payload.get("top_k") or 8)
         tenant = payload.get("tenant") or "demo"
+        profile, explain = bool(payload.get("profile")), bool(payload.get("explain"))
         if not query:
             raise ValidationError("MISSING_QUERY", "query required", 400)
 
-        embedder = LocalEmbeddingProvider(g.cfg.embed_model_name)
+        t0 = time.time()
+        embedder = get_embedder(g.cfg, tenant)
         qvec = embedder.embed_text(query)
+        t_embed = int((time.time() - t0) * 1000)
 
+        t1 = time.time()
         es = ESClient(g.cfg.es_url)
-        index = ChunkIndex(es.client, g.cfg.index_chunks)
-        vec = index.vector_search(tenant=tenant, query_vec=qvec, top_k=top_k)
-        return {"status": "success", "tenant": tenant, "query": query, "vector": vec}
+        index = ChunkIndex(es.client, g.cfg.index_chunks, IndexLayout.from_cfg(g.cfg), g.cfg.es_knn_num_candidates)
+        vec = index.vector_search(tenant=tenant, query_vec=qvec, top_k=top_k, profile=profile, explain=explain)
+        resp = {"status": "success", "tenant": tenant, "query": query, "vector": vec}
+        if profile or explain:
+            resp["es_diagnostics"] = index.diagnostics
+            resp["timings_ms"] = {"embed": t_embed, "vector": int((time.time() - t1) * 1000)}
+        return resp
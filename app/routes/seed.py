@@ -6,19 +6,22 @@ from flask import g
 from flask_restx import Namespace, Resource, fields
 
 from app.providers.SearchProvider.es_client import ESClient
+from app.providers.SearchProvider.index_layout import IndexLayout
 from app.providers.SearchProvider.similarity_index import ChunkIndex
-from app.providers.EmbeddingsProvider.embedding_provider import LocalEmbeddingProvider
+from app.providers.EmbeddingsProvider.embedding_provider import get_embedder
 from app.Models.index_dto import ChunkIndexDTO
+from app.utils.warmup import require_indices
 
 ns = Namespace('seed', description='Seed data into Elasticsearch for testing the search pipeline', path='/v1/seed')
 
 @ns.route('/chunk')
 class SeedChunk(Resource):
     def post(self):
+        require_indices()
         # Hardcode sample chunk (Enterprise pattern: deterministic seed for health testing)
         text = "This is a sample clause about termination and notice period for 30 days"
 
-        embedder = LocalEmbeddingProvider(g.cfg.embed_model_name)
+        embedder = get_embedder(g.cfg, "demo")
         vec = embedder.embed_text(text)
 
         # wrap in DTO
@@ -34,7 +37,7 @@ class SeedChunk(Resource):
         )
 
         es = ESClient(g.cfg.es_url)
-        index = ChunkIndex(es.client, g.cfg.index_chunks)
+        index = ChunkIndex(es.client, g.cfg.index_chunks, IndexLayout.from_cfg(g.cfg))
         es_doc_id = index.upsert_chunk(dto)
 
         return {"status": "ok", "es_doc_id": es_doc_id, "doc_id": dto.doc_id, "chunk_id": dto.chunk_id}
\ No newline at end of file
@@ -0,0 +1,20 @@
+import hmac
+
+from flask import g, request
+
+from app.utils.errors import AppError
+
+
+def is_admin(cfg) -> bool:
+    """True when ADMIN_TOKEN is set and the request carries it in X-Admin-Token."""
+    token = request.headers.get("X-Admin-Token", "")
+    # compared as bytes: compare_digest raises TypeError on non-ASCII str (a 500 instead of a 403)
+    return bool(cfg.admin_token) and hmac.compare_digest(token.encode("utf-8"), cfg.admin_token.encode("utf-8"))
+
+
+def require_admin() -> None:
+    # admin endpoints are disabled outright when no token is configured
+    if not g.cfg.admin_token:
+        raise AppError("ADMIN_DISABLED", "Admin endpoints are disabled (ADMIN_TOKEN is not set)", 404)
+    if not is_admin(g.cfg):
+        raise AppError("FORBIDDEN", "Missing or invalid X-Admin-Token", 403)
@@ -0,0 +1,93 @@
+import functools
+import math
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from app.Logger.log_main import get_logger, request_body_extra
+from app.providers.SearchProvider import index_versions
+from app.utils.errors import AppError
+from app.utils import metrics, slowlog
+from app.utils.tracing import current_trace_id, tracer
+
+logger = get_logger()
+
+
+def endpoint(fn: Callable[[Request], Awaitable[Any]]):
+    """
+    ASGI counterpart of the Flask before/after_request hooks and error handlers in WebAPI:
+    request id, tenant and config on request.state, the same error envelope,
+    X-Request-ID on the response and the request_complete log line.
+    Handlers return `body` or `(body, status)` like flask-restx resources.
+    """
+    @functools.wraps(fn)
+    async def handler(request: Request) -> JSONResponse:
+        request.state.request_id = request.headers.get("X-Request-ID", str(uuid.uuid4()))
+        request.state.tenant = request.headers.get("X-Tenant-Id", "").strip()
+        request.state.cfg = request.app.state.cfg
+        metrics.bind_request(request.url.path, request.state.tenant)
+        index_versions.bind_request()
+        start = time.time()
+
+        span_name = f"{request.method} {request.url.path}"
+        with tracer.start_as_current_span(span_name, attributes={
+            "request_id": request.state.request_id,
+            "tenant": request.state.tenant,
+            "http.method": request.method,
+            "http.route": request.url.path,
+        }) as span:
+            try:
+                result = await fn(request)
+                body, status = result if isinstance(result, tuple) else (result, 200)
+                resp = JSONResponse(body, status_code=status)
+            except AppError as err:
+                headers = {}
+                if getattr(err, "retry_after", None) is not None:
+                    headers["Retry-After"] = str(math.ceil(err.retry_after))
+                resp = JSONResponse(
+                    {"request_id": request.state.request_id, "error": {"code": err.code, "message": err.message}},
+                    status_code=err.http_status,
+                    headers=headers,
+                )
+            except Exception:
+                logger.exception("unhandled_error", extra={"request_id": request.state.request_id})
+                resp = JSONResponse(
+                    {"request_id": request.state.request_id, "error": {"code": "UNHANDLED", "message": "An unexpected error occurred."}},
+                    status_code=500,
+                )
+
+            resp.headers["X-Request-ID"] = request.state.request_id
+            span.set_attribute("http.status_code", resp.status_code)
+            metrics.observe_request(request.url.path, request.method, resp.status_code, time.time() - start)
+            latency_ms = int((time.time() - start) * 1000)
+            if latency_ms >= slowlog.threshold_ms(request.state.cfg, request.url.path) > 0:
+                slowlog.record_if_slow(
+                    request.state.cfg, request_id=request.state.request_id, trace_id=current_trace_id(),
+                    endpoint=request.url.path, method=request.method, path=request.url.path,
+                    status_code=resp.status_code, duration_ms=latency_ms, tenant=request.state.tenant,
+                    payload=await read_json(request),
+                )
+            logger.info("request_complete", extra={
+                "request_id": request.state.request_id,
+                "trace_id": current_trace_id(),
+                "method": request.method,
+                "path": request.url.path,
+                "status_code": resp.status_code,
+                "latency_ms": latency_ms,
+                **(request_body_extra(request.state.cfg, await read_json(request)) if request.state.cfg.log_request_bodies else {}),
+            })
+        return resp
+
+    return handler
+
+
+async def read_json(request: Request) -> Dict[str, Any]:
+    # same leniency as request.get_json(silent=True) or {}
+    try:
+        payload = await request.json()
+    except Exception:
+        return {}
+    return payload if isinstance(payload, dict) else {}
@@ -0,0 +1,160 @@
+import re
+from typing import Any, Dict, List, Tuple
+
+from app.utils.metrics import timed
+from app.utils.tracing import traced
+from app.utils.prompt import format_context_block
+from app.utils.tokens import count_tokens, truncate_to_tokens
+
+_CHUNK_ORDINAL = re.compile(r"^c(\d+)$")
+
+
+def _ordinal(chunk_id: Any) -> int | None:
+    m = _CHUNK_ORDINAL.match(str(chunk_id or ""))
+    return int(m.group(1)) if m else None
+
+
+def _normalise(text: str) -> str:
+    return " ".join((text or "").split()).lower()
+
+
+def stitch(left: str, right: str, max_overlap: int = 400) -> str:
+    """Join two consecutive chunks, dropping the text `right` repeats from the end of `left`."""
+    for k in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:k]):
+            return left + right[k:]
+    return left + "\n" + right
+
+
+def _build_blocks(merged: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    """
+    Collapse merged hits into blocks: consecutive chunks of the same doc become one block,
+    exact duplicate texts are dropped. Returns blocks in relevance order and a map
+    {dropped es_id -> es_id of the kept duplicate}.
+    """
+    kept: List[Tuple[int, Dict[str, Any]]] = []
+    seen_ids = set()
+    seen_text: Dict[str, str] = {}
+    duplicates: Dict[str, str] = {}
+
+    for rank, item in enumerate(merged):
+        if item["es_id"] in seen_ids:
+            continue
+        seen_ids.add(item["es_id"])
+        key = _normalise(item["source"].get("chunk_text", ""))
+        if key in seen_text:
+            duplicates[item["es_id"]] = seen_text[key]
+            continue
+        seen_text[key] = item["es_id"]
+        kept.append((rank, item))
+
+    # group runs of consecutive chunk ordinals per document
+    by_doc: Dict[Any, List[Tuple[int, int, Dict[str, Any]]]] = {}
+    singles: List[List[Tuple[int, Dict[str, Any]]]] = []
+    for rank, item in kept:
+        ordinal = _ordinal(item["source"].get("chunk_id"))
+        if ordinal is None:
+            singles.append([(rank, item)])
+        else:
+            by_doc.setdefault(item["source"].get("doc_id"), []).append((ordinal, rank, item))
+
+    runs: List[List[Tuple[int, Dict[str, Any]]]] = list(singles)
+    for members in by_doc.values():
+        members.sort(key=lambda m: m[0])
+        run = [members[0]]
+        for prev, cur in zip(members, members[1:]):
+            if cur[0] == prev[0] + 1:
+                run.append(cur)
+            else:
+                runs.append([(r, it) for _, r, it in run])
+                run = [cur]
+        runs.append([(r, it) for _, r, it in run])
+
+    blocks = []
+    for run in runs:
+        first = run[0][1]
+        text = first["source"].get("chunk_text", "")
+        for _, item in run[1:]:
+            text = stitch(text, item["source"].get("chunk_text", ""))
+        chunk_ids = [item["source"].get("chunk_id") for _, item in run]
+        blocks.append({
+            "rank": min(r for r, _ in run),
+            "es_id": first["es_id"],
+            "members": [item for _, item in run],
+            "source": {
+                **first["source"],
+                "chunk_id": chunk_ids[0] if len(chunk_ids) == 1 else f"{chunk_ids[0]}-{chunk_ids[-1]}",
+                "chunk_text": text,
+            },
+        })
+
+    blocks.sort(key=lambda b: b["rank"])
+    return blocks, duplicates
+
+
+@traced("prompt.assemble", lambda c: {"prompt.context_tokens": c["tokens"], "chunks_in": c["chunks_in"], "chunks_dropped": c["chunks_dropped"]})
+@timed("prompt_build")
+def assemble_context(merged: List[Dict[str, Any]], max_tokens: int, tokenizer_name: str = "") -> Dict[str, Any]:
+    """
+    Build the prompt context from merged retrieval results under a token budget.
+
+    Blocks are filled in relevance order; a block that does not fit is skipped so smaller,
+    less relevant ones can still use the remaining budget. The first block is truncated
+    rather than dropped so the prompt never ends up empty.
+
+    Returns:
+        {
+          "blocks": [{es_id, source: {..., chunk_text}}, ...]   # pass to the prompt builders, [n] = position
+          "citations": [{ref, es_id, source, doc_id, chunk_id}, ...]  # one per chunk shown to the LLM
+          "tokens": int, "chunks_in": int, "chunks_dropped": int
+        }
+    """
+    blocks, duplicates = _build_blocks(merged)
+
+    selected: List[Dict[str, Any]] = []
+    used = 0
+    for block in blocks:
+        ref = len(selected) + 1
+        cost = count_tokens(format_context_block(ref, block["source"]), tokenizer_name)
+        if used + cost > max_tokens:
+            if selected:
+                continue
+            # first block alone is over budget: keep as much of it as fits
+            overhead = cost - count_tokens(block["source"]["chunk_text"], tokenizer_name)
+            text = truncate_to_tokens(block["source"]["chunk_text"], max_tokens - overhead, tokenizer_name)
+            if not text:
+                break
+            block["source"] = {**block["source"], "chunk_text": text}
+            cost = count_tokens(format_context_block(ref, block["source"]), tokenizer_name)
+        selected.append(block)
+        used += cost
+
+    citations = []
+    ref_by_es_id = {}
+    for ref, block in enumerate(selected, start=1):
+        for item in block["members"]:
+            ref_by_es_id[item["es_id"]] = ref
+            citations.append(_citation(ref, item))
+    for item in merged:
+        kept_id = duplicates.get(item["es_id"])
+        if kept_id in ref_by_es_id:
+            citations.append(_citation(ref_by_es_id[kept_id], item))
+    citations.sort(key=lambda c: c["ref"])
+
+    return {
+        "blocks": [{"es_id": b["es_id"], "source": b["source"]} for b in selected],
+        "citations": citations,
+        "tokens": used,
+        "chunks_in": len(merged),
+        "chunks_dropped": len(merged) - len(citations),
+    }
+
+
+def _citation(ref: int, item: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "ref": ref,
+        "es_id": item["es_id"],
+        "source": item["source"].get("source"),
+        "doc_id": item["source"].get("doc_id"),
+        "chunk_id": item["source"].get("chunk_id"),
+    }
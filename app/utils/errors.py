@@ -15,3 +15,9 @@ class UpstreamError(AppError):
 
 class NotFoundError(AppError):
     pass
+
+class RateLimitError(UpstreamError):
+    """Upstream asked us to slow down (HTTP 429). retry_after is in seconds when known."""
+    def __init__(self, code: str, message: str, http_status: int = 429, retry_after: float | None = None):
+        super().__init__(code, message, http_status)
+        self.retry_after = retry_after
@@ -1,5 +1,10 @@
 from typing import Dict, Any, List
 
+from app.utils.metrics import timed
+from app.utils.tracing import traced
+
+@traced("retrieve.merge", lambda merged: {"hits": len(merged)})
+@timed("merge")
 def merge_results(bm25: List[Dict[str, Any]], vec: List[Dict[str, Any]], w_bm25: float = 0.5, w_vec: float = 0.5, top_k: int = 8):
     # normalize scores by max to reduce scale differences
     def norm(items):
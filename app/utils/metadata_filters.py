@@ -0,0 +1,165 @@
+"""
+Document metadata as search filters.
+
+Values are checked against the MetadataRegistry field types when set on a document
+(PUT /v1/documents/<doc_id>/metadata) and again when used in a query's `filters`.
+
+At ingest the metadata is denormalised onto every chunk as one object per type
+(`meta_str.<key>`, `meta_num.<key>`, `meta_date.<key>`, `meta_bool.<key>`; the chunk mapping's
+dynamic templates type them), so a filter is a plain term / terms / range clause inside the kNN
+`filter` and the BM25 `bool.filter`: ES narrows the candidates before scoring instead of
+post-filtering top_k. The docs index keeps the same values in its nested `meta_kv` for the
+first stage of two-stage retrieval.
+
+Filter syntax, one entry per registered field (all entries must hold):
+    {"currency": "USD"}                        term
+    {"region": ["EU", "UK"]}                   any of (terms)
+    {"payment_days": {"gte": 30, "lt": 90}}    range, number and date fields only
+    {"effective_date": {"exists": true}}       field present (false: absent)
+"""
+from datetime import date, datetime
+from typing import Any, Dict, List
+
+from app.utils.errors import ValidationError
+from app.utils.metadata_registry import MetadataRegistry
+
+# registry type -> suffix of the chunk object (meta_<suffix>) and the docs index meta_kv value field (v_<suffix>)
+TYPE_SUFFIX = {"string": "str", "number": "num", "date": "date", "boolean": "bool"}
+RANGE_OPS = ("gt", "gte", "lt", "lte")
+
+# chunk index mapping: each meta_<suffix>.* field gets its type on first write, whatever the key
+META_DYNAMIC_TEMPLATES = [
+    {"meta_str": {"path_match": "meta_str.*", "mapping": {"type": "keyword"}}},
+    {"meta_num": {"path_match": "meta_num.*", "mapping": {"type": "double"}}},
+    {"meta_date": {"path_match": "meta_date.*", "mapping": {"type": "date"}}},
+    {"meta_bool": {"path_match": "meta_bool.*", "mapping": {"type": "boolean"}}},
+]
+
+
+def coerce(key: str, field_type: str, value: Any) -> Any:
+    """One value in the registry type's canonical form (dates as ISO 8601)."""
+    if field_type == "string" and isinstance(value, str):
+        return value
+    if field_type == "number" and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if field_type == "boolean" and isinstance(value, bool):
+        return value
+    if field_type == "date" and isinstance(value, str):
+        try:
+            parsed = date.fromisoformat(value) if len(value) == 10 else datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            pass
+        else:
+            return parsed.isoformat()
+    raise ValidationError("INVALID_METADATA_VALUE", f"Metadata field '{key}' is a {field_type}, got {value!r}", 400)
+
+
+def _field(fields: Dict[str, Any], key: str) -> Dict[str, Any]:
+    spec = fields.get(key)
+    if not spec:
+        raise ValidationError("UNKNOWN_METADATA_FIELD", f"Metadata field '{key}' is not registered", 400)
+    return spec
+
+
+def validate_metadata(registry, metadata: Any) -> Dict[str, Any]:
+    """A document's metadata with every value coerced to its registered type."""
+    if not isinstance(metadata, dict):
+        raise ValidationError("INVALID_METADATA", "'metadata' must be an object of field -> value", 400)
+    fields = {f["key"]: f for f in registry.list_fields()}
+    out = {}
+    for key, value in metadata.items():
+        field_type = _field(fields, key)["type"]
+        out[key] = [coerce(key, field_type, v) for v in value] if isinstance(value, list) else coerce(key, field_type, value)
+    return out
+
+
+def parse_filters(registry, filters: Any) -> List[Dict[str, Any]]:
+    """
+    Request `filters` -> [{key, type, op, value}] with op one of term / terms / range / exists.
+    Only fields registered as indexed can filter: the others are not on the chunks.
+    """
+    if not filters:
+        return []
+    if not isinstance(filters, dict):
+        raise ValidationError("INVALID_FILTERS", "'filters' must be an object of field -> condition", 400)
+    fields = {f["key"]: f for f in registry.list_fields()}
+    conditions = []
+    for key, cond in filters.items():
+        spec = _field(fields, key)
+        field_type = spec["type"]
+        if not spec.get("indexed", True):
+            raise ValidationError("METADATA_FIELD_NOT_INDEXED", f"Metadata field '{key}' is registered with indexed=false", 400)
+        if isinstance(cond, list):
+            if not cond:
+                raise ValidationError("INVALID_FILTERS", f"Filter on '{key}' lists no values", 400)
+            conditions.append({"key": key, "type": field_type, "op": "terms", "value": [coerce(key, field_type, v) for v in cond]})
+        elif isinstance(cond, dict) and set(cond) == {"exists"}:
+            conditions.append({"key": key, "type": field_type, "op": "exists", "value": bool(cond["exists"])})
+        elif isinstance(cond, dict):
+            if not cond or set(cond) - set(RANGE_OPS):
+                raise ValidationError("INVALID_FILTERS", f"Filter on '{key}' takes {', '.join(RANGE_OPS)} or exists, got {sorted(cond)}", 400)
+            if field_type not in ("number", "date"):
+                raise ValidationError("INVALID_FILTERS", f"Range filter on '{key}' needs a number or date field, it is a {field_type}", 400)
+            conditions.append({"key": key, "type": field_type, "op": "range",
+                               "value": {op: coerce(key, field_type, v) for op, v in cond.items()}})
+        else:
+            conditions.append({"key": key, "type": field_type, "op": "term", "value": coerce(key, field_type, cond)})
+    return conditions
+
+
+def request_filters(cfg, filters: Any) -> List[Dict[str, Any]]:
+    """parse_filters for a request body's `filters`; the registry file is only read when there are some."""
+    if not filters:
+        return []
+    return parse_filters(MetadataRegistry(cfg.metadata_registry_path), filters)
+
+
+def _clause(path: str, cond: Dict[str, Any]) -> Dict[str, Any]:
+    if cond["op"] == "exists":
+        exists = {"exists": {"field": path}}
+        return exists if cond["value"] else {"bool": {"must_not": [exists]}}
+    return {cond["op"]: {path: cond["value"]}}
+
+
+def chunk_clauses(conditions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Filter clauses on the chunks' denormalised meta_<type> fields."""
+    return [_clause(f"meta_{TYPE_SUFFIX[c['type']]}.{c['key']}", c) for c in conditions]
+
+
+def doc_clauses(conditions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The same conditions on the docs index's nested meta_kv entries."""
+    clauses = []
+    for c in conditions:
+        value_field = f"meta_kv.v_{TYPE_SUFFIX[c['type']]}"
+        inner = {"exists": {"field": value_field}} if c["op"] == "exists" else {c["op"]: {value_field: c["value"]}}
+        nested = {"nested": {"path": "meta_kv", "query": {"bool": {"filter": [{"term": {"meta_kv.k": c["key"]}}, inner]}}}}
+        clauses.append({"bool": {"must_not": [nested]}} if c["op"] == "exists" and not c["value"] else nested)
+    return clauses
+
+
+def chunk_meta(registry, metadata: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """{meta_<type>: {key: value}} for the chunk documents; keys no longer registered as indexed are left off."""
+    if not metadata:
+        return {}
+    fields = {f["key"]: f for f in registry.list_fields()}
+    out: Dict[str, Dict[str, Any]] = {}
+    for key, value in metadata.items():
+        spec = fields.get(key)
+        if spec and spec.get("indexed", True):
+            out.setdefault(f"meta_{TYPE_SUFFIX[spec['type']]}", {})[key] = value
+    return out
+
+
+def doc_meta_kv(registry, metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Nested meta_kv entries for the docs index: one per value, typed into v_<type>."""
+    if not metadata:
+        return []
+    fields = {f["key"]: f for f in registry.list_fields()}
+    entries = []
+    for key, value in metadata.items():
+        spec = fields.get(key)
+        if not spec:
+            continue
+        for v in (value if isinstance(value, list) else [value]):
+            entries.append({"k": key, f"v_{TYPE_SUFFIX[spec['type']]}": v})
+    return entries
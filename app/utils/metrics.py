@@ -0,0 +1,151 @@
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, REGISTRY
+from prometheus_client import multiprocess
+
+# Label values must stay bounded: endpoint is the matched route rule (never the raw path),
+# stage / provider / cache / operation come from fixed sets in code, and tenant is only
+# filled in when METRICS_TENANT_LABEL is on (otherwise it is always "").
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUEST_SECONDS = Histogram(
+    "rag_request_duration_seconds", "HTTP request latency", ["endpoint", "method", "status"], buckets=BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "rag_stage_duration_seconds", "Latency of one pipeline stage within a request", ["endpoint", "stage", "tenant"], buckets=BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "rag_llm_tokens_total", "LLM tokens (estimated) sent and received", ["provider", "kind", "tenant"],
+)
+CACHE_REQUESTS = Counter(
+    "rag_cache_requests_total", "Cache lookups by result", ["cache", "result"],
+)
+ES_ERRORS = Counter(
+    "rag_es_errors_total", "Elasticsearch call failures", ["operation"],
+)
+INGEST_CHUNKS = Counter(
+    "rag_ingest_chunks_total", "Chunks embedded and indexed (rate() gives chunks/s)", ["tenant"],
+)
+LOG_DROPPED = Counter(
+    "rag_log_dropped_total", "Log records dropped because the log queue was full", ["level"],
+)
+SINGLE_FLIGHT = Counter(
+    "rag_singleflight_total", "Coalesced calls: leader ran it, follower shared its result, timeout gave up waiting", ["flight", "role"],
+)
+
+_ENDPOINT: contextvars.ContextVar = contextvars.ContextVar("metrics_endpoint", default="")
+_TENANT: contextvars.ContextVar = contextvars.ContextVar("metrics_tenant", default="")
+_TENANT_LABEL = {"enabled": False}
+# per-request breakdown (stage times, ES calls, LLM calls, cache outcomes) read by the slow-request log;
+# a mutable dict, so threads started with a copied context (hedged LLM calls) add to the same record
+_STATS: contextvars.ContextVar = contextvars.ContextVar("request_stats", default=None)
+
+
+def configure(cfg) -> None:
+    _TENANT_LABEL["enabled"] = cfg.metrics_tenant_label
+
+
+def bind_request(endpoint: str, tenant: str = "") -> None:
+    """Called at request start so stage timings deeper in the call stack carry the endpoint label."""
+    _ENDPOINT.set(endpoint)
+    _TENANT.set(tenant if _TENANT_LABEL["enabled"] else "")
+    _STATS.set({"stages_ms": {}, "es": [], "llm": [], "cache": {}})
+
+
+def request_stats() -> dict:
+    return _STATS.get() or {}
+
+
+def _tenant() -> str:
+    return _TENANT.get()
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(_ENDPOINT.get(), name, _tenant()).observe(elapsed)
+        stats = _STATS.get()
+        if stats is not None:
+            stats["stages_ms"][name] = round(stats["stages_ms"].get(name, 0) + elapsed * 1000, 1)
+
+
+def timed(name: str):
+    """Decorator form of stage() for sync and async functions."""
+    def deco(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def observe_request(endpoint: str, method: str, status: int, seconds: float) -> None:
+    REQUEST_SECONDS.labels(endpoint, method, str(status)).observe(seconds)
+
+
+def llm_call(provider: str, prompt_tokens: int, completion_tokens: int, latency_ms: int, hedged: bool) -> None:
+    LLM_TOKENS.labels(provider, "prompt", _tenant()).inc(prompt_tokens)
+    LLM_TOKENS.labels(provider, "completion", _tenant()).inc(completion_tokens)
+    stats = _STATS.get()
+    if stats is not None:
+        stats["llm"].append({"provider": provider, "latency_ms": latency_ms, "hedged": hedged,
+                             "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens})
+
+
+def cache_event(cache: str, hit: bool) -> None:
+    result = "hit" if hit else "miss"
+    CACHE_REQUESTS.labels(cache, result).inc()
+    stats = _STATS.get()
+    if stats is not None:
+        key = f"{cache}_{result}"
+        stats["cache"][key] = stats["cache"].get(key, 0) + 1
+
+
+def es_call(operation: str, took_ms: int | None, hits: int) -> None:
+    """ES-side time (`took`) and hit count of one search, for the request breakdown."""
+    stats = _STATS.get()
+    if stats is not None:
+        stats["es"].append({"operation": operation, "took_ms": took_ms, "hits": hits})
+
+
+def es_error(operation: str) -> None:
+    ES_ERRORS.labels(operation).inc()
+
+
+def ingest_chunks(count: int) -> None:
+    INGEST_CHUNKS.labels(_tenant()).inc(count)
+
+
+def log_dropped(level: str) -> None:
+    LOG_DROPPED.labels(level).inc()
+
+
+def coalesce_event(flight: str, role: str) -> None:
+    SINGLE_FLIGHT.labels(flight, role).inc()
+
+
+def render() -> tuple:
+    """Exposition body + content type. Under gunicorn every worker writes to PROMETHEUS_MULTIPROC_DIR and the scrape aggregates them."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,206 @@
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+from app.Logger.log_main import get_logger
+from app.utils.admin_auth import is_admin
+from app.utils.errors import NotFoundError
+
+logger = get_logger()
+
+EXTENSIONS = {"sampling": ".folded", "cprofile": ".prof"}
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def profile_dir(cfg) -> str:
+    return f"{cfg.local_storage_dir}/profiles"
+
+
+def safe_id(request_id: str) -> str:
+    # X-Request-ID is client supplied: reduce it to a plain file name
+    return _UNSAFE.sub("_", request_id)[:128].lstrip(".") or "request"
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack every `interval_ms` from a helper thread and counts
+    identical stacks. Written in the collapsed ("folded") format that flamegraph.pl,
+    speedscope and inferno read: `outer;inner;leaf <samples>`.
+    """
+    def __init__(self, thread_id: int, interval_ms: float):
+        self.thread_id = thread_id
+        self.interval_s = interval_ms / 1000
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def events(self) -> int:
+        return sum(self.stacks.values())
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class CProfiler:
+    """Deterministic cProfile of the request thread; the .prof file opens in pstats, snakeviz or flameprof."""
+    def __init__(self):
+        self._prof = cProfile.Profile()
+
+    def start(self) -> None:
+        self._prof.enable()
+
+    def stop(self) -> None:
+        self._prof.disable()
+
+    def events(self) -> int:
+        return sum(entry.callcount for entry in self._prof.getstats())
+
+    def write(self, path: str) -> None:
+        self._prof.dump_stats(path)
+
+
+def _should_profile(cfg) -> bool:
+    if request.headers.get("X-Profile", "").lower() in ("1", "true") and is_admin(cfg):
+        return True
+    return cfg.profile_sample_rate > 0 and random.random() < cfg.profile_sample_rate
+
+
+def _prune(cfg) -> None:
+    metas = sorted(
+        (e for e in os.scandir(profile_dir(cfg)) if e.name.endswith(".json")),
+        key=lambda e: e.stat().st_mtime, reverse=True,
+    )
+    for entry in metas[cfg.profile_keep:]:
+        stem = entry.name[:-len(".json")]
+        for ext in (".json", *EXTENSIONS.values()):
+            try:
+                os.remove(f"{profile_dir(cfg)}/{stem}{ext}")
+            except FileNotFoundError:
+                pass
+
+
+def save_profile(cfg, profiler, status_code: int, duration_ms: int) -> str:
+    """Write the profile and a small JSON sidecar; returns the profile file name."""
+    stem = safe_id(g.request_id)
+    name = stem + EXTENSIONS[cfg.profile_mode]
+    profiler.write(f"{profile_dir(cfg)}/{name}")
+    meta = {
+        "profile": name,
+        "request_id": g.request_id,
+        "method": request.method,
+        "path": request.path,
+        "status_code": status_code,
+        "duration_ms": duration_ms,
+        "mode": cfg.profile_mode,
+        # stack samples (sampling) or function calls (cprofile)
+        "events": profiler.events(),
+        "pid": os.getpid(),
+        "created_at": time.time(),
+    }
+    with open(f"{profile_dir(cfg)}/{stem}.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    _prune(cfg)
+    return name
+
+
+def install_profiling(app, cfg) -> None:
+    """
+    Register the per-request profiling hooks. With PROFILE_MODE=off (default) nothing is
+    registered, so requests pay nothing. Otherwise a request is profiled when it sends
+    `X-Profile: 1` with a valid X-Admin-Token, or when it falls in PROFILE_SAMPLE_RATE.
+    """
+    if cfg.profile_mode == "off":
+        return
+    if cfg.profile_mode not in EXTENSIONS:
+        logger.warning("unknown_profile_mode", extra={"error_code": cfg.profile_mode})
+        return
+    os.makedirs(profile_dir(cfg), exist_ok=True)
+
+    @app.before_request
+    def start_profile():
+        if not _should_profile(cfg):
+            return
+        if cfg.profile_mode == "sampling":
+            profiler = StackSampler(threading.get_ident(), cfg.profile_interval_ms)
+        else:
+            profiler = CProfiler()
+        try:
+            profiler.start()
+        except ValueError:
+            # another profiler already owns the interpreter hook (e.g. a concurrent cProfile run)
+            logger.warning("profile_skipped", extra={"request_id": g.request_id})
+            return
+        g.profiler = profiler
+        g.profile_start = time.perf_counter()
+
+    @app.after_request
+    def stop_profile(resp):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return resp
+        profiler.stop()
+        duration_ms = int((time.perf_counter() - g.profile_start) * 1000)
+        try:
+            resp.headers["X-Profile-Id"] = save_profile(cfg, profiler, resp.status_code, duration_ms)
+        except OSError:
+            logger.exception("profile_write_failed", extra={"request_id": g.request_id})
+        return resp
+
+    @app.teardown_request
+    def discard_profile(exc):
+        # after_request is skipped when the request raised: just stop the profiler
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profiler.stop()
+
+
+def list_profiles(cfg, limit: int = 50) -> list:
+    out = []
+    try:
+        entries = [e for e in os.scandir(profile_dir(cfg)) if e.name.endswith(".json")]
+    except FileNotFoundError:
+        return out
+    for entry in sorted(entries, key=lambda e: e.stat().st_mtime, reverse=True)[:limit]:
+        try:
+            with open(entry.path, encoding="utf-8") as f:
+                out.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return out
+
+
+def profile_path(cfg, name: str) -> str:
+    if name != safe_id(name) or not name.endswith(tuple(EXTENSIONS.values())):
+        raise NotFoundError("PROFILE_NOT_FOUND", f"Profile '{name}' not found", 404)
+    path = f"{profile_dir(cfg)}/{name}"
+    if not os.path.isfile(path):
+        raise NotFoundError("PROFILE_NOT_FOUND", f"Profile '{name}' not found", 404)
+    return path
@@ -1,18 +1,15 @@
 from typing import Any, Dict, List
 
+def format_context_block(ref: int, src: Dict[str, Any]) -> str:
+    return f"[{ref}] source= {src.get('source')} doc_id= {src.get('doc_id')} chunk_id= {src.get('chunk_id')} chunk_text= {src['chunk_text']}"
+
 def build_grounded_prompt(user_query: str, contexts: List[Dict[str, Any]]) -> str:
     
     """
-    contexts item is from merged retrieval result:
+    contexts item is from merged retrieval result (or an assembled context block):
     { es_id, source: {source, doc_id, chunk_id, chunk_text, ...}, ... }
     """
-    citation_blocks= []
-    for i, item in enumerate(contexts, start=1):
-        src = item["source"]
-        citation_blocks.append(
-            f"[{i}] source= {src.get('source')} doc_id= {src.get('doc_id')} chunk_id= {src.get('chunk_id')} chunk_text= {src['chunk_text']}"
-        )
-
+    citation_blocks = [format_context_block(i, item["source"]) for i, item in enumerate(contexts, start=1)]
     context_text = "\n\n".join(citation_blocks)
 
     return (
@@ -38,14 +35,22 @@ def build_doc_summary_prompt(doc_text: str) -> str:
         "Summary:\n"
     )
 
+def build_combine_summaries_prompt(partials: List[str]) -> str:
+    combined = "\n\n".join(partials)
+    return (
+        "You are a careful assistant.\n"
+        "Task: Combine partial summaries into ONE final summary for the full document.\n"
+        "Rules:\n"
+        "- Do not invent facts.\n"
+        "- Output:\n"
+        "  1) Executive summary (4-6 lines)\n"
+        "  2) Key bullets (8-12 bullets)\n\n"
+        f"Partial summaries:\n{combined}\n\n"
+        "Final summary:\n"
+    )
+
 def build_query_guided_summary_prompt(user_query: str, context: List[Dict[str, Any]]) -> str:
-    citation_blocks = []
-    for i, item in enumerate(context, start=1):
-        src = item["source"]
-        citation_blocks.append(
-            f"[{i}] source= {src.get('source')} doc_id= {src.get('doc_id')}"
-            f"chunk_id= {src.get('chunk_id')} chunk_text= {src['chunk_text']}"
-        )
+    citation_blocks = [format_context_block(i, item["source"]) for i, item in enumerate(context, start=1)]
     context_text = "\n\n".join(citation_blocks)
 
     return (
@@ -0,0 +1,285 @@
+"""
+Request handling shared by the WSGI routes (app/routes) and their ASGI twins (app/async_routes):
+body validation, prompt assembly and response shaping. Only the I/O (embed, search, LLM, storage)
+differs between the two, so that is all each route module keeps.
+"""
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+from app.providers.SearchProvider.doc_index import retrieval_mode
+from app.utils.context_assembler import assemble_context
+from app.utils.errors import NotFoundError, ValidationError
+from app.utils.metadata_filters import request_filters
+from app.utils.prompt import build_doc_summary_prompt, build_grounded_prompt, build_query_guided_summary_prompt
+from app.utils.registry import Registry
+from app.utils.single_flight import flight_key
+
+
+@dataclass
+class RagRequest:
+    """A validated /v1/rag/* or /v1/retrieve body."""
+    tenant: str
+    query: str
+    top_k: int
+    doc_id: str = ""
+    mode: str = "chunks"
+    conditions: List[Dict[str, Any]] = field(default_factory=list)
+    filters: Any = None
+    profile: bool = False
+    explain: bool = False
+
+    @property
+    def key(self) -> tuple:
+        """Single-flight key; top_k only counts when there is a query to retrieve for."""
+        return flight_key(self.tenant, self.query, self.top_k if self.query else 0, self.doc_id,
+                          mode=self.mode, filters=self.filters)
+
+
+def top_k_of(payload: Dict[str, Any], default: int) -> int:
+    """`top_k` of a request body: a positive integer, `default` when absent."""
+    value = payload.get("top_k") or default
+    try:
+        top_k = int(value)
+    except (TypeError, ValueError):
+        top_k = 0
+    if isinstance(value, bool) or top_k < 1:
+        raise ValidationError("INVALID_TOP_K", f"'top_k' must be a positive integer, got {value!r}", 400)
+    return top_k
+
+
+def _require(value: str, code: str, message: str) -> str:
+    if not value:
+        raise ValidationError(code, message, 400)
+    return value
+
+
+def _tenant(tenant: str | None) -> str:
+    return _require((tenant or "").strip(), "MISSING_TENANT", "Request must include 'X-Tenant-Id' header")
+
+
+def _query(payload: Dict[str, Any]) -> str:
+    return _require((payload.get("query") or "").strip(), "MISSING_QUERY", "Request must include non-empty 'query'")
+
+
+def _doc_id(payload: Dict[str, Any]) -> str:
+    return _require((payload.get("doc_id") or "").strip(), "MISSING_DOC_ID", "Request must include non-empty 'doc_id'")
+
+
+def parse_query(cfg, payload: Dict[str, Any], tenant: str | None) -> RagRequest:
+    """POST /v1/rag/query"""
+    top_k = top_k_of(payload, 5)
+    tenant = _tenant(tenant)
+    query = _query(payload)
+    return RagRequest(tenant, query, top_k, mode=retrieval_mode(cfg, payload.get("mode")),
+                      conditions=request_filters(cfg, payload.get("filters")), filters=payload.get("filters"))
+
+
+def parse_query_doc(payload: Dict[str, Any], tenant: str | None) -> RagRequest:
+    """POST /v1/rag/query_doc"""
+    top_k = top_k_of(payload, 5)
+    tenant = _tenant(tenant)
+    return RagRequest(tenant, _query(payload), top_k, doc_id=_doc_id(payload))
+
+
+def parse_summary(payload: Dict[str, Any], tenant: str | None) -> RagRequest:
+    """POST /v1/rag/summary; `query` is optional and turns on the query-guided mode."""
+    top_k = top_k_of(payload, 5)
+    tenant = _tenant(tenant)
+    return RagRequest(tenant, (payload.get("query") or "").strip(), top_k, doc_id=_doc_id(payload))
+
+
+def parse_retrieve(cfg, payload: Dict[str, Any]) -> RagRequest:
+    """POST /v1/retrieve; the tenant comes from the body (default "demo")."""
+    top_k = top_k_of(payload, 8)
+    tenant = payload.get("tenant") or "demo"
+    mode = retrieval_mode(cfg, payload.get("mode"))
+    conditions = request_filters(cfg, payload.get("filters"))
+    return RagRequest(tenant, _query(payload), top_k, mode=mode, conditions=conditions, filters=payload.get("filters"),
+                      profile=bool(payload.get("profile")), explain=bool(payload.get("explain")))
+
+
+def document_record(cfg, req: RagRequest) -> Dict[str, Any]:
+    """Registry record of the request's document, 404 unless it belongs to the request's tenant."""
+    record = Registry(f"{cfg.local_storage_dir}/registry.json").get(req.doc_id)
+    if not record or record.get("tenant") != req.tenant:
+        raise NotFoundError("DOCUMENT_NOT_FOUND", f"Document with id '{req.doc_id}' not found for this tenant", 404)
+    return record
+
+
+# ---- prompts -------------------------------------------------------------------------------------
+
+def answer_prompt(cfg, req: RagRequest, merged: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], str]:
+    """(context, prompt): overlap-aware, token-budgeted context and the grounded prompt over it."""
+    context = assemble_context(merged, cfg.prompt_context_max_tokens, cfg.prompt_tokenizer)
+    return context, build_grounded_prompt(req.query, context["blocks"])
+
+
+def guided_summary_prompt(cfg, req: RagRequest, merged: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], str]:
+    context = assemble_context(merged, cfg.prompt_context_max_tokens, cfg.prompt_tokenizer)
+    return context, build_query_guided_summary_prompt(req.query, context["blocks"])
+
+
+def summary_text(doc, req: RagRequest) -> str:
+    if not doc.text.strip():
+        raise ValidationError("EMPTY_TEXT", f"No extractable text found in document '{req.doc_id}'", 404)
+    return doc.text
+
+
+def summary_batch_prompts(cfg, doc, req: RagRequest) -> List[str] | None:
+    """
+    Map step of a whole-document summary: one prompt per SUMMARY_BATCH_SIZE chunks, or None when
+    the text fits SUMMARY_MAX_CHARS and is summarised in one prompt.
+    """
+    if len(doc.text) <= cfg.summary_max_chars:
+        return None
+    chunks = doc.chunks
+    if not chunks:
+        raise ValidationError("EMPTY_CHUNKS", f"Failed to chunk document '{req.doc_id}' for summarization", 400)
+    size = cfg.summary_batch_size
+    return [build_doc_summary_prompt("\n\n".join(chunks[i:i + size])) for i in range(0, len(chunks), size)]
+
+
+def check_partials(partials: List[str], req: RagRequest) -> List[str]:
+    if not partials:
+        raise ValidationError("EMPTY_PARTIALS", f"Failed to generate partial summaries for document '{req.doc_id}'", 400)
+    return partials
+
+
+# ---- responses -----------------------------------------------------------------------------------
+
+def extract_used_refs(answer: str) -> set[int]:
+    #finds [1][2] in the answer text
+    refs = set()
+    for match in re.findall(r'\[(\d+)\]', answer or ""):
+        try:
+            refs.add(int(match))
+        except ValueError:
+            pass
+    return refs
+
+
+def ms_since(t: float) -> int:
+    return int((time.time() - t) * 1000)
+
+
+def answer_body(req: RagRequest, context: Dict[str, Any], llm_resp: Dict[str, Any],
+                t_embed: int, t_retrieve: int, t0: float) -> Dict[str, Any]:
+    all_citations = context["citations"]
+    used_refs = extract_used_refs(llm_resp["text"])
+    # /query reports its retrieval mode, /query_doc its document
+    body: Dict[str, Any] = {"status": "success", "query": req.query}
+    if req.doc_id:
+        body["doc_id"] = req.doc_id
+    body["tenant"] = req.tenant
+    if not req.doc_id:
+        body["mode"] = req.mode
+    body.update({
+        "answer": llm_resp["text"],
+        "llm_provider": llm_resp["provider"],
+        "citations_used": [cite for cite in all_citations if cite["ref"] in used_refs],
+        "retrieved_context": all_citations,
+        "timings_ms": {
+            "embed": t_embed,
+            "retrieve": t_retrieve,
+            "llm": llm_resp["latency_ms"],
+            "total": ms_since(t0),
+        },
+    })
+    return body
+
+
+def no_context_body(req: RagRequest, t_embed: int, t_retrieve: int, t0: float) -> Dict[str, Any]:
+    """Nothing in the document matched: answered without an LLM call."""
+    return {
+        "status": "success",
+        "query": req.query,
+        "doc_id": req.doc_id,
+        "tenant": req.tenant,
+        "answer": "I don't Know",
+        "citations_used": [],
+        "retrieved_context": [],
+        "timings_ms": {
+            "embed": t_embed,
+            "retrieve": t_retrieve,
+            "llm": 0,
+            "total": ms_since(t0),
+        },
+    }
+
+
+def full_summary_body(req: RagRequest, llm_resp: Dict[str, Any], t0: float, mode: str) -> Dict[str, Any]:
+    return {
+        "status": "success",
+        "tenant": req.tenant,
+        "doc_id": req.doc_id,
+        "mode": mode,
+        "summary": llm_resp["text"],
+        "llm_provider": llm_resp["provider"],
+        "timing_ms": {
+            "llm": llm_resp["latency_ms"],
+            "total": ms_since(t0),
+        }
+    }
+
+
+def guided_summary_body(req: RagRequest, context: Dict[str, Any], llm_resp: Dict[str, Any],
+                        t_embed: int, t_retrieve: int, t0: float) -> Dict[str, Any]:
+    used_refs = extract_used_refs(llm_resp["text"])
+    return {
+        "status": "success",
+        "doc_id": req.doc_id,
+        "tenant": req.tenant,
+        "mode": "query-guided",
+        "query": req.query,
+        "summary": llm_resp["text"],
+        "llm_provider": llm_resp["provider"],
+        "citations_used": sorted(ref for ref in used_refs if ref <= len(context["blocks"])),
+        "retrieved_context": context["citations"],
+        "timings_ms": {
+            "embed": t_embed,
+            "retrieve": t_retrieve,
+            "llm": llm_resp["latency_ms"],
+            "total": ms_since(t0),
+        },
+    }
+
+
+def retrieve_body(req: RagRequest, doc_ids: List[str] | None, merged: List[Dict[str, Any]],
+                  t_embed: int, t_retrieve: int, t_merge: int, t0: float,
+                  diagnostics: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    resp = {
+        "status": "success",
+        "query": req.query,
+        "top_k": req.top_k,
+        "tenant": req.tenant,
+        "mode": req.mode,
+        "candidate_docs": doc_ids,
+        "results": merged,
+        "timings_ms": {
+            "embed": t_embed,
+            "retrieve": t_retrieve,
+            "merge": t_merge,
+            "total": ms_since(t0),
+        },
+    }
+    if req.profile or req.explain:
+        resp["es_diagnostics"] = diagnostics
+    return resp
+
+
+def shared_response(result: Any, query: str, started: float) -> Any:
+    """
+    A single-flight follower's copy of the leader's response (body or (body, status)): its own
+    `query` text, since the flight key only holds the normalised one, and its own wall time. The
+    leader's breakdown stays available under `leader`.
+    """
+    body, status = (result[0], result[1:]) if isinstance(result, tuple) else (result, None)
+    body = dict(body)
+    if "query" in body:
+        body["query"] = query
+    for name in ("timings_ms", "timing_ms"):
+        if name in body:
+            body[name] = {"total": ms_since(started), "leader": body[name]}
+    return body if status is None else (body, *status)
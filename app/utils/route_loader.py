@@ -21,3 +21,20 @@ def load_routes( rest_api: Api, package: str = "app.routes") -> None:
         namespace = getattr(module, "api", None) or getattr(module, "ns", None)
         if isinstance(namespace, Namespace):
             rest_api.add_namespace(namespace)
+
+
+def load_async_routes(package: str = "app.async_routes") -> list:
+    """
+    Same contract as load_routes for the ASGI serving mode: every module under `package`
+    may export `routes`, a list of Starlette routes.
+    """
+    pkg = importlib.import_module(package)
+    routes = []
+
+    for modinfo in pkgutil.iter_modules(pkg.__path__, pkg.__name__ + "."):
+        if modinfo.ispkg:
+            continue
+
+        module = importlib.import_module(modinfo.name)
+        routes.extend(getattr(module, "routes", None) or [])
+    return routes
@@ -0,0 +1,164 @@
+"""
+Single-flight coalescing: concurrent calls with the same key share one computation.
+
+The first caller for a key (the leader) runs it. Callers that arrive while it is in flight
+(followers) wait for its result, or get the same exception. A follower gets `share(result)` when a
+`share` callable is given: the routes use it to put back the caller's own query text and timings,
+since the key only holds the normalised query. Nothing is cached: once the leader finishes, the
+next caller for the key starts a new computation.
+
+Followers wait at most `wait_s`, then get a 504 COALESCED_WAIT_TIMEOUT. The leader keeps running,
+and callers that arrive later still join it.
+
+Used for:
+- RAG and retrieval requests, keyed by flight_key(tenant, normalised query, top_k, doc_id, settings),
+  so a burst of identical questions costs one embed, one search and one LLM call;
+- per-document summaries;
+- embedding model loads (ModelManager).
+SINGLE_FLIGHT=false turns coalescing off for the routes; model loads are always coalesced.
+"""
+import asyncio
+import json
+import threading
+from concurrent.futures import Future, wait
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from app.utils.errors import UpstreamError
+from app.utils.metrics import coalesce_event
+from app.utils.tracing import annotate
+
+
+def normalise_query(query: str) -> str:
+    """Case and whitespace differences do not make a different question."""
+    return " ".join((query or "").split()).casefold()
+
+
+def flight_key(tenant: str, query: str, top_k: int, doc_id: str = "", **settings) -> tuple:
+    """
+    Key of one request. `settings` holds whatever else changes the answer (mode, filters, ...).
+    It is serialised with sorted keys, so a filters object matches regardless of key order.
+    """
+    return (tenant, normalise_query(query), int(top_k), doc_id or "",
+            json.dumps(settings, sort_keys=True, default=str))
+
+
+def _timeout(name: str, wait_s: float) -> UpstreamError:
+    return UpstreamError("COALESCED_WAIT_TIMEOUT",
+                         f"Identical in-flight '{name}' request did not finish within {wait_s:g}s", 504)
+
+
+class SingleFlight:
+    """Thread-based: the leader runs `fn` on its own thread and followers block on a Future."""
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+        self._leaders = 0
+        self._followers = 0
+        self._timeouts = 0
+        self._failures = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], wait_s: float | None = None,
+           share: Callable[[Any], Any] | None = None) -> Any:
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._calls[key] = fut
+                self._leaders += 1
+            else:
+                self._followers += 1
+
+        role = "leader" if leader else "follower"
+        coalesce_event(self.name, role)
+        annotate(**{f"singleflight.{self.name}": role})
+
+        if not leader:
+            # wait() rather than result(timeout=): the leader's own exception may be a TimeoutError
+            done, _ = wait([fut], timeout=wait_s)
+            if not done:
+                with self._lock:
+                    self._timeouts += 1
+                coalesce_event(self.name, "timeout")
+                raise _timeout(self.name, wait_s)
+            return share(fut.result()) if share else fut.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._calls.pop(key, None)
+                self._failures += 1
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            self._calls.pop(key, None)
+        fut.set_result(result)
+        return result
+
+    def in_flight(self) -> list:
+        with self._lock:
+            return list(self._calls)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "leaders": self._leaders,
+                "followers": self._followers,
+                "timeouts": self._timeouts,
+                "failures": self._failures,
+                "in_flight": len(self._calls),
+            }
+
+
+class AsyncSingleFlight:
+    """
+    Event-loop version for the ASGI routes. The computation is its own task, started with the
+    leader's context. If the leader's request is cancelled (client gone), the task keeps running
+    for the followers.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], wait_s: float | None = None,
+                 share: Callable[[Any], Any] | None = None) -> Any:
+        task = self._calls.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+
+        role = "leader" if leader else "follower"
+        coalesce_event(self.name, role)
+        annotate(**{f"singleflight.{self.name}": role})
+
+        done, _ = await asyncio.wait({task}, timeout=None if leader else wait_s)
+        if not done:
+            coalesce_event(self.name, "timeout")
+            raise _timeout(self.name, wait_s)
+        return share(task.result()) if share and not leader else task.result()
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # mark the exception retrieved: if every waiter has gone, asyncio would otherwise log it
+        if not task.cancelled():
+            task.exception()
+
+
+def coalesce(cfg, flight: SingleFlight, key: Hashable, fn: Callable[[], Any],
+             share: Callable[[Any], Any] | None = None) -> Any:
+    if not cfg.single_flight:
+        return fn()
+    return flight.do(key, fn, cfg.single_flight_wait_s, share)
+
+
+async def acoalesce(cfg, flight: AsyncSingleFlight, key: Hashable, fn: Callable[[], Awaitable[Any]],
+                    share: Callable[[Any], Any] | None = None) -> Any:
+    if not cfg.single_flight:
+        return await fn()
+    return await flight.do(key, fn, cfg.single_flight_wait_s, share)
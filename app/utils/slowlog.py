@@ -0,0 +1,116 @@
+import glob
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from functools import lru_cache
+
+from app.configs import parse_kv
+from app.Logger.log_main import get_logger
+from app.utils.metrics import request_stats
+
+logger = get_logger()
+
+_WRITER = {"pid": None, "logger": None}
+_LOCK = threading.Lock()
+
+
+def slowlog_dir(cfg) -> str:
+    return f"{cfg.local_storage_dir}/slow_requests"
+
+
+@lru_cache(maxsize=8)
+def _route_thresholds(spec: str) -> dict:
+    return {route: int(ms) for route, ms in parse_kv(spec).items()}
+
+
+def threshold_ms(cfg, endpoint: str) -> int:
+    """Per-route override from SLOW_REQUEST_ROUTE_MS (keyed by route rule), else SLOW_REQUEST_MS. 0 disables."""
+    return _route_thresholds(cfg.slow_request_route_ms).get(endpoint, cfg.slow_request_ms)
+
+
+def _redacted(cfg, tenant: str) -> bool:
+    tenants = {t.strip() for t in cfg.slowlog_redact_tenants.split(",") if t.strip()}
+    return "*" in tenants or tenant in tenants
+
+
+def _writer(cfg) -> logging.Logger:
+    # one file per worker process: RotatingFileHandler is not safe across processes
+    pid = os.getpid()
+    with _LOCK:
+        if _WRITER["pid"] != pid:
+            os.makedirs(slowlog_dir(cfg), exist_ok=True)
+            writer = logging.getLogger(f"rag_slow_requests.{pid}")
+            writer.setLevel(logging.INFO)
+            writer.handlers.clear()
+            handler = logging.handlers.RotatingFileHandler(
+                f"{slowlog_dir(cfg)}/slow_requests-{pid}.jsonl",
+                maxBytes=cfg.slowlog_max_bytes, backupCount=cfg.slowlog_backups, encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            writer.addHandler(handler)
+            writer.propagate = False
+            _WRITER.update(pid=pid, logger=writer)
+        return _WRITER["logger"]
+
+
+def record_if_slow(cfg, *, request_id: str, trace_id: str | None, endpoint: str, method: str, path: str,
+                   status_code: int, duration_ms: int, tenant: str, payload) -> bool:
+    """Append one JSON line with the request's stage breakdown when it exceeded its threshold."""
+    limit = threshold_ms(cfg, endpoint)
+    if limit <= 0 or duration_ms < limit:
+        return False
+
+    entry = {
+        "ts": time.time(),
+        "request_id": request_id,
+        "trace_id": trace_id,
+        "endpoint": endpoint,
+        "method": method,
+        "path": path,
+        "status_code": status_code,
+        "duration_ms": duration_ms,
+        "threshold_ms": limit,
+        "tenant": tenant,
+        "pid": os.getpid(),
+        **request_stats(),
+    }
+    query = payload.get("query") if isinstance(payload, dict) else None
+    if isinstance(query, str):
+        if _redacted(cfg, tenant):
+            # the hash still groups repeats of the same slow query
+            entry["query_sha256"] = hashlib.sha256(query.encode("utf-8")).hexdigest()[:16]
+            entry["query_chars"] = len(query)
+        else:
+            entry["query"] = query
+    try:
+        _writer(cfg).info(json.dumps(entry, ensure_ascii=False, default=str))
+    except OSError:
+        logger.exception("slowlog_write_failed", extra={"request_id": request_id})
+        return False
+    return True
+
+
+def top_slow(cfg, n: int = 20, window_s: float = 3600, endpoint: str | None = None) -> list:
+    """Slowest requests of the last `window_s` seconds across every worker's file (rotated ones included)."""
+    since = time.time() - window_s
+    entries = []
+    for path in glob.glob(f"{slowlog_dir(cfg)}/slow_requests-*.jsonl*"):
+        if os.path.getmtime(path) < since:
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("ts", 0) >= since and (endpoint is None or entry.get("endpoint") == endpoint):
+                        entries.append(entry)
+        except OSError:
+            continue
+    entries.sort(key=lambda e: e.get("duration_ms", 0), reverse=True)
+    return entries[:n]
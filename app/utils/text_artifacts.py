@@ -0,0 +1,124 @@
+import gzip
+import hashlib
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from app.Logger.log_main import get_logger
+from app.providers.Chunking.chunker import chunk_spans
+from app.utils.metrics import cache_event
+from app.utils.text_extract import extract_text
+from app.utils.tracing import traced
+
+logger = get_logger()
+
+# Extracted-text artifact: the text pulled out of a raw upload plus its chunk spans, stored
+# gzip'd next to the raw object so summaries and re-ingests skip the download + parse.
+# ARTIFACT_STORE=local keeps them under ARTIFACT_DIR, `storage` writes a sidecar key beside the
+# raw object (shared by every worker / host), `off` always parses the raw file.
+ARTIFACT_VERSION = 1
+STORES = ("local", "storage", "off")
+
+
+@dataclass
+class DocumentText:
+    text: str
+    spans: List[Tuple[int, int]]
+    content_sha256: str
+    from_artifact: bool
+
+    @property
+    def chunks(self) -> List[str]:
+        return [self.text[start:end] for start, end in self.spans]
+
+
+def content_sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def sidecar_key(record: dict) -> str:
+    return f"{record['s3_key']}.text.json.gz"
+
+
+def _local_path(cfg, record: dict) -> Path:
+    # doc ids are server-generated uuids, so they are safe as file names
+    return Path(cfg.artifact_dir) / f"{record['doc_id']}.json.gz"
+
+
+def _encode(filename: str, sha: str, text: str, spans, chunk_size: int, overlap: int) -> bytes:
+    body = {
+        "v": ARTIFACT_VERSION,
+        "filename": filename,
+        "content_sha256": sha,
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "spans": spans,
+        "text": text,
+    }
+    return gzip.compress(json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), compresslevel=6)
+
+
+@traced("artifact.read", lambda art: {"hit": art is not None})
+def read_artifact(cfg, record: dict, storage=None) -> Optional[dict]:
+    """The stored artifact for this record, or None when missing, unreadable or stale."""
+    try:
+        if cfg.artifact_store == "storage":
+            if not storage.exists(sidecar_key(record)):
+                return None
+            blob = storage.read(sidecar_key(record))
+        else:
+            blob = _local_path(cfg, record).read_bytes()
+        art = json.loads(gzip.decompress(blob))
+    except Exception as e:
+        # a missing file is the normal miss; anything else is logged and treated as one
+        if not isinstance(e, FileNotFoundError):
+            logger.warning("text_artifact_unreadable", extra={"error_code": type(e).__name__})
+        return None
+
+    if art.get("v") != ARTIFACT_VERSION:
+        return None
+    # records written since uploads store the raw hash; older ones rely on the immutable s3_key
+    if record.get("sha256") and art.get("content_sha256") != record["sha256"]:
+        return None
+    return art
+
+
+def write_artifact(cfg, record: dict, doc: DocumentText, chunk_size: int, overlap: int, storage=None) -> None:
+    blob = _encode(record["filename"], doc.content_sha256, doc.text, doc.spans, chunk_size, overlap)
+    try:
+        if cfg.artifact_store == "storage":
+            storage.save(sidecar_key(record), blob)
+        else:
+            path = _local_path(cfg, record)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_bytes(blob)
+            tmp.replace(path)
+    except Exception as e:
+        # the artifact is an optimisation: failing to persist it must not fail the request
+        logger.warning("text_artifact_write_failed", extra={"error_code": type(e).__name__})
+
+
+def load_document_text(cfg, record: dict, storage, chunk_size: int = 900, overlap: int = 100) -> DocumentText:
+    """
+    Text and chunk spans of a registered document.
+
+    Served from the text artifact when one exists for the same raw content; otherwise the raw
+    object is read from storage, extracted and chunked, and the artifact is written for next time.
+    """
+    if cfg.artifact_store != "off":
+        art = read_artifact(cfg, record, storage)
+        cache_event("text_artifact", art is not None)
+        if art is not None:
+            spans = [tuple(s) for s in art["spans"]]
+            if (art["chunk_size"], art["overlap"]) != (chunk_size, overlap):
+                spans = chunk_spans(art["text"], chunk_size, overlap)
+            return DocumentText(art["text"], spans, art["content_sha256"], True)
+
+    content = storage.read(record["s3_key"])
+    text = extract_text(record["filename"], content)
+    doc = DocumentText(text, chunk_spans(text, chunk_size, overlap), content_sha256(content), False)
+    if cfg.artifact_store != "off" and text.strip():
+        write_artifact(cfg, record, doc, chunk_size, overlap, storage)
+    return doc
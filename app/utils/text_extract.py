@@ -1,9 +1,12 @@
 # convert file content into text
 
 from io import BytesIO
-from pypdf import PdfReader
-from docx import Document
 
+from app.utils.metrics import timed
+from app.utils.tracing import traced
+
+@traced("extract_text", lambda text: {"chars": len(text)})
+@timed("extract")
 def extract_text(filename: str, content: bytes) -> str:
     """
     Extract plain text from a document based on its file type.
@@ -26,7 +29,9 @@ def extract_text(filename: str, content: bytes) -> str:
     if name.endswith(".txt"):
         return content.decode("utf-8", errors="ignore")
     
+    # parsers are imported on first use to keep worker start-up light
     if name.endswith(".pdf"):
+        from pypdf import PdfReader
         reader = PdfReader(BytesIO(content))
         pages = []
         for p in reader.pages:
@@ -34,6 +39,7 @@ def extract_text(filename: str, content: bytes) -> str:
         return "\n".join(pages)
     
     if name.endswith(".docx"):
+        from docx import Document
         doc = Document(BytesIO(content))
         return "\n".join([p.text for p in doc.paragraphs])
     
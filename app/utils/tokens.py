@@ -0,0 +1,63 @@
+import threading
+from typing import List
+
+from app.Logger.log_main import get_logger
+
+logger = get_logger()
+
+_TOKENIZERS: dict = {}
+_LOCK = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text; used when no tokenizer is available
+    return len(text or "") // 4 + 1
+
+
+def get_tokenizer(name: str):
+    """
+    Load (once per process) a Hugging Face `tokenizers` tokenizer by hub name.
+    Returns None when it cannot be loaded, callers then fall back to estimate_tokens.
+    """
+    if not name:
+        return None
+    with _LOCK:
+        if name not in _TOKENIZERS:
+            try:
+                from tokenizers import Tokenizer
+                tok = Tokenizer.from_pretrained(name)
+                tok.no_truncation()
+                tok.no_padding()
+                _TOKENIZERS[name] = tok
+            except Exception as e:
+                logger.warning("tokenizer_unavailable", extra={"error_code": type(e).__name__})
+                _TOKENIZERS[name] = None
+        return _TOKENIZERS[name]
+
+
+def count_tokens(text: str, tokenizer_name: str = "") -> int:
+    tok = get_tokenizer(tokenizer_name)
+    if tok is None:
+        return estimate_tokens(text)
+    return len(tok.encode(text or "", add_special_tokens=False).ids)
+
+
+def count_tokens_batch(texts: List[str], tokenizer_name: str = "") -> List[int]:
+    tok = get_tokenizer(tokenizer_name)
+    if tok is None:
+        return [estimate_tokens(t) for t in texts]
+    return [len(e.ids) for e in tok.encode_batch(list(texts), add_special_tokens=False)]
+
+
+def truncate_to_tokens(text: str, max_tokens: int, tokenizer_name: str = "") -> str:
+    """Cut text to at most max_tokens, on a token boundary when a tokenizer is available."""
+    if max_tokens <= 0:
+        return ""
+    tok = get_tokenizer(tokenizer_name)
+    if tok is None:
+        return text[: max_tokens * 4]
+    enc = tok.encode(text or "", add_special_tokens=False)
+    if len(enc.ids) <= max_tokens:
+        return text
+    end = enc.offsets[max_tokens - 1][1]
+    return text[:end]
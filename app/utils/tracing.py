@@ -0,0 +1,122 @@
+import asyncio
+import functools
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Sequence
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+from app.Logger.log_main import get_logger
+
+logger = get_logger()
+
+# until configure_tracing installs a provider this is the API's no-op tracer
+tracer = trace.get_tracer("rag_orchestration_api")
+
+_CONFIGURED = {"done": False}
+
+
+class JsonlSpanExporter(SpanExporter):
+    """Local collector stand-in: one JSON span per line, the same fields an OTLP collector receives."""
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence) -> SpanExportResult:
+        lines = []
+        for s in spans:
+            ctx = s.get_span_context()
+            lines.append(json.dumps({
+                "trace_id": format(ctx.trace_id, "032x"),
+                "span_id": format(ctx.span_id, "016x"),
+                "parent_id": format(s.parent.span_id, "016x") if s.parent else None,
+                "name": s.name,
+                "start_ns": s.start_time,
+                "duration_ms": round((s.end_time - s.start_time) / 1e6, 3),
+                "status": s.status.status_code.name,
+                "attributes": dict(s.attributes or {}),
+                "pid": os.getpid(),
+            }, default=str))
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError:
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+def configure_tracing(cfg) -> None:
+    """
+    Install the SDK tracer provider once per process. TRACE_EXPORTER=none (default) keeps the
+    no-op tracer, so instrumented code costs a function call and nothing is recorded.
+    """
+    if _CONFIGURED["done"] or cfg.trace_exporter == "none":
+        return
+
+    if cfg.trace_exporter == "file":
+        exporter = JsonlSpanExporter(cfg.trace_file or f"{cfg.local_storage_dir}/traces/spans.jsonl")
+    elif cfg.trace_exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter(endpoint=cfg.otlp_endpoint)
+    elif cfg.trace_exporter == "console":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        exporter = ConsoleSpanExporter()
+    else:
+        logger.warning("unknown_trace_exporter", extra={"error_code": cfg.trace_exporter})
+        return
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": "rag-orchestration-api", "deployment.environment": cfg.env}),
+        # child spans follow the root's decision, so a trace is either complete or absent
+        sampler=ParentBased(TraceIdRatioBased(cfg.trace_sample_rate)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _CONFIGURED["done"] = True
+
+
+def annotate(**attrs: Any) -> None:
+    """Set attributes on the current span (no-op when not sampled)."""
+    span = trace.get_current_span()
+    if span.is_recording():
+        for key, value in attrs.items():
+            if value is not None:
+                span.set_attribute(key, value)
+
+
+def traced(name: str, result_attrs: Callable[[Any], Dict[str, Any]] | None = None):
+    """Wrap a sync or async function in a child span; `result_attrs(result)` adds attributes from the return value."""
+    def deco(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                with tracer.start_as_current_span(name) as span:
+                    result = await fn(*args, **kwargs)
+                    if result_attrs is not None and span.is_recording():
+                        annotate(**result_attrs(result))
+                    return result
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name) as span:
+                result = fn(*args, **kwargs)
+                if result_attrs is not None and span.is_recording():
+                    annotate(**result_attrs(result))
+                return result
+        return wrapper
+    return deco
+
+
+def current_trace_id() -> str | None:
+    ctx = trace.get_current_span().get_span_context()
+    return format(ctx.trace_id, "032x") if ctx.is_valid and ctx.trace_flags.sampled else None
@@ -0,0 +1,173 @@
+import os
+import sys
+import threading
+import time
+
+from app.Logger.log_main import get_logger
+from app.utils.errors import UpstreamError
+
+logger = get_logger()
+
+_STATE = {
+    "ready": False,
+    "models": False,
+    "indices": False,
+    "started_at": None,
+    "finished_at": None,
+    "steps_ms": {},
+    "error": None,
+    "pid": None,
+}
+_LOCK = threading.Lock()
+
+
+def _step(name: str, fn) -> None:
+    start = time.perf_counter()
+    fn()
+    _STATE["steps_ms"][name] = int((time.perf_counter() - start) * 1000)
+
+
+def _ensure_indices(cfg) -> None:
+    from app.providers.SearchProvider.es_client import ESClient
+    from app.providers.SearchProvider.index_manager import IndexManager
+
+    es_client = ESClient(cfg.es_url)
+    index_manager = IndexManager.from_cfg(es_client.client, cfg)
+    index_manager.ensure_chunks_index()
+    index_manager.ensure_doc_index(cfg.index_docs)
+
+
+def _embed(cfg) -> None:
+    from app.providers.EmbeddingsProvider.embedding_provider import get_embedder
+    from app.utils.metrics import bind_request
+
+    bind_request("warmup")
+    # a dummy embed loads the model and pays the first-inference cost (allocations, kernels)
+    get_embedder(cfg).embed_text("warmup")
+
+
+def _tokenizer(cfg) -> None:
+    from app.utils.tokens import get_tokenizer
+    get_tokenizer(cfg.prompt_tokenizer)
+
+
+def _imports(cfg) -> None:
+    # import-only: clients are still created per request / per worker after fork
+    import boto3  # noqa: F401
+    import pypdf  # noqa: F401
+    import docx  # noqa: F401
+    if "groq" in cfg.llm_providers:
+        import groq  # noqa: F401
+
+
+def _set_ready() -> None:
+    with _LOCK:
+        _STATE["ready"] = bool(_STATE["models"] and _STATE["indices"])
+        if _STATE["ready"]:
+            _STATE["finished_at"] = time.time()
+            _STATE["error"] = None
+    if _STATE["ready"]:
+        logger.info("warmup_complete", extra={"latency_ms": int((_STATE["finished_at"] - _STATE["started_at"]) * 1000)})
+
+
+def warm_models(cfg) -> bool:
+    """Heavy imports, embedding model + one dummy embed, prompt tokenizer."""
+    try:
+        _step("imports", lambda: _imports(cfg))
+        _step("embed_model", lambda: _embed(cfg))
+        _step("tokenizer", lambda: _tokenizer(cfg))
+    except Exception as e:
+        _STATE["error"] = f"{type(e).__name__}: {e}"
+        logger.exception("warmup_failed")
+        return False
+    _STATE["models"] = True
+    _set_ready()
+    return True
+
+
+def warm_indices(cfg, retry_interval_s: float = 5.0) -> None:
+    """Ensure the ES indices exist, retrying until ES is reachable."""
+    while True:
+        try:
+            _step("es_indices", lambda: _ensure_indices(cfg))
+            break
+        except Exception as e:
+            _STATE["error"] = f"es_indices: {type(e).__name__}: {e}"
+            logger.warning("warmup_es_retry", extra={"error_code": type(e).__name__})
+            time.sleep(retry_interval_s)
+    _STATE["indices"] = True
+    _set_ready()
+
+
+def _begin() -> None:
+    with _LOCK:
+        _STATE.update(ready=False, models=False, indices=False, started_at=time.time(),
+                      finished_at=None, error=None, pid=os.getpid())
+        _STATE["steps_ms"] = {}
+
+
+def _start_index_thread(cfg) -> None:
+    threading.Thread(target=warm_indices, args=(cfg,), name="warmup-es", daemon=True).start()
+
+
+def start_warmup(cfg) -> None:
+    """
+    Warm up according to WARMUP_MODE. `sync` loads the models in the calling thread (gunicorn
+    preload: before fork), `background` loads them in a thread, `off` skips them.
+    ES indices are ensured in every mode, in their own thread: never blocked by (or skipped
+    after) a model warmup failure, and never blocking the caller. Until they exist, write
+    paths refuse with 503 (require_indices) so nothing is indexed into an auto-created index.
+    """
+    _begin()
+    _start_index_thread(cfg)
+    if cfg.warmup_mode == "off":
+        _STATE["models"] = True
+        _set_ready()
+        return
+    if cfg.warmup_mode == "sync":
+        warm_models(cfg)
+        return
+    threading.Thread(target=warm_models, args=(cfg,), name="warmup", daemon=True).start()
+
+
+def require_indices() -> None:
+    """Write paths (ingest, seed) call this first: 503 until the ES indices have been ensured."""
+    if not _STATE["indices"]:
+        raise UpstreamError("INDICES_NOT_READY", "Elasticsearch indices are not ready yet, try again shortly", 503)
+
+
+def after_fork(cfg) -> None:
+    """
+    gunicorn post_fork hook. Models loaded in the master are shared copy-on-write; each worker
+    only caps its own torch intra-op threads so N workers don't oversubscribe the CPUs.
+    ONNX Runtime sessions are not fork-safe, so an onnx backend is reloaded in the worker.
+    Threads do not survive fork: an unfinished index check is restarted here.
+    """
+    _STATE["pid"] = os.getpid()
+    if cfg.torch_num_threads:
+        if "torch" in sys.modules:
+            import torch
+            torch.set_num_threads(cfg.torch_num_threads)
+        else:
+            # not preloaded: torch reads this when the worker first imports it
+            os.environ["OMP_NUM_THREADS"] = str(cfg.torch_num_threads)
+
+    if cfg.embed_backend == "onnx" and _STATE["models"]:
+        from app.providers.EmbeddingsProvider.embedding_provider import reset_models
+        reset_models()
+        _STATE["models"] = False
+        warm_models(cfg)
+
+    if not _STATE["indices"]:
+        _start_index_thread(cfg)
+
+
+def readiness() -> dict:
+    with _LOCK:
+        state = dict(_STATE)
+        state["steps_ms"] = dict(_STATE["steps_ms"])
+    if state["started_at"] and state["finished_at"]:
+        state["warmup_ms"] = int((state["finished_at"] - state["started_at"]) * 1000)
+    state.pop("started_at")
+    state.pop("finished_at")
+    return state
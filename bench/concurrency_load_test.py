@@ -0,0 +1,77 @@
+"""
+Concurrency load test for the sync (gunicorn/WSGI) vs async (uvicorn/ASGI) serving modes.
+
+Fires `--requests` POSTs at `--concurrency` in flight against a running server and reports
+throughput and latency percentiles. Run it once per mode against the same backend, e.g.
+with the fake LLM so Groq limits don't skew the numbers:
+
+    LLM_PROVIDERS=fake:1500 gunicorn -w 1 -b 0.0.0.0:8000 wsgi:application
+    LLM_PROVIDERS=fake:1500 uvicorn asgi:application --host 0.0.0.0 --port 8001
+
+    python bench/concurrency_load_test.py --url http://localhost:8000 --concurrency 200
+    python bench/concurrency_load_test.py --url http://localhost:8001 --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+async def run(url: str, path: str, tenant: str, query: str, total: int, concurrency: int, timeout: float) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        async def one(i: int):
+            async with sem:
+                start = time.perf_counter()
+                try:
+                    resp = await client.post(path, json={"query": f"{query} #{i}", "top_k": 5}, headers={"X-Tenant-Id": tenant})
+                    status = resp.status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one(i) for i in range(total)])
+        elapsed = time.perf_counter() - start
+
+    return {
+        "url": url + path,
+        "requests": total,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 2),
+        "latency_ms": {f"p{q}": round(percentile(latencies, q), 1) for q in (50, 95, 99)},
+        "status_codes": {str(k): v for k, v in statuses.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/v1/rag/query")
+    parser.add_argument("--tenant", default="demo")
+    parser.add_argument("--query", default="What is the termination notice period?")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.url, args.path, args.tenant, args.query, args.requests, args.concurrency, args.timeout))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
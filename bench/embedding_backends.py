@@ -0,0 +1,108 @@
+"""
+Compare embedding backends (torch vs ONNX Runtime fp32 vs ONNX Runtime dynamic int8) on CPU.
+
+Reports model load time, single-query latency percentiles, batched throughput and cosine
+agreement between backends on the same texts:
+
+    python bench/embedding_backends.py --model sentence-transformers/all-MiniLM-L6-v2
+    python bench/embedding_backends.py --backends onnx,onnx-int8 --texts corpus.txt
+
+`--texts` takes a file with one text per line; without it a synthetic corpus is used.
+Agreement is measured against the first backend listed (torch by default).
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.providers.EmbeddingsProvider.embedding_provider import _load_model  # noqa: E402
+
+
+WORDS = ("contract termination notice period payment invoice liability clause tenant "
+         "renewal agreement party breach warranty confidential schedule amendment").split()
+
+
+def synthetic_texts(n: int, seed: int = 7) -> list:
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(WORDS, size=int(rng.integers(8, 120)))) for _ in range(n)]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def bench_backend(label: str, model_name: str, texts: list, queries: int, batch_size: int, threads: int, export_dir: str) -> tuple:
+    backend, _, variant = label.partition("-")
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    model = _load_model(model_name, backend, variant == "int8", threads, export_dir)
+    load_s = time.perf_counter() - start
+
+    model.encode(texts[:2], normalize_embeddings=True)  # warm-up
+
+    latencies = []
+    for text in texts[:queries]:
+        t = time.perf_counter()
+        model.encode([text], normalize_embeddings=True)
+        latencies.append((time.perf_counter() - t) * 1000)
+
+    t = time.perf_counter()
+    vecs = np.asarray(model.encode(texts, normalize_embeddings=True, batch_size=batch_size), dtype=np.float32)
+    batch_s = time.perf_counter() - t
+
+    return {
+        "backend": label,
+        "embedding_dim": model.get_sentence_embedding_dimension(),
+        "load_s": round(load_s, 2),
+        "max_rss_growth_mb": round(rss_mb() - rss_before, 1),
+        "query_latency_ms": {f"p{q}": round(percentile(latencies, q), 2) for q in (50, 95, 99)},
+        "batch_throughput_texts_s": round(len(texts) / batch_s, 1),
+    }, vecs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=os.getenv("EMBED_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2"))
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--texts", default="")
+    parser.add_argument("--n", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--export-dir", default="./local_storage/onnx")
+    args = parser.parse_args()
+
+    if args.texts:
+        with open(args.texts, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()][:args.n]
+    else:
+        texts = synthetic_texts(args.n)
+
+    results, vectors = [], {}
+    for label in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        result, vecs = bench_backend(label, args.model, texts, args.queries, args.batch_size, args.threads, args.export_dir)
+        results.append(result)
+        vectors[label] = vecs
+
+    ref_label = results[0]["backend"]
+    for result in results:
+        # vectors are L2-normalised, so the row-wise dot product is the cosine
+        cos = (vectors[result["backend"]] * vectors[ref_label]).sum(axis=1)
+        result[f"cosine_vs_{ref_label}"] = {"mean": round(float(cos.mean()), 5), "min": round(float(cos.min()), 5)}
+
+    print(json.dumps({"model": args.model, "texts": len(texts), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
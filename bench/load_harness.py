@@ -0,0 +1,386 @@
+"""
+Offline end-to-end load test: boots the app in-process against local stand-ins and replays a
+JSONL request corpus at a fixed concurrency. No Elasticsearch, S3 or LLM account is needed.
+
+Stand-ins (all selected through normal config):
+- ES_URL=memory://bench       in-memory ES (BM25 + cosine over the indexed chunks)
+- STORAGE_BACKEND=fs          raw documents under a temp directory instead of S3
+- LLM_PROVIDERS=fake          sleeps per --llm-latency-ms / --llm-jitter-ms / --llm-dist
+The embedding model is the real one (EMBED_BACKEND etc. apply), so embedding cost is measured.
+
+Before the run, --docs synthetic documents per tenant are uploaded and ingested through the API.
+Corpus lines:
+
+    {"name": "rag_query", "method": "POST", "path": "/v1/rag/query", "json": {"query": "..."}, "weight": 4}
+    {"name": "summary", "path": "/v1/rag/summary", "json": {"doc_id": "{doc_id}"}}
+    {"name": "upload", "path": "/v1/documents", "upload": {"words": 300}}
+
+`{doc_id}` is replaced by a random ingested document of the request's tenant; `weight` sets the mix.
+Per-stage timings come from the slow-request log (threshold 1 ms), joined on X-Request-ID.
+
+    python bench/load_harness.py --concurrency 16 --requests 500 --out results.json
+    python bench/load_harness.py --mode asgi --concurrency 64 --requests 2000 --out asgi.json
+    python bench/load_harness.py --requests 500 --out new.json --compare results.json
+    python bench/load_harness.py --env EMBED_BACKEND=onnx --out onnx.json --compare results.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TOPICS = {
+    "termination": "Either party may terminate this agreement with {n} days written notice to the other party.",
+    "payment": "Invoices are payable within {n} days of receipt and late payments accrue interest monthly.",
+    "confidentiality": "The receiving party shall keep all confidential information secret for {n} years after disclosure.",
+    "liability": "Total liability under this agreement is limited to fees paid in the previous {n} months.",
+    "renewal": "The term renews automatically for successive periods of {n} months unless cancelled in writing.",
+    "governing_law": "This agreement is governed by the laws of the state and disputes go to arbitration within {n} days.",
+    "warranty": "The supplier warrants the services for {n} days and will remedy any defect at no charge.",
+    "data_protection": "Personal data is processed only on documented instructions and deleted within {n} days of termination.",
+}
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def summarize(values) -> dict:
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+        "max": round(max(values), 2) if values else 0.0,
+    }
+
+
+def synthetic_document(rng: random.Random, words: int) -> str:
+    sentences, count = [], 0
+    while count < words:
+        topic = rng.choice(list(TOPICS))
+        sentence = TOPICS[topic].format(n=rng.choice([7, 14, 30, 45, 60, 90]))
+        sentences.append(sentence)
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+
+def configure_env(args, workdir: str) -> None:
+    # set before the app is imported; load_dotenv() never overrides variables that already exist
+    os.environ.update({
+        "ES_URL": "memory://bench",
+        "STORAGE_BACKEND": "fs",
+        "LOCAL_STORAGE_DIR": workdir,
+        "STORAGE_FS_DIR": f"{workdir}/objects",
+        "METADATA_REGISTRY_PATH": f"{workdir}/metadata_registry.json",
+        "LLM_PROVIDERS": "fake",
+        "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "FAKE_LLM_JITTER_MS": str(args.llm_jitter_ms),
+        "FAKE_LLM_LATENCY_DIST": args.llm_dist,
+        "FAKE_LLM_ERROR_RATE": str(args.llm_error_rate),
+        "LLM_RPM_LIMITS": "",
+        "LLM_TPM_LIMITS": "",
+        "TENANT_DAILY_UPLOAD_FILES": "1000000",
+        "TENANT_DAILY_UPLOAD_BYTES": str(1 << 40),
+        "SLOW_REQUEST_MS": "1",
+        "SLOW_REQUEST_ROUTE_MS": "",
+        "SLOWLOG_REDACT_TENANTS": "",
+        "WARMUP_MODE": "sync",
+        "TRACE_EXPORTER": "none",
+        "PROFILE_MODE": "off",
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        os.environ[key] = value
+
+
+def load_corpus(path: str) -> list:
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip() and not line.lstrip().startswith("#"):
+                entries.append(json.loads(line))
+    if not entries:
+        raise SystemExit(f"empty corpus: {path}")
+    return entries
+
+
+def schedule(corpus: list, total: int, seed: int) -> list:
+    mix = [entry for entry in corpus for _ in range(int(entry.get("weight", 1)))]
+    rng = random.Random(seed)
+    rng.shuffle(mix)
+    return [mix[i % len(mix)] for i in range(total)]
+
+
+def _fill(value, doc_id: str):
+    if isinstance(value, str):
+        return value.replace("{doc_id}", doc_id)
+    if isinstance(value, dict):
+        return {k: _fill(v, doc_id) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, doc_id) for v in value]
+    return value
+
+
+def build_request(i: int, entry: dict, tenants: list, docs: dict, rng: random.Random) -> dict:
+    tenant = entry.get("tenant") or tenants[i % len(tenants)]
+    doc_id = rng.choice(docs[tenant]) if docs.get(tenant) else ""
+    payload = _fill(entry.get("json"), doc_id)
+    if isinstance(payload, dict) and "tenant" not in payload and entry.get("path", "").startswith("/v1/retrieve"):
+        # retrieve endpoints take the tenant from the body
+        payload["tenant"] = tenant
+    req = {
+        "name": entry.get("name") or entry["path"],
+        "method": entry.get("method", "POST"),
+        "url": _fill(entry["path"], doc_id),
+        "headers": {"X-Tenant-Id": tenant, "X-Request-ID": f"bench-{i}"},
+        "json": payload,
+    }
+    if "upload" in entry:
+        text = synthetic_document(rng, int(entry["upload"].get("words", 300)))
+        req["files"] = {"file": (f"bench-{i}.txt", text.encode("utf-8"), "text/plain")}
+        req["json"] = None
+    return req
+
+
+def seed_documents(client: httpx.Client, tenants: list, docs_per_tenant: int, words: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    docs = {}
+    for tenant in tenants:
+        ids = []
+        for start in range(0, docs_per_tenant, 10):
+            files = [
+                ("file", (f"seed-{tenant}-{n}.txt", synthetic_document(rng, words).encode("utf-8"), "text/plain"))
+                for n in range(start, min(start + 10, docs_per_tenant))
+            ]
+            resp = client.post("/v1/documents/", files=files, headers={"X-Tenant-Id": tenant})
+            resp.raise_for_status()
+            ids.extend(f["doc_id"] for f in resp.json()["uploaded_files"])
+        if ids:
+            resp = client.post("/v1/ingest/", headers={"X-Tenant-Id": tenant})
+            resp.raise_for_status()
+        docs[tenant] = ids
+    return docs
+
+
+def _record(req: dict, status, start: float) -> dict:
+    return {"name": req["name"], "request_id": req["headers"]["X-Request-ID"], "status": status,
+            "latency_ms": (time.perf_counter() - start) * 1000}
+
+
+def run_wsgi(app, requests: list, concurrency: int, timeout: float) -> tuple:
+    client = httpx.Client(transport=httpx.WSGITransport(app=app), base_url="http://bench", timeout=timeout)
+
+    def send(req):
+        start = time.perf_counter()
+        try:
+            resp = client.request(req["method"], req["url"], json=req["json"], files=req.get("files"), headers=req["headers"])
+            status = resp.status_code
+        except Exception as e:
+            status = type(e).__name__
+        return _record(req, status, start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        records = list(pool.map(send, requests))
+    return records, time.perf_counter() - start
+
+
+def run_asgi(app, requests: list, concurrency: int, timeout: float) -> tuple:
+    async def main():
+        sem = asyncio.Semaphore(concurrency)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=timeout) as client:
+            async def send(req):
+                async with sem:
+                    start = time.perf_counter()
+                    try:
+                        resp = await client.request(req["method"], req["url"], json=req["json"], files=req.get("files"), headers=req["headers"])
+                        status = resp.status_code
+                    except Exception as e:
+                        status = type(e).__name__
+                    return _record(req, status, start)
+
+            start = time.perf_counter()
+            records = await asyncio.gather(*[send(req) for req in requests])
+            return list(records), time.perf_counter() - start
+
+    return asyncio.run(main())
+
+
+def stage_breakdown(cfg, records: list) -> dict:
+    from app.utils.slowlog import top_slow
+
+    by_id = {e["request_id"]: e for e in top_slow(cfg, n=len(records) * 2 + 1000, window_s=86400)}
+    stages: dict = {}
+    for rec in records:
+        entry = by_id.get(rec["request_id"])
+        if entry is None:
+            continue
+        for stage, ms in entry.get("stages_ms", {}).items():
+            stages.setdefault(rec["name"], {}).setdefault(stage, []).append(ms)
+        for call in entry.get("es", []):
+            if call.get("took_ms") is not None:
+                stages.setdefault(rec["name"], {}).setdefault(f"es_took_{call['operation']}", []).append(call["took_ms"])
+    return {name: {stage: summarize(v) for stage, v in sorted(per.items())} for name, per in sorted(stages.items())}
+
+
+def report(args, records: list, elapsed: float, stages: dict) -> dict:
+    by_name: dict = {}
+    for rec in records:
+        by_name.setdefault(rec["name"], []).append(rec)
+
+    def block(recs):
+        statuses: dict = {}
+        for r in recs:
+            statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+        errors = sum(1 for r in recs if not (isinstance(r["status"], int) and r["status"] < 400))
+        return {
+            "requests": len(recs),
+            "errors": errors,
+            "throughput_rps": round(len(recs) / elapsed, 2) if elapsed else 0.0,
+            "statuses": statuses,
+            "latency_ms": summarize([r["latency_ms"] for r in recs]),
+        }
+
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = ""
+    return {
+        "meta": {
+            "git_rev": rev,
+            "mode": args.mode,
+            "concurrency": args.concurrency,
+            "requests": len(records),
+            "elapsed_s": round(elapsed, 3),
+            "corpus": os.path.relpath(args.corpus, ROOT),
+            "tenants": args.tenants,
+            "docs_per_tenant": args.docs,
+            "llm": {"latency_ms": args.llm_latency_ms, "jitter_ms": args.llm_jitter_ms, "dist": args.llm_dist},
+            "env": args.env,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "overall": block(records),
+        "endpoints": {name: block(recs) for name, recs in sorted(by_name.items())},
+        "stages_ms": stages,
+    }
+
+
+def compare(old: dict, new: dict) -> str:
+    def pct(a, b):
+        return f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+
+    lines = [f"{'':40} {'p50 old':>9} {'p50 new':>9} {'':>8} {'p95 old':>9} {'p95 new':>9} {'':>8}"]
+
+    def row(label, a, b):
+        lines.append(f"{label:40} {a['p50']:9.1f} {b['p50']:9.1f} {pct(a['p50'], b['p50']):>8} "
+                     f"{a['p95']:9.1f} {b['p95']:9.1f} {pct(a['p95'], b['p95']):>8}")
+
+    old_rps, new_rps = old["overall"]["throughput_rps"], new["overall"]["throughput_rps"]
+    lines.insert(0, f"throughput: {old_rps} -> {new_rps} req/s ({pct(old_rps, new_rps)})")
+    for name, cur in new["endpoints"].items():
+        if name in old["endpoints"]:
+            row(name, old["endpoints"][name]["latency_ms"], cur["latency_ms"])
+        for stage, cur_stage in new["stages_ms"].get(name, {}).items():
+            prev = old.get("stages_ms", {}).get(name, {}).get(stage)
+            if prev:
+                row(f"  {stage}", prev, cur_stage)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "bench", "load_corpus.jsonl"))
+    parser.add_argument("--mode", choices=("wsgi", "asgi"), default="wsgi")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent first and left out of the results")
+    parser.add_argument("--tenants", default="demo,acme")
+    parser.add_argument("--docs", type=int, default=20, help="documents seeded per tenant")
+    parser.add_argument("--doc-words", type=int, default=1200)
+    parser.add_argument("--llm-latency-ms", type=int, default=800)
+    parser.add_argument("--llm-jitter-ms", type=int, default=300)
+    parser.add_argument("--llm-dist", choices=("uniform", "normal", "lognormal"), default="lognormal")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra app config, repeatable")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="previous JSON report to diff against")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's request logs")
+    args = parser.parse_args()
+
+    tenants = [t.strip() for t in args.tenants.split(",") if t.strip()]
+    workdir = tempfile.mkdtemp(prefix="rag_bench_")
+    configure_env(args, workdir)
+
+    # the app logs every request to stdout; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        from app.configs import load_config
+        if args.mode == "asgi":
+            from AsyncWebAPI import create_asgi_app
+            app = create_asgi_app()
+        else:
+            from WebAPI import create_app
+            app = create_app()
+        if not args.verbose:
+            logging.getLogger("rag_orchestration_api").disabled = True
+        cfg = load_config()
+
+        if args.mode == "asgi":
+            # seed through a plain Flask app: same process, so the same memory://bench index and storage dir
+            from WebAPI import create_app
+            flask_app = create_app()
+        else:
+            flask_app = app
+        with httpx.Client(transport=httpx.WSGITransport(app=flask_app), base_url="http://bench", timeout=args.timeout) as client:
+            t = time.perf_counter()
+            docs = seed_documents(client, tenants, args.docs, args.doc_words, args.seed)
+            print(f"seeded {sum(map(len, docs.values()))} documents in {time.perf_counter() - t:.1f}s", file=sys.stderr)
+
+        rng = random.Random(args.seed)
+        corpus = load_corpus(args.corpus)
+        planned = schedule(corpus, args.warmup + args.requests, args.seed)
+        requests = [build_request(i, entry, tenants, docs, rng) for i, entry in enumerate(planned)]
+
+        runner = run_asgi if args.mode == "asgi" else run_wsgi
+        if args.warmup:
+            runner(app, requests[:args.warmup], 1, args.timeout)
+        records, elapsed = runner(app, requests[args.warmup:], args.concurrency, args.timeout)
+        result = report(args, records, elapsed, stage_breakdown(cfg, records))
+
+    body = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(body + "\n")
+    else:
+        print(body)
+
+    overall = result["overall"]
+    print(f"{overall['requests']} requests, {overall['errors']} errors, {overall['throughput_rps']} req/s, "
+          f"p50 {overall['latency_ms']['p50']:.0f} ms, p95 {overall['latency_ms']['p95']:.0f} ms", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare(json.load(f), result), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+Micro-benchmarks for the CPU hot paths of the request path, with a saved baseline to compare against.
+
+Cases (each at several sizes):
+- chunk_text                  document text of 10 KB / 100 KB / 1 MB
+- extract_text                .txt, generated .pdf (10 / 50 pages) and .docx (200 / 1000 paragraphs)
+- merge_results               100 / 1k / 10k candidates per retriever, half of them overlapping
+- build_grounded_prompt       5 / 20 / 50 context blocks
+- extract_used_refs           answers citing 3 / 50 refs and a long answer
+- to_es_doc                   ChunkIndexDTO -> dict, -> the bulk line as the ES client sends it, and
+                              the pre-float32 path (float list through the stdlib encoder)
+- log                         caller-side cost of one request_complete line: the queue handler
+                              (encode + write on the listener thread) vs a synchronous JSON
+                              StreamHandler, both writing to /dev/null
+- embed                       embed_text (single query, through the micro-batcher) vs embed_texts
+                              at batch sizes 1 / 8 / 32 / 128, reported per text
+
+Every case is timed timeit-style: the loop count is calibrated to ~--min-time seconds, the
+loop is repeated --repeat times and the median per-call time is reported (min alongside).
+
+    python bench/micro.py --save bench/micro_baseline.json            # record a baseline
+    python bench/micro.py --compare bench/micro_baseline.json          # exit 1 on a regression
+    python bench/micro.py --filter merge_results --compare bench/micro_baseline.json --threshold 5
+
+Baselines are machine-specific: record and compare on the same host (or CI runner class).
+bench/micro_baseline.json is the committed reference, recorded on the runner named in its `meta`
+(--runner); --compare warns when the current host does not match it.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = ("contract termination notice period payment invoice liability clause tenant renewal agreement "
+         "party breach warranty confidential schedule amendment governing law arbitration").split()
+
+
+def text_of(size: int, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    out, n = [], 0
+    while n < size:
+        word = rng.choice(WORDS)
+        out.append(word)
+        n += len(word) + 1
+    return " ".join(out)[:size]
+
+
+def make_pdf(pages: int, lines_per_page: int = 40) -> bytes:
+    """Minimal text PDF (Helvetica, one content stream per page) so no fixture binaries are needed."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for p in range(pages):
+        lines = text_of(lines_per_page * 80, seed=p)
+        rows = [lines[i:i + 80] for i in range(0, len(lines), 80)]
+        stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({r}) '" for r in rows) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_ref = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{i} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for off in offsets:
+        out.write(f"{off:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def make_docx(paragraphs: int) -> bytes:
+    from docx import Document
+
+    doc = Document()
+    for p in range(paragraphs):
+        doc.add_paragraph(text_of(400, seed=p))
+    out = BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def hits(n: int, offset: int = 0) -> list:
+    rng = random.Random(n + offset)
+    return [
+        {"es_id": f"t:d{i // 20}:c{i}", "score": rng.random() * 20,
+         "source": {"doc_id": f"d{i // 20}", "chunk_id": f"c{i}", "source": "f.pdf", "chunk_text": text_of(900, seed=i)}}
+        for i in range(offset, offset + n)
+    ]
+
+
+def cases(args) -> list:
+    """(name, fn, per_call_items): fn() is one call; timings are divided by per_call_items."""
+    from app.Models.index_dto import ChunkIndexDTO
+    from app.providers.Chunking.chunker import chunk_text
+    from app.utils.hybrid_merge import merge_results
+    from app.utils.prompt import build_grounded_prompt
+    from app.utils.rag_handlers import extract_used_refs
+    from app.utils.text_extract import extract_text
+
+    out = []
+    for label, size in (("10KB", 10_000), ("100KB", 100_000), ("1MB", 1_000_000)):
+        text = text_of(size)
+        out.append((f"chunk_text/{label}", lambda t=text: chunk_text(t), 1))
+
+    txt = text_of(1_000_000).encode()
+    out.append(("extract_text/txt_1MB", lambda: extract_text("doc.txt", txt), 1))
+    for pages in (10, 50):
+        pdf = make_pdf(pages)
+        out.append((f"extract_text/pdf_{pages}p", lambda b=pdf: extract_text("doc.pdf", b), 1))
+    for paragraphs in (200, 1000):
+        docx = make_docx(paragraphs)
+        out.append((f"extract_text/docx_{paragraphs}p", lambda b=docx: extract_text("doc.docx", b), 1))
+
+    for n in (100, 1_000, 10_000):
+        bm25, vec = hits(n), hits(n, offset=n // 2)
+        out.append((f"merge_results/{n}", lambda b=bm25, v=vec: merge_results(b, v, top_k=8), 1))
+
+    for n in (5, 20, 50):
+        contexts = hits(n)
+        out.append((f"build_grounded_prompt/{n}", lambda c=contexts: build_grounded_prompt("What is the notice period?", c), 1))
+
+    for label, answer in (
+        ("3_refs", "The notice period is 30 days [1]. Payment is due in 14 days [2][3]."),
+        ("50_refs", " ".join(f"Claim {i} holds [{i}]." for i in range(1, 51))),
+        ("long_answer", text_of(20_000) + " [1] [2]"),
+    ):
+        out.append((f"extract_used_refs/{label}", lambda a=answer: extract_used_refs(a), 1))
+
+    from elasticsearch.serializer import NdjsonSerializer
+    from app.providers.EmbeddingsProvider.embedding_provider import as_vector
+    from app.providers.SearchProvider.es_client import serializers
+
+    vec = as_vector([random.Random(i).uniform(-1, 1) for i in range(args.embedding_dim)])
+    dto = ChunkIndexDTO(tenant="demo", scope="corpus", doc_id="d", chunk_id="c1", source="f.pdf",
+                        created_at=ChunkIndexDTO.now_iso(), chunk_text=text_of(900), embedding=vec)
+    # the bulk body line the app sends, and the same chunk as it used to be sent: a list of
+    # Python floats through the client's stdlib encoder
+    ndjson = serializers().get("application/x-ndjson") or NdjsonSerializer()
+    legacy = {**dto.to_es_doc(), "embedding": vec.astype(float).tolist()}
+    out.append(("to_es_doc/dict", dto.to_es_doc, 1))
+    out.append(("to_es_doc/json", lambda: ndjson.dumps([dto.to_es_doc()]), 1))
+    out.append(("to_es_doc/json_float_list", lambda: NdjsonSerializer().dumps([{**legacy, "embedding": vec.astype(float).tolist()}]), 1))
+    print(f"bulk line bytes: {len(ndjson.dumps([dto.to_es_doc()]))} (float32 array), "
+          f"{len(NdjsonSerializer().dumps([legacy]))} (float list)", file=sys.stderr)
+
+    out.extend(log_cases())
+
+    if not args.skip_embed:
+        out.extend(embed_cases())
+    return out
+
+
+def log_cases() -> list:
+    import logging
+    import logging.handlers
+    import queue
+    from app.Logger.log_main import DroppingQueueHandler, JsonFormatter
+
+    devnull = open(os.devnull, "w")
+    sync_sink = logging.StreamHandler(devnull)
+    sync_sink.setFormatter(JsonFormatter())
+    sync = logging.getLogger("bench.log.sync")
+    sync.addHandler(sync_sink)
+
+    # unbounded here so the numbers are the enqueue path, not drops once the listener falls behind
+    q = queue.Queue()
+    sink = logging.StreamHandler(devnull)
+    sink.setFormatter(JsonFormatter())
+    logging.handlers.QueueListener(q, sink).start()
+    queued = logging.getLogger("bench.log.queued")
+    queued.addHandler(DroppingQueueHandler(q))
+
+    for logger in (sync, queued):
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    extra = {"request_id": "5f1c2f0e-0000-4000-8000-000000000000", "trace_id": "0" * 32, "method": "POST",
+             "path": "/v1/rag/query", "status_code": 200, "latency_ms": 412}
+    return [
+        ("log/request_complete_sync", lambda: sync.info("request_complete", extra=extra), 1),
+        ("log/request_complete_queued", lambda: queued.info("request_complete", extra=extra), 1),
+    ]
+
+
+def embed_cases() -> list:
+    from app.configs import load_config
+    from app.providers.EmbeddingsProvider.embedding_provider import get_embedder
+
+    embedder = get_embedder(load_config())
+    queries = [text_of(80, seed=i) for i in range(256)]
+    embedder.embed_texts(queries[:8])  # load + first-inference cost stays out of the numbers
+
+    counter = iter(range(1 << 62))
+    out = [("embed/embed_text", lambda: embedder.embed_text(queries[next(counter) % len(queries)]), 1)]
+    for size in (1, 8, 32, 128):
+        batch = [text_of(900, seed=i) for i in range(size)]
+        out.append((f"embed/embed_texts_b{size}", lambda b=batch, s=size: embedder.embed_texts(b, batch_size=s), size))
+    return out
+
+
+def measure(fn, items: int, repeat: int, min_time: float) -> dict:
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1 << 20:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        runs.append((time.perf_counter() - start) / loops / items * 1e6)
+    return {
+        "median_us": round(statistics.median(runs), 3),
+        "min_us": round(min(runs), 3),
+        "stdev_us": round(statistics.pstdev(runs), 3),
+        "loops": loops,
+        "repeat": repeat,
+        "per": "text" if items > 1 else "call",
+    }
+
+
+def cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def host_mismatch(baseline: dict, current: dict) -> list:
+    """meta fields that differ between the baseline's host and this one: the numbers are not comparable."""
+    base, cur = baseline.get("meta", {}), current["meta"]
+    return [f"{k}: baseline {base.get(k)!r}, here {cur.get(k)!r}" for k in ("cpu", "cpus", "python")
+            if base.get(k) is not None and base.get(k) != cur.get(k)]
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> tuple:
+    lines = [f"{'case':36} {'baseline us':>12} {'current us':>12} {'change':>9}"]
+    regressions = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            lines.append(f"{name:36} {'-':>12} {cur['median_us']:12.2f} {'new':>9}")
+            continue
+        change = (cur["median_us"] - base["median_us"]) / base["median_us"] * 100 if base["median_us"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  faster"
+        lines.append(f"{name:36} {base['median_us']:12.2f} {cur['median_us']:12.2f} {change:+8.1f}%{flag}")
+    return "\n".join(lines), regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="only cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timed loop")
+    parser.add_argument("--embedding-dim", type=int, default=int(os.getenv("ES_EMBEDDING_DIM", 384)))
+    parser.add_argument("--skip-embed", action="store_true", help="skip cases that need the embedding model")
+    parser.add_argument("--save", help="write results as a baseline file")
+    parser.add_argument("--compare", help="baseline file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent slowdown reported as a regression")
+    parser.add_argument("--runner", default=os.getenv("BENCH_RUNNER", platform.node()),
+                        help="name of the machine or runner class, recorded in the baseline (default BENCH_RUNNER or the hostname)")
+    args = parser.parse_args()
+
+    results = {}
+    for name, fn, items in cases(args):
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(fn, items, args.repeat, args.min_time)
+        print(f"{name:36} {results[name]['median_us']:12.2f} us/{results[name]['per']}", file=sys.stderr)
+
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = ""
+    current = {
+        "meta": {"git_rev": rev, "runner": args.runner, "python": platform.python_version(),
+                 "machine": platform.machine(), "cpu": cpu_model(), "cpus": os.cpu_count(), "created_at": time.time()},
+        "results": results,
+    }
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+            f.write("\n")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for diff in host_mismatch(baseline, current):
+            print(f"warning: not the baseline's host ({baseline.get('meta', {}).get('runner')}), {diff}", file=sys.stderr)
+        table, regressions = compare(baseline, current, args.threshold)
+        print(table)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold}%: {', '.join(regressions)}")
+            sys.exit(1)
+    elif not args.save:
+        print(json.dumps(current, indent=2))
+
+
+if __name__ == "__main__":
+    main()
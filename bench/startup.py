@@ -0,0 +1,130 @@
+"""
+Cold-start and memory benchmark for the gunicorn serving mode.
+
+Starts the server once per mode, then measures:
+- time until `/v1/health` answers (process up, routes imported)
+- time until `/v1/health/ready` answers 200 (model loaded, dummy embed done, ES indices checked)
+- latency of the first real query
+- RSS and PSS of the master and of every worker. PSS splits shared copy-on-write pages
+  between processes, so preload shows up as a much lower per-worker PSS.
+
+    python bench/startup.py --modes no-preload,preload --workers 4
+
+`no-preload` is the previous behaviour (each worker imports and loads everything itself).
+Linux only (reads /proc).
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "no-preload": {"GUNICORN_PRELOAD": "false", "WARMUP_MODE": "background"},
+    "preload": {"GUNICORN_PRELOAD": "true", "WARMUP_MODE": "sync"},
+    "no-warmup": {"GUNICORN_PRELOAD": "false", "WARMUP_MODE": "off"},
+}
+
+
+def mem_kb(pid: int) -> dict:
+    out = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    out[key.lower() + "_mb"] = round(int(rest.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return out
+
+
+def children(pid: int) -> list:
+    kids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # field 4 is the parent pid; the command name (field 2) may contain spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            kids.append(int(entry))
+    return sorted(kids)
+
+
+def wait_for(client: httpx.Client, path: str, deadline: float, ok=lambda r: r.status_code == 200) -> float | None:
+    while time.perf_counter() < deadline:
+        try:
+            if ok(client.get(path)):
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    return None
+
+
+def run_mode(mode: str, args) -> dict:
+    env = dict(os.environ, GUNICORN_WORKERS=str(args.workers), GUNICORN_BIND=f"127.0.0.1:{args.port}", **MODES[mode])
+    cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:application"]
+
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result = {"mode": mode, "workers": args.workers}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{args.port}", timeout=args.timeout) as client:
+            deadline = start + args.timeout
+            up = wait_for(client, "/v1/health", deadline)
+            ready = wait_for(client, "/v1/health/ready", deadline)
+            result["time_to_listen_s"] = round(up - start, 2) if up else None
+            result["time_to_ready_s"] = round(ready - start, 2) if ready else None
+            if not up:
+                result["error"] = "server did not start listening before --timeout"
+                return result
+
+            t = time.perf_counter()
+            resp = client.post(args.path, json={"query": args.query, "top_k": 5}, headers={"X-Tenant-Id": args.tenant})
+            result["first_query_ms"] = round((time.perf_counter() - t) * 1000, 1)
+            result["first_query_status"] = resp.status_code
+
+            # every worker has served (or at least warmed) by now
+            time.sleep(args.settle)
+            result["master"] = mem_kb(proc.pid)
+            result["worker_mem"] = [mem_kb(pid) for pid in children(proc.pid)]
+            pss = [w.get("pss_mb", 0) for w in result["worker_mem"]]
+            result["total_pss_mb"] = round(sum(pss) + result["master"].get("pss_mb", 0), 1)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="no-preload,preload")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--path", default="/v1/retrieve/")
+    parser.add_argument("--tenant", default="demo")
+    parser.add_argument("--query", default="What is the termination notice period?")
+    parser.add_argument("--timeout", type=float, default=180.0)
+    parser.add_argument("--settle", type=float, default=1.0)
+    args = parser.parse_args()
+
+    results = [run_mode(mode.strip(), args) for mode in args.modes.split(",") if mode.strip()]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Chunk index storage profiles (ES_CHUNK_STORAGE) side by side: index size, ingest rate, and kNN
+query latency and recall.
+
+For each profile a throwaway index `vecbench-<profile>` is built through IndexManager with the
+same synthetic corpus (clustered unit vectors + filler text, so no embedding model is needed),
+bulk-loaded, force-merged to one segment and measured:
+- size            primary store size after the merge (`_stats/store`)
+- ingest          docs/s for the bulk load including the final refresh
+- knn p50 / p95   latency of `knn` queries (k=--k, --num-candidates) filtered to one tenant
+- recall@k        overlap of the kNN hits with the exact script_score top-k on the same index
+
+    python bench/vector_storage.py --es-url http://localhost:9200 --docs 20000
+    python bench/vector_storage.py --profiles default,compact_bbq --out /tmp/vecbench.json
+
+Profiles whose vector type the cluster's release does not have yet (compact_bbq needs ES 8.16+)
+are skipped with a message when running the default set; asked for by name, they are an error.
+
+Against ES_URL=memory://... the numbers only exercise the code path: sizes are the in-memory
+stand-in's estimate and its kNN is exact (recall 1.0).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.micro import text_of  # noqa: E402
+
+TENANT = "bench"
+
+
+def corpus(n: int, dims: int, seed: int = 7):
+    """Unit vectors clustered around one centroid per ~100 docs: neighbours are meaningful, unlike uniform noise."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((max(8, n // 100), dims)).astype(np.float32)
+    vecs = centroids[rng.integers(0, len(centroids), n)] + 0.35 * rng.standard_normal((n, dims)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def build(client, manager, name: str, vecs: np.ndarray, batch: int) -> float:
+    from app.Models.index_dto import ChunkIndexDTO
+
+    if client.indices.exists(index=name):
+        client.indices.delete(index=name)
+    client.indices.create(index=name, body=manager.chunks_index_body())
+    started = time.perf_counter()
+    for lo in range(0, len(vecs), batch):
+        ops = []
+        for i in range(lo, min(lo + batch, len(vecs))):
+            dto = ChunkIndexDTO(TENANT, "corpus", f"d{i // 20}", f"c{i}", "bench", ChunkIndexDTO.now_iso(),
+                                text_of(900, seed=i), vecs[i])
+            ops.extend([{"index": {"_index": name, "_id": f"{TENANT}:d{i // 20}:c{i}"}}, dto.to_es_doc()])
+        res = client.bulk(operations=ops, refresh=False)
+        if res.get("errors"):
+            raise SystemExit(f"bulk into {name} failed: {next(i for i in res['items'] if i['index'].get('error'))}")
+    client.indices.refresh(index=name)
+    return len(vecs) / (time.perf_counter() - started)
+
+
+def measure(client, name: str, queries: np.ndarray, k: int, num_candidates: int) -> dict:
+    from app.providers.SearchProvider.similarity_index import vector_body
+
+    latencies, recalls = [], []
+    for vec in queries:
+        exact = client.search(index=name, body=vector_body(TENANT, vec, k))
+        started = time.perf_counter()
+        approx = client.search(index=name, body=vector_body(TENANT, vec, k, num_candidates=num_candidates))
+        latencies.append((time.perf_counter() - started) * 1000)
+        truth = {h["_id"] for h in exact["hits"]["hits"]}
+        recalls.append(len(truth & {h["_id"] for h in approx["hits"]["hits"]}) / max(1, len(truth)))
+    latencies.sort()
+    return {
+        "knn_p50_ms": round(statistics.median(latencies), 2),
+        "knn_p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2),
+        f"recall_at_{k}": round(statistics.mean(recalls), 4),
+    }
+
+
+def es_version(client) -> tuple:
+    number = client.info()["version"]["number"]
+    return tuple(int(part) for part in number.split("-")[0].split(".")[:2])
+
+
+def supported(profiles: list, version: tuple, explicit: bool) -> list:
+    """Profiles this cluster can build; a missing vector type exits when requested by name, else is skipped."""
+    from app.providers.SearchProvider.index_manager import STORAGE_PROFILES, VECTOR_TYPE_MIN_ES
+
+    out = []
+    for profile in profiles:
+        vector_type = STORAGE_PROFILES.get(profile, {}).get("vector_type")
+        needed = VECTOR_TYPE_MIN_ES.get(vector_type)
+        if needed and version < needed:
+            message = (f"{profile}: {vector_type} needs Elasticsearch {'.'.join(map(str, needed))}+, "
+                       f"cluster is {'.'.join(map(str, version))}")
+            if explicit:
+                raise SystemExit(message)
+            print(f"skipping {message}", file=sys.stderr)
+            continue
+        out.append(profile)
+    return out
+
+
+def main():
+    from app.providers.SearchProvider.es_client import ESClient
+    from app.providers.SearchProvider.index_manager import STORAGE_PROFILES, IndexManager
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--es-url", default=os.getenv("ES_URL", "memory://vecbench"))
+    parser.add_argument("--profiles", help=f"comma-separated (default: all the cluster supports, of {', '.join(STORAGE_PROFILES)})")
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--dims", type=int, default=int(os.getenv("ES_EMBEDDING_DIM", 384)))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num-candidates", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=500, help="docs per bulk request")
+    parser.add_argument("--keep", action="store_true", help="leave the vecbench-* indices in place")
+    parser.add_argument("--out", help="write the results as JSON")
+    args = parser.parse_args()
+
+    client = ESClient(args.es_url).client
+    vecs = corpus(args.docs, args.dims)
+    rng = np.random.default_rng(11)
+    # queries near, not on, indexed vectors
+    queries = vecs[rng.integers(0, args.docs, args.queries)] + 0.1 * rng.standard_normal((args.queries, args.dims)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    requested = [p.strip() for p in (args.profiles or ",".join(STORAGE_PROFILES)).split(",") if p.strip()]
+    results = {}
+    for profile in supported(requested, es_version(client), explicit=bool(args.profiles)):
+        name = f"vecbench-{profile}"
+        manager = IndexManager(client, name, args.dims, storage=profile)
+        rate = build(client, manager, name, vecs, args.batch)
+        client.indices.forcemerge(index=name, max_num_segments=1)
+        client.indices.refresh(index=name)
+        size = client.indices.stats(index=name)["_all"]["primaries"]["store"]["size_in_bytes"]
+        results[profile] = {
+            **manager.storage,
+            "size_mb": round(size / 2**20, 2),
+            "bytes_per_doc": round(size / args.docs),
+            "ingest_docs_per_s": round(rate),
+            **measure(client, name, queries, args.k, args.num_candidates),
+        }
+        print(f"{profile:14} {json.dumps(results[profile])}", file=sys.stderr)
+        if not args.keep:
+            client.indices.delete(index=name)
+
+    header = f"{'profile':14} {'vectors':10} {'_source':8} {'codec':17} {'size MB':>9} {'B/doc':>7} {'ingest/s':>9} {'p50 ms':>7} {'p95 ms':>7} {'recall':>7}"
+    print(header)
+    for profile, r in results.items():
+        print(f"{profile:14} {r['vector_type']:10} {'vector' if r['vector_in_source'] else 'text':8} {r['codec']:17} "
+              f"{r['size_mb']:9.2f} {r['bytes_per_doc']:7d} {r['ingest_docs_per_s']:9d} {r['knn_p50_ms']:7.2f} "
+              f"{r['knn_p95_ms']:7.2f} {r[f'recall_at_{args.k}']:7.3f}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"es_url": args.es_url.split("@")[-1], "docs": args.docs, "dims": args.dims,
+                       "k": args.k, "num_candidates": args.num_candidates, "results": results}, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
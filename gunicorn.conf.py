@@ -0,0 +1,39 @@
+# gunicorn -c gunicorn.conf.py wsgi:application
+#
+# Preload mode: the master imports the app and loads the embedding model once (WARMUP_MODE=sync),
+# then forks the workers, which share the model pages copy-on-write instead of each loading
+# their own copy. Each worker caps its torch threads (TORCH_NUM_THREADS) in post_fork.
+import os
+import shutil
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", 1))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 180))
+graceful_timeout = timeout
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# without an explicit limit every worker would start one torch thread per core
+os.environ.setdefault("TORCH_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // workers)))
+
+if preload_app:
+    # warm the model in the master before fork; ES index checks still run in the background
+    os.environ.setdefault("WARMUP_MODE", "sync")
+
+# prometheus_client multiprocess mode: must be set (and emptied, or a previous run's files would
+# be summed into the new counters) before the app - preloaded or not - imports prometheus_client
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/rag_prometheus")
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def post_fork(server, worker):
+    from app.configs import load_config
+    from app.utils.warmup import after_fork
+
+    after_fork(load_config())
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)